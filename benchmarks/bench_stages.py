@@ -0,0 +1,198 @@
+# Stage-level microbenchmarks of the build pipeline
+# Times PreParser.do_replacements, parser.parse_line, ContextManager.__call__ and ContextConverter.process_pile
+# separately on a synthetic corpus (see corpus.py) and writes the results as JSON for comparison between commits.
+# The memory retained by the tokens of each page and by its pile is measured as well, in a separate untimed run.
+# Usage (from the root of the repository, with bootstraparse installed):
+#   python -m benchmarks.bench_stages --pages 20 --lines 300 --output bench.json
+#   python -m benchmarks.compare base.json bench.json
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bootstraparse.modules import sitecreator, preparser, parser, context_mngr, export
+from benchmarks.corpus import CorpusSettings, generate_corpus
+
+STAGES = ["preparse", "parse", "contextualise", "export"]
+FORMAT_VERSION = 2
+
+
+def timed(function):
+    """
+    Calls a function with the garbage collector disabled and returns its duration and result.
+    :type function: callable
+    :rtype: (float, object)
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = function()
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+def run_page(page, env):
+    """
+    Runs all the stages once on a page, each one on the output of the previous one.
+    :param page: the page to build
+    :param env: the environment of the build
+    :type page: benchmarks.corpus.Page
+    :type env: bootstraparse.modules.environment.Environment
+    :return: the duration of each stage (None for the stages the page does not support) and the number of tokens
+    :rtype: (dict[str, float | None], int)
+    """
+    times = dict.fromkeys(STAGES)
+    pp = preparser.PreParser(page.path, env)
+    times["preparse"], io = timed(pp.do_replacements)
+    times["parse"], tokens = timed(lambda: parser.parse_line(io))
+    if page.contextualisable:
+        cm = context_mngr.ContextManager(tokens, name=pp.name)
+        times["contextualise"], pile = timed(cm)
+        converter = export.ContextConverter(pile, env.export_mngr, page.path)
+        times["export"], _ = timed(converter.process_pile)
+    return times, len(tokens)
+
+
+def retained(page, env):
+    """
+    Measures the memory held by the tokens of a page once parsed, and by its pile once contextualised.
+    :param page: the page to build
+    :param env: the environment of the build
+    :type page: benchmarks.corpus.Page
+    :type env: bootstraparse.modules.environment.Environment
+    :return: the bytes allocated by the parse stage and still alive, same for parse and contextualise
+    :rtype: dict[str, int]
+    """
+    pp = preparser.PreParser(page.path, env)
+    io = pp.do_replacements()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tokens = parser.parse_line(io)
+        gc.collect()
+        memory = {"tokens": tracemalloc.get_traced_memory()[0]}
+        if page.contextualisable:
+            cm = context_mngr.ContextManager(tokens, name=pp.name)
+            cm()  # The pile is kept in cm.pile
+            del tokens
+            gc.collect()
+            memory["pile"] = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return memory
+
+
+def summarize(values):
+    """
+    :type values: list[float]
+    :rtype: dict[str, float]
+    """
+    return {"min": min(values), "median": statistics.median(values), "mean": statistics.mean(values)}
+
+
+def git_commit():
+    """
+    Returns the current commit of the repository, if any.
+    :rtype: str | None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(_settings, repeat):
+    """
+    Generates the corpus and runs the benchmark.
+    :type _settings: CorpusSettings
+    :type repeat: int
+    :return: the results, ready to be dumped as JSON
+    :rtype: dict
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        origin = os.path.join(folder, "site")
+        pages = generate_corpus(origin, _settings)
+        env = sitecreator.create_environment(origin, os.path.join(folder, "output"))
+        run_page(pages[0], env)  # Warm up (compiles the aliases, fills the caches of the interpreter)
+
+        per_page = {}
+        totals = {stage: [0.0] * repeat for stage in STAGES}
+        memory_totals = {"tokens": 0, "pile": 0}
+        for page in pages:
+            samples = {stage: [] for stage in STAGES}
+            for r in range(repeat):
+                times, tokens = run_page(page, env)
+                for stage, duration in times.items():
+                    if duration is not None:
+                        samples[stage].append(duration)
+                        totals[stage][r] += duration
+            memory = retained(page, env)
+            for name, size in memory.items():
+                memory_totals[name] += size
+            per_page[os.path.basename(page.path)] = {
+                "tokens": tokens,
+                "retained": memory,
+                **{stage: summarize(values) for stage, values in samples.items() if values}
+            }
+
+    return {
+        "format": FORMAT_VERSION,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": _settings._asdict(),
+        "repeat": repeat,
+        "stages": {stage: summarize(values) for stage, values in totals.items()},
+        "retained": memory_totals,
+        "pages": per_page,
+    }
+
+
+def parse(_args):
+    arg_parser = argparse.ArgumentParser(
+        prog="bench_stages",
+        description="Times each stage of the build on a synthetic corpus and outputs the results as JSON."
+    )
+    defaults = CorpusSettings()
+    arg_parser.add_argument("--pages", type=int, default=defaults.pages, help="number of pages.")
+    arg_parser.add_argument("--lines", type=int, default=defaults.lines, help="minimum number of lines per page.")
+    arg_parser.add_argument("--nesting", type=int, default=defaults.nesting, help="depth of nested structural elements.")
+    arg_parser.add_argument("--import-depth", type=int, default=defaults.import_depth, help="length of the import chain.")
+    arg_parser.add_argument("--table-size", type=int, default=defaults.table_size,
+                            help="rows per table, pages with tables are only preparsed and parsed.")
+    arg_parser.add_argument("--list-size", type=int, default=defaults.list_size, help="items per list.")
+    arg_parser.add_argument("--seed", type=int, default=defaults.seed, help="seed of the corpus generator.")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="number of runs of each stage on each page.")
+    arg_parser.add_argument("--output", help="file where to write the JSON results (default: standard output).")
+    return arg_parser.parse_args(_args)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    args = parse(sys.argv[1:])
+    logging.disable(logging.INFO)  # The preparser logs every reuse of an import
+    results = run(CorpusSettings(
+        pages=args.pages, lines=args.lines, nesting=args.nesting, import_depth=args.import_depth,
+        table_size=args.table_size, list_size=args.list_size, seed=args.seed
+    ), args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    for stage, summary in results["stages"].items():
+        print(f"{stage:>14}: {summary['median'] * 1000:10.2f} ms (median of the totals)", file=sys.stderr)
+    for name, size in results["retained"].items():
+        print(f"{name:>14}: {size / 1024:10.1f} KiB retained (all pages)", file=sys.stderr)
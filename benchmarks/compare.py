@@ -0,0 +1,55 @@
+# Compares two results of bench_stages.py, stage by stage, and the memory retained by the tokens and piles
+# Exits with an error code if a stage got slower than the threshold allows.
+# Usage:
+#   python -m benchmarks.compare base.json new.json --threshold 1.1
+
+import argparse
+import json
+import sys
+
+
+def compare(base, new, threshold):
+    """
+    Compares the medians of the total time of each stage.
+    :param base: results of the reference run
+    :param new: results of the run to check
+    :param threshold: maximum accepted ratio new / base
+    :type base: dict
+    :type new: dict
+    :type threshold: float
+    :return: the lines of the report and the list of stages slower than the threshold
+    :rtype: (list[str], list[str])
+    """
+    if base["settings"] != new["settings"]:
+        print("Warning: the runs were made on different corpora.", file=sys.stderr)
+    report = [f"{'stage':>14} {'base (ms)':>12} {'new (ms)':>12} {'ratio':>8}"]
+    regressions = []
+    for stage, summary in new["stages"].items():
+        before, after = base["stages"][stage]["median"], summary["median"]
+        ratio = after / before if before else float("inf") if after else 1.0
+        report.append(f"{stage:>14} {before * 1000:12.2f} {after * 1000:12.2f} {ratio:8.2f}")
+        if ratio > threshold:
+            regressions.append(stage)
+    for name, after in new.get("retained", {}).items():
+        before = base.get("retained", {}).get(name)
+        if before:
+            report.append(f"{name + ' (KiB)':>14} {before / 1024:12.1f} {after / 1024:12.1f} {after / before:8.2f}")
+    return report, regressions
+
+
+def parse(_args):
+    arg_parser = argparse.ArgumentParser(prog="compare", description="Compares two benchmark results.")
+    arg_parser.add_argument("base", help="JSON results of the reference commit.")
+    arg_parser.add_argument("new", help="JSON results of the commit to check.")
+    arg_parser.add_argument("--threshold", type=float, default=1.1, help="maximum accepted ratio new / base.")
+    return arg_parser.parse_args(_args)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    args = parse(sys.argv[1:])
+    with open(args.base) as f_base, open(args.new) as f_new:
+        lines, slower = compare(json.load(f_base), json.load(f_new), args.threshold)
+    print("\n".join(lines))
+    if slower:
+        print(f"Regression on: {', '.join(slower)}")
+        sys.exit(1)
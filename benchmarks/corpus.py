@@ -0,0 +1,170 @@
+# Synthetic corpus generator for the benchmarks
+# Writes a website of .bpr pages (with partials to import and an aliases config) in a folder,
+# the size and shape of which are controlled by CorpusSettings.
+# Usage:
+#   from benchmarks.corpus import CorpusSettings, generate_corpus
+#   pages = generate_corpus("path/to/folder", CorpusSettings(pages=10, lines=200))
+#   pages -> [Page(path, contextualisable), ...]
+
+import os
+import random
+from collections import namedtuple
+
+"""
+Named tuple of all the parameters of a corpus:
+pages: number of pages; lines: minimum number of lines per page; nesting: depth of the nested structural elements;
+import_depth: length of the chain of partials imported by each page; table_size: number of rows per table (0: no tables);
+list_size: number of items per list; seed: seed of the random generator.
+"""
+CorpusSettings = namedtuple(
+    "CorpusSettings",
+    ["pages", "lines", "nesting", "import_depth", "table_size", "list_size", "seed"],
+    defaults=[10, 200, 3, 2, 0, 5, 0]
+)
+
+"""
+Named tuple describing a generated page.
+contextualisable is False for pages the ContextManager cannot process yet (tables).
+"""
+Page = namedtuple("Page", ["path", "contextualisable"])
+
+_ALIASES = """shortcuts:
+  constant: 'Constant alias'
+  nav_class: 'd-inline-flex align-items-center rounded'
+  formatted: 'Formatted alias {} and {}'
+  named: 'Named alias {name}'
+
+images:
+  logo: 'assets/logo.png'
+  gallery: 'img/gallery/{}.png'
+"""
+
+_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod"]
+
+
+def _sentence(rng, words=8):
+    """
+    Returns a line of plain text.
+    :type rng: random.Random
+    :type words: int
+    :rtype: str
+    """
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _paragraph(rng, _settings):
+    return [
+        f"{_sentence(rng)} *{_sentence(rng, 2)}* and **{_sentence(rng, 2)}** {_sentence(rng, 3)}",
+        f"{_sentence(rng, 4)} ~~{_sentence(rng, 1)}~~ __{_sentence(rng, 1)}__ [{_sentence(rng, 2)}](https://example.com/{rng.randint(0, 99)})",  # noqa: E501
+        _sentence(rng, 12),
+        "",
+    ]
+
+
+def _headers(rng, _settings):
+    return [f"## {_sentence(rng, 3)} ##{{{{fw-bold}}}}", f"! {_sentence(rng, 2)} !", ""]
+
+
+def _nested(rng, _settings):
+    depth = _settings.nesting
+    return (
+        [("  " * i) + ("<<div" if i % 2 == 0 else "<<section") for i in range(depth)] +
+        [("  " * depth) + _sentence(rng)] +
+        [("  " * i) + ("div>>" if i % 2 == 0 else "section>>") + f"{{{{level-{i}}}}}" for i in reversed(range(depth))] +
+        [""]
+    )
+
+
+def _lists(rng, _settings):
+    return (
+        [f"- {_sentence(rng, 4)} *{_sentence(rng, 1)}*" for _ in range(_settings.list_size)] + [""] +
+        [f"#. {_sentence(rng, 4)}" for _ in range(_settings.list_size)] + [""]
+    )
+
+
+def _aliases(rng, _settings):
+    return [
+        "@[constant]",
+        f"{_sentence(rng, 3)} @[formatted][{rng.randint(0, 9)}, {rng.randint(0, 9)}]",
+        f"@[named][name='{rng.choice(_WORDS)}']",
+        "@{logo}",
+        f"@{{gallery}}[{rng.randint(0, 99)}]{{{{img-fluid}}}}",
+        _sentence(rng),
+        "",
+    ]
+
+
+def _table(rng, _settings):
+    return (
+        ["| " + " | ".join(_sentence(rng, 1) for _ in range(3)) + " |", "|---|---|---|"] +
+        ["| " + " | ".join(_sentence(rng, 2) for _ in range(3)) + " |" for _ in range(_settings.table_size)] +
+        [""]
+    )
+
+
+_BLOCKS = [_paragraph, _headers, _nested, _lists, _aliases]
+
+
+def make_page(rng, _settings, imports=()):
+    """
+    Returns the text of a page of at least _settings.lines lines, and whether it contains a table.
+    :param rng: the random generator
+    :param _settings: the settings of the corpus
+    :param imports: the files imported at the top of the page
+    :type rng: random.Random
+    :type _settings: CorpusSettings
+    :type imports: list[str]
+    :rtype: (str, bool)
+    """
+    lines = [f"::<{i}>" for i in imports]
+    blocks = _BLOCKS + ([_table] if _settings.table_size else [])
+    has_table = False
+    while len(lines) < _settings.lines:
+        block = rng.choice(blocks)
+        has_table = has_table or block is _table
+        lines += block(rng, _settings)
+    return "\n".join(lines) + "\n", has_table
+
+
+def make_partial(index, _settings):
+    """
+    Returns the text of the nth partial of the import chain, a navigation block importing the next partial.
+    :type index: int
+    :type _settings: CorpusSettings
+    :rtype: str
+    """
+    lines = ["<<nav"] + [f"[Link {index}-{i}](https://example.com/{index}/{i})" for i in range(3)] + ["@[nav_class]", "nav>>"]
+    if index + 1 < _settings.import_depth:
+        lines.append(f"::<_partial_{index + 1}.bpr>")
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def generate_corpus(folder, _settings):
+    """
+    Writes a synthetic website in the given folder.
+    :param folder: folder where to write the corpus
+    :param _settings: the settings of the corpus
+    :type folder: str
+    :type _settings: CorpusSettings
+    :return: the list of generated pages
+    :rtype: list[Page]
+    """
+    rng = random.Random(_settings.seed)
+    _write(os.path.join(folder, "configs", "aliases.yaml"), _ALIASES)
+    for i in range(_settings.import_depth):
+        _write(os.path.join(folder, f"_partial_{i}.bpr"), make_partial(i, _settings))
+
+    pages = []
+    imports = ["_partial_0.bpr"] if _settings.import_depth else []
+    for i in range(_settings.pages):
+        path = os.path.join(folder, f"page_{i}.bpr")
+        text, has_table = make_page(rng, _settings, imports)
+        _write(path, text)
+        pages.append(Page(path, not has_table))
+    return pages
@@ -2,12 +2,22 @@
 
 # Main program, use this to start parsing
 
-from bootstraparse.modules import sitecreator, error_mngr
+from bootstraparse.modules import sitecreator, error_mngr, profiler, shards, importgraph
 import argparse
+import os
 import sys
 
 
+def shard_type(spec):
+    try:
+        return shards.parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def parse(_args):
+    if _args[:1] == ["deps"]:
+        return parse_deps(_args[1:])
     parser = argparse.ArgumentParser(
         prog="bootstraparse",
         description='Parses a folder for all .bpr files and magically recreates the same architecture '
@@ -16,11 +26,89 @@ def parse(_args):
     parser.add_argument('origin', help='the root folder of all files to parse.')
     parser.add_argument('destination', help="path of the folder where to output all the magic.")
     # parser.add_argument("-v", "verbosity")
+    parser.add_argument('--profile', action='store_true',
+                        help="measure the wall and cpu time of each stage on each page and print a summary.")
+    parser.add_argument('--memprofile', action='store_true',
+                        help="also measure the peak memory of each stage on each page, and the top allocation sites.")
+    parser.add_argument('--cprofile', metavar='FILE', default=None, help="write a cProfile dump of the whole run.")
+    parser.add_argument('--shard', metavar='I/N', type=shard_type, default=None,
+                        help="build only the I-th of N shards of the pages, weighted by size, and write its manifest.")
+    parser.add_argument('--merge-shards', action='store_true',
+                        help="check that the shards built in the destination cover the whole site exactly once.")
+    parser.set_defaults(command="build")
     return parser.parse_args(_args)
 
 
+def parse_deps(_args):
+    parser = argparse.ArgumentParser(
+        prog="bootstraparse deps",
+        description='Queries the import index saved in the destination folder by the last build.'
+    )
+    parser.add_argument('destination', help="path of the folder where the site was built.")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--included-by', metavar='FILE', help="list the pages including FILE, directly or not.")
+    query.add_argument('--imports', metavar='FILE', help="list the files FILE pulls in, directly or not.")
+    query.add_argument('--shared', metavar='N', type=int, help="list the N partials included by the most pages.")
+    parser.add_argument('--direct', action='store_true', help="only follow the imports made by the file itself.")
+    parser.add_argument('--origin', default=None, help="the root folder of the site, whose configs name the index.")
+    parser.add_argument('--index', default=None,
+                        help="path of the index file relative to the destination, export.import_index by default.")
+    parser.set_defaults(command="deps")
+    return parser.parse_args(_args)
+
+
+def deps(args):
+    """
+    Answers a deps query from the import index, without reading the sources.
+    :param args: the arguments returned by parse_deps
+    :type args: argparse.Namespace
+    :return: the lines of the answer
+    :rtype: list[str]
+    """
+    index = args.index
+    if index is None:
+        index = sitecreator.load_config(args.origin)["parser_config"]["export"].get("import_index")
+    if not index:
+        return ["The import index is disabled, set export.import_index in the parser_config of the site."]
+    path = os.path.join(args.destination, index)
+    if not os.path.exists(path):
+        return [f"No import index at {path}, build the site first."]
+    graph = importgraph.ImportGraph.load(None, path)
+    lines = []
+    stale = graph.stale()
+    if stale:
+        lines.append(f"Warning: {len(stale)} files changed since the last build ({', '.join(stale[:5])}).")
+    if args.shared is not None:
+        return lines + [f"{pages:>6} {partial}" for partial, pages in graph.most_shared(args.shared)]
+    name = args.included_by or args.imports
+    keys = graph.resolve(name)
+    if not keys:
+        return lines + [f"{name} is not in the import index."]
+    for key in keys:
+        if args.included_by:
+            files = graph.pages_including(key, not args.direct)
+        else:
+            files = graph.dependencies(key, not args.direct)
+        lines += [f"{key}:"] + [f"  {file}" for file in files]
+    return lines
+
+
 if __name__ == "__main__":  # pragma: no cover
     args = parse(sys.argv[1:])
+    if args.command == "deps":
+        print("\n".join(deps(args)))
+        sys.exit(0)
     error_mngr.init_logging(filename=None, loglevel="DEBUG", filemode='w', handler=None)
-    if sitecreator.create_website(args.origin, args.destination) == 0:
+    prof = profiler.Profiler(enabled=args.profile, cprofile_path=args.cprofile, memory=args.memprofile)
+    prof.start()
+    try:
+        if args.merge_shards:
+            result = sitecreator.merge_shards(args.origin, args.destination)
+        else:
+            result = sitecreator.create_website(args.origin, args.destination, prof, args.shard)
+    finally:
+        prof.stop()
+    if prof.enabled:
+        print(prof.summary())
+    if result == 0:
         print("Bootstraparse run successful!")
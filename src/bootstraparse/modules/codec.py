@@ -0,0 +1,294 @@
+# Compact binary encoding of token streams and container trees
+# The tokens and containers are flattened into a single array of unsigned integers: an opcode for each value,
+#   followed by its operands. Every string (texts, labels, names of the classes and of the attributes) is stored
+#   once in a string table and referenced by its index, integers are stored zigzag-encoded, floats in a table of
+#   their own. A token or a container is its shape, its class and the names of its attributes, followed by their
+#   values: a shape is written the first time it is used, then referenced by its index. A list is its number of
+#   items followed by them. Flyweight tokens decode to the shared instance of their class, and an object found twice
+#   in the same stream is referenced by its index in the order of the objects encoded, so shared tokens stay shared.
+# The array uses the smallest item size holding its largest integer, and the whole stream is decoded with a few
+#   calls to array and str methods before the objects are rebuilt, without running their constructors.
+# Layout: MAGIC, format version (1 byte), item size code (1 byte), number of integers (4 bytes), the integers
+#   (little endian), the floats (8 bytes each, little endian), the strings (utf-8). The integers start with the
+#   number of strings, the number of floats and the length of each string, then the opcodes and operands.
+# Usage:
+#   from bootstraparse.modules import codec
+#   data = codec.encode(parser.parse_line(io)) # bytes
+#   tokens = codec.decode(data)
+#   data = codec.encode(context_mngr.ContextManager(tokens)()) # the containers of a page
+
+import struct
+import sys
+from array import array
+from typing import Dict
+
+from bootstraparse.modules import syntax, context_mngr
+
+
+MAGIC = b"BPTS"
+FORMAT_VERSION = 1
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _TUPLE, _DICT, _SHAPE, _OBJECT, _FLYWEIGHT, _REF = range(13)
+_HEADER = struct.Struct("<4sBcI")
+_ITEM_CODES = "BHIQ"  # 1, 2, 4 and 8 bytes
+_INT_LIMIT = 1 << 63
+
+
+"""
+Token and container classes by qualified name, updated when a stream uses a class defined since.
+"""
+_classes: Dict[str, type] = {}
+
+
+def find_class(name):
+    """
+    Returns a token or container class from its qualified name.
+    :type name: str
+    :raises ValueError: If there is no such class
+    :rtype: type
+    """
+    if name not in _classes:
+        to_visit = [syntax.SemanticType, context_mngr.BaseContainer]
+        while to_visit:
+            cls = to_visit.pop()
+            _classes[f"{cls.__module__}.{cls.__qualname__}"] = cls
+            to_visit += cls.__subclasses__()
+        if name not in _classes:
+            raise ValueError(f"Token stream of an unknown class {name}.")
+    return _classes[name]
+
+
+class Encoder:
+    """
+    Flattens tokens and containers into integers, strings and floats.
+    """
+    def __init__(self):
+        self.ints = []
+        self.strings = {}  # String -> index
+        self.floats = []
+        self.objects = {}  # Id of a token or container -> index, in the order they are encoded
+        self.shapes = {}  # (class, names of the attributes) -> index, in the order they are written
+        self._kept = []  # Keeps the objects encoded alive, so that their ids stay unique
+
+    def string(self, value):
+        """
+        :type value: str
+        :rtype: int
+        """
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        return index
+
+    def value(self, value):
+        """
+        Appends the opcode and the operands of a value.
+        :type value: object
+        :raises TypeError: If the value, or a value it holds, cannot be encoded
+        """
+        ints = self.ints
+        kind = type(value)
+        if kind is str:
+            index = self.strings.get(value)
+            if index is None:
+                index = self.strings[value] = len(self.strings)
+            ints += (_STR, index)
+        elif value is None:
+            ints.append(_NONE)
+        elif kind is bool:
+            ints.append(_TRUE if value else _FALSE)
+        elif kind is int:
+            if not -_INT_LIMIT <= value < _INT_LIMIT:
+                raise TypeError(f"Cannot encode the integer {value}, it does not fit in 64 bits.")
+            ints += (_INT, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif kind is float:
+            ints += (_FLOAT, len(self.floats))
+            self.floats.append(value)
+        elif kind is list or kind is tuple:
+            ints += (_LIST if kind is list else _TUPLE, len(value))
+            encode_value = self.value
+            for item in value:
+                encode_value(item)
+        elif kind is dict:
+            ints += (_DICT, len(value))
+            for key, item in value.items():
+                self.value(key)
+                self.value(item)
+        elif isinstance(value, (syntax.SemanticType, context_mngr.BaseContainer)):
+            self.object(value)
+        else:
+            raise TypeError(f"Cannot encode {value!r} of type {kind.__name__}.")
+
+    def object(self, value):
+        """
+        Appends a token or a container, or a reference to it if it was already encoded.
+        :type value: syntax.SemanticType | context_mngr.BaseContainer
+        """
+        index = self.objects.get(id(value))
+        if index is not None:
+            self.ints += (_REF, index)
+            return
+        self.objects[id(value)] = len(self.objects)
+        self._kept.append(value)
+        cls = type(value)
+        name = self.string(f"{cls.__module__}.{cls.__qualname__}")
+        if isinstance(value, syntax.Flyweight) and isinstance(value, syntax.SemanticType):  # Flyweights are tokens
+            self.ints += (_FLYWEIGHT, name)
+            self.value(value.content)
+            return
+        attributes = vars(value)
+        shape = (cls, tuple(attributes))
+        index = self.shapes.get(shape)
+        if index is None:
+            self.shapes[shape] = len(self.shapes)
+            self.ints += (_SHAPE, name, len(attributes))
+            self.ints += [self.string(attribute) for attribute in attributes]
+        else:
+            self.ints += (_OBJECT, index)
+        for item in attributes.values():
+            self.value(item)
+
+    def to_bytes(self):
+        """
+        :rtype: bytes
+        """
+        strings = list(self.strings)
+        ints = [len(strings), len(self.floats)] + [len(string) for string in strings] + self.ints
+        largest = max(ints)
+        code = next(code for code in _ITEM_CODES if largest < 1 << (8 * array(code).itemsize))
+        packed = array(code, ints)
+        floats = array("d", self.floats)
+        if sys.byteorder == "big":  # pragma: no cover
+            packed.byteswap()
+            floats.byteswap()
+        return b"".join((
+            _HEADER.pack(MAGIC, FORMAT_VERSION, code.encode(), len(packed)),
+            packed.tobytes(), floats.tobytes(), "".join(strings).encode("utf-8", "surrogatepass"),
+        ))
+
+
+class Decoder:
+    """
+    Rebuilds the tokens and containers from the integers, strings and floats of an encoded stream.
+    """
+    def __init__(self, data):
+        """
+        :type data: bytes
+        :raises ValueError: If the data is not a stream of this version of the format
+        """
+        try:
+            magic, version, code, count = _HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Truncated token stream.") from None
+        if magic != MAGIC:
+            raise ValueError("Not a token stream, the magic number does not match.")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Token stream of format {version}, expected {FORMAT_VERSION}.")
+        ints = array(code.decode())
+        start = _HEADER.size
+        end = start + count * ints.itemsize
+        ints.frombytes(data[start:end])
+        if len(ints) != count:
+            raise ValueError("Truncated token stream.")
+        floats = array("d")
+        if sys.byteorder == "big":  # pragma: no cover
+            ints.byteswap()
+        floats.frombytes(data[end:end + 8 * ints[1]])
+        if sys.byteorder == "big":  # pragma: no cover
+            floats.byteswap()
+        text = data[end + 8 * ints[1]:].decode("utf-8", "surrogatepass")
+        self.strings = []
+        position = 0
+        for length in ints[2:2 + ints[0]]:
+            self.strings.append(text[position:position + length])
+            position += length
+        if position != len(text):
+            raise ValueError("Truncated token stream.")
+        self.floats = floats.tolist()
+        self.ops = iter(ints[2 + ints[0]:].tolist())
+        self.objects = []
+        self.shapes = []
+
+    def value(self):
+        """
+        Reads a value.
+        :rtype: object
+        """
+        ops = self.ops
+        op = next(ops)
+        if op == _STR:
+            return self.strings[next(ops)]
+        if op == _LIST:
+            return [self.value() for _ in range(next(ops))]
+        if op == _OBJECT:
+            return self.object(next(ops))
+        if op == _SHAPE:
+            cls = find_class(self.strings[next(ops)])
+            self.shapes.append((cls, [self.strings[next(ops)] for _ in range(next(ops))]))
+            return self.object(len(self.shapes) - 1)
+        if op == _INT:
+            value = next(ops)
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        if op == _FLYWEIGHT:
+            index = len(self.objects)
+            self.objects.append(None)
+            cls = find_class(self.strings[next(ops)])
+            self.objects[index] = syntax.shared_token(cls, self.value())
+            return self.objects[index]
+        if op == _REF:
+            return self.objects[next(ops)]
+        if op == _NONE:
+            return None
+        if op == _TRUE or op == _FALSE:
+            return op == _TRUE
+        if op == _FLOAT:
+            return self.floats[next(ops)]
+        if op == _TUPLE:
+            return tuple([self.value() for _ in range(next(ops))])
+        if op == _DICT:
+            value = {}
+            for _ in range(next(ops)):
+                key = self.value()
+                value[key] = self.value()
+            return value
+        raise ValueError(f"Corrupted token stream, unknown opcode {op}.")
+
+    def object(self, shape):
+        """
+        Reads the attributes of a token or a container of a given shape.
+        :type shape: int
+        :rtype: syntax.SemanticType | context_mngr.BaseContainer
+        """
+        cls, names = self.shapes[shape]
+        value = cls.__new__(cls)
+        self.objects.append(value)
+        attributes = value.__dict__
+        for name in names:
+            attributes[name] = self.value()
+        return value
+
+
+def encode(value):
+    """
+    Encodes tokens, containers, or lists and dicts of them.
+    :type value: object
+    :raises TypeError: If a value cannot be encoded
+    :rtype: bytes
+    """
+    encoder = Encoder()
+    encoder.value(value)
+    return encoder.to_bytes()
+
+
+def decode(data):
+    """
+    Decodes a stream written by encode.
+    :type data: bytes
+    :raises ValueError: If the data is not a valid stream
+    :rtype: object
+    """
+    decoder = Decoder(data)
+    try:
+        return decoder.value()
+    except (StopIteration, IndexError):
+        raise ValueError("Truncated token stream.") from None
@@ -0,0 +1,253 @@
+# Pages compiled into Python render functions, cached on disk
+# The html of a page only depends on its expanded source, the configs and the templates. Its bare aliases (without
+#   optionals) are its variables: the page is built a second time with a placeholder in place of each of them, and
+#   the html is cut around the placeholders into a render function joining constant strings and the values of the
+#   variables. The function is written to a Python module in the cache folder, with the list of the variables it
+#   uses and a fingerprint of everything else the html depends on. Next builds read the page and its imports, and if
+#   the fingerprint matches, the html is the render function called with the values of the aliases, without parsing.
+# A page is only compiled if the render function gives the same html as the build with the actual values, and the
+#   values of the variables are plain words: markup in a value, or a value changed to markup, would be parsed
+#   with the text around it. Aliases used by the imported files are not variables, their values are part of the
+#   fingerprint. Pages failing the check are recorded as not compilable, and built as usual until they change.
+# The fingerprint includes the version of bootstraparse and a hash of the source of the modules turning the text into
+#   html (see schema), so an upgrade never serves the html of the old code. The modules are written to a temporary
+#   file then renamed over the module, and a module that cannot be loaded, such as one truncated by an interrupted
+#   build, is deleted and compiled again.
+# Usage:
+#   from bootstraparse.modules.compiler import PageCompiler
+#   compiler = PageCompiler(environment, "cache/compiled")
+#   html = compiler.render(preparser, build) # build(preparser) -> html, the usual stages, run on cache misses
+#   compiler.compiled, compiler.hits, compiler.not_compilable, compiler.invalid # statistics of the build
+
+import hashlib
+import os
+import re
+import tempfile
+from collections import namedtuple
+from typing import Any, Dict
+
+import bootstraparse
+from bootstraparse.modules import preparser, parser, syntax, context_mngr, export
+
+
+COMPILER_VERSION = 1
+
+"""
+Named tuple holding a compiled page: its fingerprint, the aliases it uses as variables, and its render function
+taking the values of the variables by name, None if the page could not be compiled.
+"""
+CompiledPage = namedtuple("CompiledPage", ["fingerprint", "fields", "render"])
+
+# Placeholder of the variable of index n in the html, made of private use characters
+_PLACEHOLDER = "\ue000{}\ue001"
+_rgx_placeholder = re.compile("\ue000([0-9]+)\ue001")
+# Values that are plain words, separated by single spaces, whatever the text around them
+_rgx_plain = re.compile(r"[A-Za-z0-9]+(?:[ .,'%/-][A-Za-z0-9]+)*")
+
+
+def schema():
+    """
+    Returns the hash of the code the html of the pages depends on: the version of the compiler and of bootstraparse,
+    and the source of the modules preparsing, parsing, contextualising and exporting the pages.
+    :rtype: str
+    """
+    digest = hashlib.sha256(f"{COMPILER_VERSION}\0{bootstraparse.__version__}".encode())
+    for module in (preparser, parser, syntax, context_mngr, export):
+        path = module.__file__
+        if path is None:  # pragma: no cover
+            raise ImportError(f"The source of {module.__name__} is not available, the compiler needs its file.")
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def generate_source(page, fingerprint, fields, parts):
+    """
+    Returns the source of the module of a compiled page.
+    :param page: the name of the page, for the header of the module
+    :param fingerprint: the fingerprint of the page
+    :param fields: the names of the variables used by the page
+    :param parts: the html cut around the variables: constant strings at even indexes, indexes of fields at odd ones
+    :type page: str
+    :type fingerprint: str
+    :type fields: list[str]
+    :type parts: list[str | int] | None
+    :rtype: str
+    """
+    lines = [
+        f"# Compiled by bootstraparse from {page}, do not edit",
+        f"FINGERPRINT = {fingerprint!r}",
+        f"FIELDS = {tuple(fields)!r}",
+    ]
+    if parts is None:
+        lines.append("render = None  # Not compilable")
+    else:
+        pieces = [repr(part) if i % 2 == 0 else f"bindings[{fields[part]!r}]" for i, part in enumerate(parts)]
+        lines += ["", "", "def render(bindings):", f"    return ''.join(({', '.join(pieces)},))"]
+    return "\n".join(lines) + "\n"
+
+
+class PageCompiler:
+    """
+    Renders the pages with their compiled render functions, compiles them when their fingerprint changes.
+    """
+    def __init__(self, _env, folder):
+        """
+        :param _env: the environment of the build
+        :param folder: the cache folder of the compiled pages
+        :type _env: bootstraparse.modules.environment.Environment
+        :type folder: str
+        """
+        self._env = _env
+        self.folder = folder
+        self._pages = {}  # Path of the module -> CompiledPage, loaded once per build
+        self._variables = None
+        self.schema = schema()
+        self.compiled = 0
+        self.hits = 0
+        self.not_compilable = 0
+        self.invalid = 0
+
+    def variables(self):
+        """
+        Returns the values of the bare aliases of the environment, computed once.
+        :rtype: dict[str, str]
+        """
+        if self._variables is None:
+            if self._env.alias_table is None:
+                self._env.alias_table = preparser.AliasTable(self._env)
+            self._variables = {
+                name: prepared.constant for name, prepared in self._env.alias_table.shortcuts.items()
+                if prepared.constant is not None
+            }
+        return self._variables
+
+    def fingerprint(self, text, fields):
+        """
+        Returns the hash of everything the html of a page depends on, except the values of its variables and of the
+        aliases it does not use.
+        :param text: the expanded source of the page
+        :param fields: the variables of the page
+        :type text: str
+        :type fields: list[str] | tuple[str]
+        :rtype: str
+        """
+        configs = dict(self._env.config.loaded_conf)
+        aliases = dict(configs.get("aliases") or {})
+        shortcuts = aliases.get("shortcuts") or {}
+        used = text + "".join(str(message) for message in shortcuts.values())  # Aliases can use other aliases
+        aliases["shortcuts"] = {
+            name: message for name, message in shortcuts.items() if name not in fields and f"@[{name}" in used
+        }
+        configs["aliases"] = aliases
+        return hashlib.sha256(repr((
+            self.schema, text, tuple(fields), configs, self._env.export_mngr.templates.loaded_conf
+        )).encode()).hexdigest()
+
+    def module_path(self, pp):
+        """
+        :type pp: preparser.PreParser
+        :rtype: str
+        """
+        name = hashlib.sha256(os.path.abspath(pp.path).encode()).hexdigest()[:24]
+        return os.path.join(self.folder, f"page_{name}.py")
+
+    def load(self, path):
+        """
+        Returns the compiled page of a module, None if there is none or if it cannot be loaded, the module being
+        deleted then.
+        :type path: str
+        :rtype: CompiledPage | None
+        """
+        if path not in self._pages:
+            if not os.path.exists(path):
+                return None
+            namespace: Dict[str, Any] = {}
+            try:
+                with open(path) as module_file:
+                    exec(compile(module_file.read(), path, "exec"), namespace)
+                self._pages[path] = CompiledPage(namespace["FINGERPRINT"], namespace["FIELDS"], namespace["render"])
+            except (SyntaxError, ValueError, KeyError, NameError, TypeError, UnicodeDecodeError):
+                self.invalid += 1
+                os.remove(path)
+                return None
+        return self._pages[path]
+
+    def render(self, pp, build):
+        """
+        Returns the html of a page, from its render function if it is up to date, else builds and compiles it.
+        :param pp: the preparser of the page
+        :param build: function running the usual stages on a preparser, returns the html
+        :type pp: preparser.PreParser
+        :type build: callable
+        :rtype: str
+        """
+        text = pp.do_imports().read()
+        variables = self.variables()
+        path = self.module_path(pp)
+        page = self.load(path)
+        if page is not None and all(_rgx_plain.fullmatch(variables.get(field, "")) for field in page.fields):
+            if page.fingerprint == self.fingerprint(text, page.fields):
+                if page.render is None:
+                    return build(pp)
+                self.hits += 1
+                return page.render(variables)
+        return self.compile(pp, text, path, build)
+
+    def compile(self, pp, text, path, build):
+        """
+        Builds a page, then builds it again with placeholders for its variables and writes its render function.
+        :param pp: the preparser of the page
+        :param text: the expanded source of the page
+        :param path: the path of the module of the page
+        :param build: function running the usual stages on a preparser, returns the html
+        :type pp: preparser.PreParser
+        :type text: str
+        :type path: str
+        :type build: callable
+        :rtype: str
+        """
+        html = build(pp)
+        variables = self.variables()
+        candidates = sorted(name for name, value in variables.items() if _rgx_plain.fullmatch(value))
+        template = preparser.PreParser(pp.path, self._env, dict_of_imports=pp.global_dict_of_imports)
+        template.alias_table = template.get_alias_table().with_shortcuts(
+            {name: _PLACEHOLDER.format(i) for i, name in enumerate(candidates)}
+        )
+        parts = _rgx_placeholder.split(build(template))
+        template.release()
+        fields = sorted({candidates[int(i)] for i in parts[1::2]})
+        parts = [part if i % 2 == 0 else fields.index(candidates[int(part)]) for i, part in enumerate(parts)]
+        page = CompiledPage(self.fingerprint(text, fields), tuple(fields), None)
+        namespace: Dict[str, Any] = {}
+        source = generate_source(pp.name, page.fingerprint, fields, parts)
+        exec(compile(source, path, "exec"), namespace)
+        if namespace["render"](variables) == html:
+            page = page._replace(render=namespace["render"])
+            self.compiled += 1
+        else:
+            source = generate_source(pp.name, page.fingerprint, fields, None)
+            self.not_compilable += 1
+        self.write(path, source)
+        self._pages[path] = page
+        return html
+
+    def write(self, path, source):
+        """
+        Writes a module atomically.
+        :type path: str
+        :type source: str
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.folder, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "w") as module_file:
+                module_file.write(source)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def __repr__(self):
+        return f"PageCompiler({self.hits} pages rendered, {self.compiled} compiled, " \
+               f"{self.not_compilable} not compilable, {self.invalid} invalid)"
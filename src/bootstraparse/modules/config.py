@@ -5,14 +5,128 @@
 #  config = ConfigLoader([list of config files], extensions=[list of extensions])
 #  config['file']['key']
 # The ConfigLoader class has load_from_file and load_from_folder methods and __getitem__ for accessing loaded elements
+# The configs are held in a LayeredConfig, a read-only view of the files of the folders: loading a folder only lists
+#   its files, a file is parsed the first time its name is looked up. Each key of a config is resolved through the
+#   files of that name, the later folders first: a section, such as parser_config's parsing, is chained over the
+#   sections of the earlier files key by key, any other value replaces theirs. Adding a file after a lookup leaves the
+#   configs returned before as they are. The configs are read-only mappings, their lists tuples.
+#  config.loaded_conf.loaded() # the names parsed so far
 
 import os
+import typing
+from collections import ChainMap
+from collections.abc import Mapping
+from types import MappingProxyType
 
 import rich
 import yaml
 from bootstraparse.modules import error_mngr
 
 
+def read_only(value):
+    """
+    Returns a parsed value with its mappings made read-only and its lists made tuples, at every depth.
+    :type value: object
+    :rtype: object
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: read_only(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(read_only(item) for item in value)
+    return value
+
+
+class LayeredConfig(typing.Mapping[str, typing.Any]):
+    """
+    Read-only dictionary of the config files by name, like a ChainMap of the config folders.
+    A name is parsed on its first lookup, each of its keys resolved through its files, the later ones first.
+    """
+    def __init__(self):
+        self.sources = {}  # Name -> paths of its files, in the order they were added
+        self._layers = {}  # Name -> read-only content of each of its files, once looked up
+        self._resolved = {}  # Name -> content resolved through its files, until a file of that name is added
+
+    def add_file(self, filepath):
+        """
+        Adds a config file, parsed on the first lookup of its name, or right away if the name was already looked up.
+        :param filepath: path to config file
+        :type filepath: str
+        """
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        self.sources.setdefault(name, []).append(filepath)
+        if name in self._layers:
+            self.parse(name, filepath)
+
+    def parse(self, name, filepath):
+        """
+        Parses a config file as the last layer of its name.
+        :param name: name of the config
+        :param filepath: path to config file
+        :type name: str
+        :type filepath: str
+        """
+        basename = os.path.basename(filepath)
+        with open(filepath, "r") as f:
+            try:
+                self._layers.setdefault(name, []).append(read_only(yaml.safe_load(f)))
+                self._resolved.pop(name, None)
+            except BaseException as e:
+                self._layers.pop(name, None)
+                self._resolved.pop(name, None)
+                error_mngr.log_message(f'Error parsing in file {basename} at {filepath}.', level='CRITICAL')
+                error_mngr.log_exception(e, level='CRITICAL')
+
+    @staticmethod
+    def resolve(layers):
+        """
+        Resolves the content of a config through its files. Each key takes its value in the last file defining it, or
+        if that value is a mapping, the mappings of the files defining it chained, the later ones first, back to a file
+        holding anything else. A config that is not a mapping in every file is the content of its last file.
+        :param layers: the read-only content of each file, in the order they were added
+        :type layers: list[object]
+        :rtype: object
+        """
+        if not all(isinstance(layer, Mapping) for layer in layers):
+            return layers[-1]
+        resolved = {}
+        for key, value in ChainMap(*reversed(layers)).items():
+            chain = []
+            for layer in reversed(layers):
+                if key in layer:
+                    if not isinstance(layer[key], Mapping):
+                        break
+                    chain.append(layer[key])
+            resolved[key] = MappingProxyType(dict(ChainMap(*chain))) if chain else value
+        return MappingProxyType(resolved)
+
+    def loaded(self):
+        """
+        Returns the names parsed so far.
+        :rtype: list[str]
+        """
+        return list(self._layers)
+
+    def __getitem__(self, name):
+        if name not in self._resolved:
+            if name not in self._layers:
+                for filepath in self.sources[name]:
+                    self.parse(name, filepath)
+            self._resolved[name] = self.resolve(self._layers[name])
+        return self._resolved[name]
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class ConfigLoader:
     """
     Reads all config files in a folder
@@ -37,16 +151,16 @@ class ConfigLoader:
         else:
             error_mngr.log_exception(TypeError(f"Incorrect config type given. Expected a string, list or tuple; "
                                                f"got {type(config_folder).__name__} instead."), level='CRITICAL')
-        self.loaded_conf = {}
+        self.loaded_conf = LayeredConfig()
         self.extensions = extensions
         self.reload_all()
 
     def reload_all(self):
         """
-        Reloads all configs
+        Reloads all configs, parsed again on their next lookup
         :return: None
         """
-        self.loaded_conf = {}
+        self.loaded_conf = LayeredConfig()
         for folder in self.config_folders:
             self.load_from_folder(folder)
 
@@ -62,32 +176,17 @@ class ConfigLoader:
 
     def load_from_file(self, filepath):
         """
-        Loads a config file
+        Loads a config file, parsed right away with the files of the same name loaded before it
         :param filepath: path to config file
         :type filepath: str
         :return: None
         """
-        basename = os.path.basename(filepath)
-        name, ext = os.path.splitext(basename)
-        with open(filepath, "r") as f:
-            try:
-                if name not in self.loaded_conf:
-                    self.loaded_conf[name] = yaml.safe_load(f)
-                else:
-                    new_config = yaml.safe_load(f)
-                    for key in new_config:
-                        if key in self.loaded_conf[name]:
-                            self.loaded_conf[name][key].update(new_config[key])
-                        else:
-                            self.loaded_conf[name][key] = new_config[key]
-                            error_mngr.log_message(f"Warning: {name} is already in {self.loaded_conf}", level='CRITICAL')
-            except BaseException as e:
-                error_mngr.log_message(f'Error parsing in file {basename} at {filepath}.', level='CRITICAL')
-                error_mngr.log_exception(e, level='CRITICAL')
+        self.loaded_conf.add_file(filepath)
+        self.loaded_conf[os.path.splitext(os.path.basename(filepath))[0]]
 
     def load_from_folder(self, folder):
         """
-        Loads all configs in the config folder
+        Loads all configs in the config folder, each one parsed on the first lookup of its name
         :param folder: path to folder
         :type folder: str
         :return: None
@@ -95,7 +194,7 @@ class ConfigLoader:
         for filename in os.listdir(folder):
             file_ext = os.path.splitext(filename)[1][1:]
             if file_ext in self.extensions:
-                self.load_from_file(os.path.join(folder, filename))
+                self.loaded_conf.add_file(os.path.join(folder, filename))
 
     def __getitem__(self, item):
         """
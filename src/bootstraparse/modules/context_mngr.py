@@ -11,6 +11,8 @@
 #   container[number] -> The number element in the content
 #   "class_insert" >> container[number] -> Get an element from one of the mapped methods
 
+from typing import Any, Optional, Tuple
+
 from bootstraparse.modules import syntax, error_mngr, export
 from bootstraparse.modules.error_mngr import MismatchedContainerError, log_exception, log_message, LonelyOptionalError # noqa
 
@@ -285,7 +287,7 @@ class EtCustomSpanContainer(BaseContainer):
     type = "inline_elements"
 
     def export(self, exm):
-        self.subtype = "custom_" + self.content[0].content[0] # noqa F821 (self.content[0] is a token, by definition
+        self.subtype = "custom_" + self.content[0].span_id # noqa F821 (self.content[0] is a token, by definition
         return super().export(exm)
 
 
@@ -320,11 +322,11 @@ class HyperLinkContainer(BaseContainer):
     subtype = "link"
 
     def export(self, exm):
-        self.others["url"] = self.content[0].content.url
+        self.others["url"] = self.content[0].url
         return super().export(exm)
 
     def get_content(self, exm, arbitrary_list=None):
-        return self.content[0].content.text
+        return self.content[0].text
 
 
 # class IlImageContainer(BaseContainer):
@@ -345,11 +347,11 @@ class HeaderContainer(BaseContainer):
 
     def export(self, exm):
         self.others = {} # noqa F821
-        self.others["header_level"] = len(self.content[0].content[0])
+        self.others["header_level"] = self.content[0].level
         return super().export(exm)
 
     def get_content(self, exm, arbitrary_list=None):
-        return self.content[0].content[1]
+        return self.content[0].text
 
 
 class DisplayContainer(BaseContainer):
@@ -358,11 +360,11 @@ class DisplayContainer(BaseContainer):
 
     def export(self, exm):
         # self.others = {}
-        self.others["display_level"] = len(self.content[0].content[0])
+        self.others["display_level"] = self.content[0].level
         return super().export(exm)
 
     def get_content(self, exm, arbitrary_list=None):
-        return self.content[0].content[1]
+        return self.content[0].text
 
 
 class TableSeparatorContainer(BaseContainer):
@@ -406,6 +408,25 @@ class LinebreakContainer(BaseContainer):
         return "<br />\n"*(len(self.content)-1)
 
 
+class FragmentContainer(BaseContainer):
+    """
+    Html of a self-contained imported file, rendered once for all the pages importing it (see fragments.py).
+    """
+    nested = False
+
+    def export(self, _):
+        """
+        Returns the html of the top-level containers of the file, separated by spaces when the fragment is nested
+        in another container, the same way BaseContainer.get_content would have separated them.
+        :rtype: str
+        """
+        return self.content[0].nested_html if self.nested else self.content[0].html
+
+    def to_container(self, filter_func=None):
+        self.nested = True
+        return self
+
+
 """
 Dictionary of all correspondences between tokens and containers.
 """
@@ -426,14 +447,68 @@ _to_container = {
     "table:row": TableRowContainer,
     "table:cell": TableCellContainer,
     "table:separator": TableSeparatorContainer,
+    "fragment": FragmentContainer,
 }
 
+"""
+Dictionary of the tokens grouping the following ones (ContextManager.lookahead), and the labels they group.
+"""
+_lookahead = {
+    "list:ulist": ["list:ulist"],
+    "list:olist": ["list:olist"],
+    "table:row": ["table:separator", "table:row"],  # future: Implement tables
+    "blockquotes": [],  # future: Implement blockquotes
+    "linebreak": ["linebreak"],
+}
+
+"""
+Labels of all the tokens a lookahead can start from or group.
+"""
+LOOKAHEAD_LABELS = frozenset(_lookahead).union(*_lookahead.values())
+
+
+def scan_matches(tokens, opened=None):
+    """
+    Goes through a list of tokens the way ContextManager.__call__ does, without encapsulating anything,
+    and counts the tokens left waiting for their counterpart.
+    :param tokens: List of parsed tokens.
+    :param opened: Counts of the tokens waiting for their counterpart before the list, updated in place.
+    :type tokens: list[syntax.SemanticType]
+    :type opened: dict[str, int] | None
+    :return: The counts of the tokens waiting for their counterpart by label, None if the context manager would fail.
+    :rtype: dict[str, int] | None
+    """
+    if opened is None:
+        opened = {}
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        index += 1
+        if isinstance(token, syntax.OptionalToken):
+            continue
+        if token.label in _lookahead:
+            while index < len(tokens):
+                label = tokens[index].label
+                if label not in _lookahead[token.label] and (label != "linebreak" or
+                                                             tokens[index - 1].label == "linebreak"):
+                    break
+                index += 1
+        elif isinstance(token, syntax.FinalSemanticType):
+            continue
+        elif opened.get(token.counterpart()):
+            opened[token.counterpart()] -= 1
+        elif isinstance(token, syntax.TokensToMatch) and not isinstance(token, syntax.ClosedSemanticType):
+            opened[token.label] = opened.get(token.label, 0) + 1
+        else:
+            return None
+    return opened
+
 
 class ContextManager:
     """
     Class in charge of piling all the parsed elements and then encapsulating them inside one another.
     """
-    def __init__(self, parsed_list, name=None, ident=0):
+    def __init__(self, parsed_list, name=None, ident=0, origin=None):
         """
         Takes a list of parsed tokens.
         :type parsed_list : list[syntax.SemanticType]
@@ -442,20 +517,19 @@ class ContextManager:
         :param name: Name of the file being parsed.
         :type ident: int
         :param ident: Number of spaces to indent the output.
+        :type origin: (callable | None)
+        :param origin: Function giving the (file name, line number) a line comes from, see PreParser.line_origin.
         """
         self.output = []
         self.parsed_list = parsed_list
         self.pile = []
         self.name = name
         self.ident = ident
+        self.origin = origin
+        self._last_position: Tuple[Optional[int], Any] = (None, None)
+        self.positions = {}  # Positions of the flyweight tokens, by index in the pile (and in the parsed list)
         self.matched_elements = {}
-        self.dict_lookahead = {
-            "list:ulist": ["list:ulist"],
-            "list:olist": ["list:olist"],
-            "table:row": ["table:separator", "table:row"],  # future: Implement tables
-            "blockquotes": [],  # future: Implement blockquotes
-            "linebreak": ["linebreak"],
-        }
+        self.dict_lookahead = _lookahead
         self.contextualised = False
 
     def encapsulate(self, start, end):
@@ -550,15 +624,20 @@ class ContextManager:
 
         while index < len(self.parsed_list):
             token = self.parsed_list[index]
-            token.line_number = line_number
-            token.file_name = self.name
-            token.ident = self.ident
+            if token.flyweight:  # Shared instance, its position is kept apart
+                self.positions[index] = self.position(line_number)
+            else:
+                token.file_name, token.line_number = self.position(line_number)
+                token.ident = self.ident
             self.pile.append(token)
             try:
                 # Linebreaks
                 if isinstance(token, syntax.Linebreak):
                     # self.encapsulate(index, index)
                     line_number += 1
+                # Pre-rendered fragments stand for all the lines of an imported file
+                elif isinstance(token, syntax.FragmentToken):
+                    line_number += token.lines
 
                 # Pack the optionnal with the previous container if it exists (else raise error)
                 if isinstance(token, syntax.OptionalToken):
@@ -583,14 +662,14 @@ class ContextManager:
 
                 # Error if closing token does not have a start
                 elif isinstance(token, syntax.ClosedSemanticType):
-                    raise MismatchedContainerError(token)
+                    raise MismatchedContainerError(token, self.positions.get(index))
 
                 # Starting token by default (can cause unintended behaviours on bad implementations)
                 elif isinstance(token, syntax.TokensToMatch):
                     self._add_matched(token.label, index)
 
                 else:
-                    raise MismatchedContainerError(token)
+                    raise MismatchedContainerError(token, self.positions.get(index))
 
             except MismatchedContainerError as e:
                 error_mngr.log_exception(e, level="CRITICAL")  # FUTURE: Try to guess some hints.
@@ -599,6 +678,20 @@ class ContextManager:
         self.contextualised = True
         return self.finalize_pile()
 
+    def position(self, line_number):
+        """
+        Returns the file name and line number to give to the tokens of a line.
+        :type line_number: int
+        :param line_number: Number of the line in the parsed list.
+        :rtype: (str, int)
+        :return: The original file and line if an origin function was given, the parsed ones otherwise.
+        """
+        if self.origin is None:
+            return self.name, line_number
+        if self._last_position[0] != line_number:  # Tokens of a same line share their position
+            self._last_position = (line_number, tuple(self.origin(line_number)))
+        return self._last_position[1]
+
     def __iter__(self):
         """
         Iterator over the pile.
@@ -615,14 +708,13 @@ class ContextManager:
         :return: list[BaseContainer]
         """
         final_pile = []
-        for p in self.pile:
+        for i, p in enumerate(self.pile):
             if p is not None:
                 if isinstance(p, BaseContainer):
                     final_pile.append(p)
                 else:  # Cleanup of non-matched elements
                     if isinstance(p, syntax.SemanticType):
-                        line = p.line_number
-                        name = p.file_name
+                        name, line = self.positions.get(i, (p.file_name, p.line_number))
                     else:
                         line = "Undefined"
                         name = "Undefined"
@@ -657,6 +749,8 @@ class ContextManager:
                 self.recontext(self.parsed_list[i])
                 self.pile.append(self.parsed_list[i])
                 range_to_encapsulate += 1
+                if isinstance(self.parsed_list[i], syntax.Linebreak):  # Consecutive empty lines
+                    line_skipped += 1
             elif self.parsed_list[i].label == "linebreak":
                 if self.parsed_list[i-1].label == "linebreak":
                     break
@@ -678,6 +772,8 @@ class ContextManager:
         :return: Token to recontextualise.
         :rtype: syntax.SemanticType
         """
+        if token.flyweight:  # Shared and stateless, nothing to recontextualise
+            return
         token.content = ContextManager(token.content, name=self.name)()
 
     def get_last_container_in_pile(self, index):
@@ -695,9 +791,11 @@ class ContextManager:
                 if isinstance(self.pile[i], BaseContainer):
                     return self.pile[i]
                 else:
-                    log_exception(LonelyOptionalError(self.pile[index], self.pile[i]), level="CRITICAL")
+                    log_exception(LonelyOptionalError(
+                        self.pile[index], self.pile[i], self.positions.get(index), self.positions.get(i)
+                    ), level="CRITICAL")
             i -= 1
-        log_exception(LonelyOptionalError(self.pile[index], None), level="CRITICAL")
+        log_exception(LonelyOptionalError(self.pile[index], None, self.positions.get(index)), level="CRITICAL")
 
     def print_all(self):
         """
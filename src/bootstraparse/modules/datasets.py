@@ -0,0 +1,192 @@
+# Pages generated from the records of a dataset with a single template
+# A dataset is declared in the datasets config of the site (configs/datasets.yaml), by name:
+#   glossary:
+#     template: "_glossary_entry.bpr" # relative to the site, an underscore keeps the crawler from building it
+#     data: "glossary"                # name of the config holding the records (configs/glossary.yaml)
+#     output: "glossary/{slug}.html"  # relative to the destination, formatted with the fields of each record
+#     markup: true                    # the values are markup, as if they were aliases, inserted as they are if false
+# The records are the items of the data: a mapping gives one record per key, with its fields if the value is a
+#   mapping, or its value as field "value". A list gives one record per item, its index being the key. Every record
+#   has a key and a slug fields, the slug being the key usable in a file name.
+# The template refers to the fields with @[record.<field>] aliases. It is preparsed, parsed, contextualised and
+#   exported once with placeholders in place of the fields, then the records whose values are plain words only
+#   substitute them in the html. Markup in a value would be parsed with the text around it, so the records with such
+#   values are built in full, their values as aliases, giving the same page as any page using those aliases.
+#   The substitution is checked once against a full build, and if a field the template uses is missing from the html,
+#   its placeholder having been parsed away, or the check fails, every record is built in full.
+#   The fields can only be used by the template itself, not by the files it imports.
+# Usage:
+#   from bootstraparse.modules import datasets
+#   for dataset in datasets.load_datasets(environment):
+#       datasets.page_paths(dataset, destination) # the paths of its pages, by record
+#       paths = datasets.build(dataset, crawler, render) # render(preparser, destination) -> html
+
+import os
+import re
+from collections import namedtuple
+from collections.abc import Mapping
+
+from bootstraparse.modules import error_mngr
+
+"""
+Named tuple holding a dataset: its name, the path of its template, its records, the format of the paths of its pages
+and whether the values are markup.
+"""
+Dataset = namedtuple("Dataset", ["name", "template", "records", "output", "markup"])
+
+_rgx_unsafe = re.compile(r"[^A-Za-z0-9._-]+")
+# Placeholder of the field of index n in the html of the template, made of private use characters
+_PLACEHOLDER = "\ue000{}\ue001"
+_rgx_placeholder = re.compile("\ue000([0-9]+)\ue001")
+# Values that are plain words, separated by single spaces, whatever the text around them (see compiler)
+_rgx_plain = re.compile(r"[A-Za-z0-9]+(?:[ .,'%/-][A-Za-z0-9]+)*")
+# Prefix of the fields in the aliases used by the template, as saved by the preparser
+_FIELD_ALIAS = "shortcuts/record."
+
+
+def slugify(key):
+    """
+    Returns a key usable in a file name.
+    :type key: str
+    :rtype: str
+    """
+    return _rgx_unsafe.sub("-", str(key)).strip("-") or "-"
+
+
+def make_records(data):
+    """
+    Returns the records of a dataset, see the header of the module.
+    :param data: the content of the config holding the records
+    :type data: collections.abc.Mapping | list | tuple
+    :rtype: list[dict[str, str]]
+    """
+    if isinstance(data, Mapping):
+        items = list(data.items())
+    elif isinstance(data, (list, tuple)):
+        items = list(enumerate(data))
+    else:
+        error_mngr.log_exception(TypeError(
+            f"Incorrect dataset type. Expected a mapping or a list; got {type(data).__name__} instead."
+        ), level='CRITICAL')
+    records = []
+    for key, value in items:
+        record = {str(k): v for k, v in value.items()} if isinstance(value, Mapping) else {"value": value}
+        record.setdefault("key", key)
+        record.setdefault("slug", slugify(record["key"]))
+        records.append({field: "" if v is None else str(v) for field, v in record.items()})
+    return records
+
+
+def load_datasets(_env):
+    """
+    Returns the datasets declared in the datasets config of the environment, none if there is no such config.
+    :param _env: the environment of the build
+    :type _env: bootstraparse.modules.environment.Environment
+    :rtype: list[Dataset]
+    """
+    if "datasets" not in _env.config:
+        return []
+    datasets = []
+    for name, declaration in (_env.config["datasets"] or {}).items():
+        datasets.append(Dataset(
+            name=name,
+            template=os.path.join(_env.origin, declaration["template"]),
+            records=make_records(_env.config[declaration.get("data", name)]),
+            output=declaration.get("output", f"{name}/{{slug}}.html"),
+            markup=declaration.get("markup", True),
+        ))
+    return datasets
+
+
+def page_paths(dataset, destination):
+    """
+    Returns the path of the page of each record of a dataset, in the order of the records.
+    :param dataset: the dataset
+    :param destination: the destination path of the site
+    :type dataset: Dataset
+    :type destination: str
+    :rtype: list[str]
+    """
+    return [os.path.join(destination, dataset.output.format(**record)) for record in dataset.records]
+
+
+def render_record(dataset, record, crawler, render, path):
+    """
+    Builds the template of a dataset with the values of a record as aliases.
+    :param dataset: the dataset
+    :param record: the record
+    :param crawler: the crawler of the site
+    :param render: function returning the html of a page from its preparser and destination
+    :param path: the path of the page of the record
+    :type dataset: Dataset
+    :type record: dict[str, str]
+    :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+    :type render: callable
+    :type path: str
+    :rtype: str
+    """
+    pp = crawler.open_page(dataset.template)
+    pp.alias_table = pp.get_alias_table().with_shortcuts({f"record.{field}": value for field, value in record.items()})
+    html = render(pp, path)
+    pp.release()
+    return html
+
+
+def build(dataset, crawler, render):
+    """
+    Renders the template of a dataset once, then writes one page per record, built in full if its values are markup
+    or if the substitution of the values does not give the same page as a full build.
+    :param dataset: the dataset to build
+    :param crawler: the crawler of the site, the template shares its imports with the pages
+    :param render: function returning the html of a page from its preparser and destination
+    :type dataset: Dataset
+    :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+    :type render: callable
+    :return: the paths of the pages written
+    :rtype: list[str]
+    """
+    fields = sorted({field for record in dataset.records for field in record})
+    pp = crawler.open_page(dataset.template)
+    pp.alias_table = pp.get_alias_table().with_shortcuts(
+        {f"record.{field}": _PLACEHOLDER.format(i) for i, field in enumerate(fields)}
+    )
+    parts = _rgx_placeholder.split(render(pp, os.path.join(crawler.destination_path, dataset.name)))
+    referenced = {alias[len(_FIELD_ALIAS):] for alias in pp.used_aliases if alias.startswith(_FIELD_ALIAS)}
+    pp.release()
+    used = [fields[int(i)] for i in parts[1::2]]  # Odd parts are the indexes of the fields
+    lost = sorted(referenced.intersection(fields).difference(used))
+    if lost and not dataset.markup:
+        error_mngr.log_message(
+            f"Dataset {dataset.name}: the fields {', '.join(lost)} do not survive the parsing of {dataset.template}, "
+            f"its pages are built in full with the values as markup.",
+            level="WARNING"
+        )
+    spliced = not lost  # Whether the values can be substituted in the html of the template
+    checked = not dataset.markup  # Whether the substitution was checked against a full build
+
+    paths = set()
+    for record, path in zip(dataset.records, page_paths(dataset, crawler.destination_path)):
+        missing = [field for field in used if field not in record]
+        if missing:
+            error_mngr.log_exception(KeyError(
+                f"Record {record['key']} of dataset {dataset.name} has no field {', '.join(missing)}."
+            ))
+        if path in paths:
+            error_mngr.log_exception(FileExistsError(
+                f"Records of dataset {dataset.name} share the page {path}, make the output format unique."
+            ))
+        paths.add(path)
+        values = [record[field] for field in used]
+        html = None
+        if spliced and (not dataset.markup or all(_rgx_plain.fullmatch(value) for value in values)):
+            html = "".join(part if i % 2 == 0 else values[i // 2] for i, part in enumerate(parts))
+            if not checked:
+                checked = True
+                full = render_record(dataset, record, crawler, render, path)
+                spliced, html = html == full, full
+        if html is None:
+            html = render_record(dataset, record, crawler, render, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(crawler.create_file(path), "w") as output_file:
+            output_file.write(html)
+    return sorted(paths)
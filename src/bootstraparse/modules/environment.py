@@ -14,6 +14,13 @@
 #   env["site_path"] -> returns site path
 #   env["export"] -> returns export object ???
 #   env["site_crawler"] -> returns site crawler object
+#   env["alias_table"] -> returns the compiled aliases and images (secondary, built on first use)
+#   env["parse_cache"] -> returns the cache of the parsed lines (secondary, None disables it)
+#   env["replacement_cache"] -> returns the replacements of the imported files, the least recently used evicted (secondary, built on first use)
+#   env["fragment_cache"] -> returns the pre-rendered html of the self-contained imported files (secondary, None disables it)
+#   env["import_graph"] -> returns the index of the imports of the site (secondary, None disables it)
+#   env["page_compiler"] -> returns the cache of the pages compiled into render functions (secondary, None disables it)
+#   env["container_cache"] -> returns the on-disk cache of the containers of the pages (secondary, None disables it)
 
 from bootstraparse.modules import error_mngr
 
@@ -46,7 +53,13 @@ class Environment:
 
         # secondaryParameters
         self._sParams = {
-
+            'alias_table': None,
+            'parse_cache': None,
+            'replacement_cache': None,
+            'fragment_cache': None,
+            'import_graph': None,
+            'page_compiler': None,
+            'container_cache': None,
         }
 
         # Set all parameters to uninitialised
@@ -135,17 +135,18 @@ class MismatchedContainerError(BootstraparseError):
     """
     The token is not final and cannot be contained. Indicative of a mismatched token.
     """
-    def __init__(self, token):
+    def __init__(self, token, position=None):
         """
         Initializes the MismatchedContainerError class with the token that was not final
         :param token: The token that is not final
+        :param position: The file name and line number of the token, read from the token if None
         :type token: syntax.SemanticType
+        :type position: (str, int) | None
         """
         self.token = token
         if token:
-            self.line = token.line_number
+            self.name, self.line = position or (token.file_name, token.line_number)
             self.label = token.label
-            self.name = token.file_name
         else:
             self.line = None
             self.label = None
@@ -157,7 +158,7 @@ class LonelyOptionalError(BootstraparseError):
     """
     Optional token could not be matched with last element in pile (not a container).
     """
-    def __init__(self, token, last_in_pile):
+    def __init__(self, token, last_in_pile, position=None, last_position=None):
         """
         Initializes the LonelyOptionalError class with the token found and the last element in the pile
         Used when a token is found that is optional and cannot be matched with the last element in the pile (not a container)
@@ -165,20 +166,38 @@ class LonelyOptionalError(BootstraparseError):
         :type token: syntax.SemanticType
         :param last_in_pile: The last element in the pile
         :type last_in_pile: syntax.SemanticType
+        :param position: The file name and line number of the token, read from the token if None
+        :type position: (str, int) | None
+        :param last_position: The file name and line number of the last element, read from it if None
+        :type last_position: (str, int) | None
         """
         self.token = token
         if token:
-            self.line = token.line_number
+            self.name, self.line = position or (token.file_name, token.line_number)
             self.label = token.label
-            self.name = token.file_name
         else:
             self.line = None
             self.label = None
             self.name = None
         if last_in_pile:
+            last_line = (last_position or (last_in_pile.file_name, last_in_pile.line_number))[1]
             super().__init__(f"Could not match token {token} at line {self.line} with "
-                             f"last element in pile {last_in_pile} at line {last_in_pile.line_number} "
+                             f"last element in pile {last_in_pile} at line {last_line} "
                              f"in file {self.name}(not a container).")
         else:
             super().__init__(f"Could not match token {token} at line {self.line} in file {self.name}"
                              f"as there was nothing in the pile.")
+
+
+class ShardError(BootstraparseError):
+    """
+    The manifests of a sharded build do not cover the site exactly once.
+    """
+    def __init__(self, problems):
+        """
+        Initializes the ShardError class with every problem found by the merge check
+        :param problems: The description of each problem
+        :type problems: list[str]
+        """
+        self.problems = problems
+        super().__init__(f"The shards do not cover the site exactly once: {'; '.join(problems)}.")
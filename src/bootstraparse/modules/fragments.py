@@ -0,0 +1,247 @@
+# Pre-rendered html of the imported files that do not depend on the page importing them
+# An imported file is self-contained when its tokens contextualise into closed containers: every structural element
+#   or marker it opens is closed in it, and no group of list items or table rows crosses its first or last line.
+#   Such a file is contextualised and exported once, then its html is spliced into every page importing it as a
+#   single FragmentToken. Its leading and trailing empty lines stay in the page, where they can group with the
+#   linebreaks around the import. Imports leaving a container open across their boundaries, or importing a marker
+#   the page left open, go through the context manager with the rest of the page.
+# In include mode, the html of each fragment is written once to its own file in the destination, and the pages
+#   reference it with a server-side include (ssi) or an edge-side include (esi) tag instead of inlining it. The files
+#   are named after the hash of their html, a full build removes the ones left by previous builds that it did not
+#   write, and merging the shards of a build lists them (see shards).
+# Usage:
+#   from bootstraparse.modules.fragments import FragmentCache
+#   cache = FragmentCache(environment)
+#   tokens = cache.splice(parser.parse_line(io), preparser) # replaces the tokens of the self-contained imports
+#   cache.rendered, cache.spliced, cache.fallbacks # statistics of the build
+#   cache = FragmentCache(environment, include="ssi") # pages get <!--#include virtual="/_fragments/..." -->
+#   cache.files # paths of the fragment files written
+#   cache.remove_stale_files() # removes the other fragment files of the folder, returns their paths
+
+import hashlib
+import os
+from collections import namedtuple
+from typing import Dict
+
+from bootstraparse.modules import syntax, context_mngr, error_mngr
+
+
+"""
+Named tuple holding a pre-rendered imported file: its html (top-level, and nested in another container), the number
+of lines it replaces, the number of empty lines before and after it left in the page, and the markers it opens.
+"""
+Fragment = namedtuple("Fragment", ["html", "nested_html", "lines", "lead", "trail", "markers"])
+
+"""
+Tags referencing a fragment file in include mode, by name of the mode.
+"""
+INCLUDE_TAGS = {
+    "ssi": '<!--#include virtual="{url}" -->',
+    "esi": '<esi:include src="{url}"/>',
+}
+
+
+def stale_files(folder, written):
+    """
+    Returns the fragment files of a folder that a build did not write.
+    :param folder: the path of the folder of the fragment files
+    :param written: the paths of the fragment files written by the build
+    :type folder: str
+    :type written: collections.abc.Iterable[str]
+    :rtype: list[str]
+    """
+    if not os.path.isdir(folder):
+        return []
+    written = {os.path.normpath(path) for path in written}
+    return sorted(path for path in (os.path.join(folder, name) for name in os.listdir(folder))
+                  if path.endswith(".html") and os.path.normpath(path) not in written)
+
+
+class FragmentCache:
+    """
+    Renders the self-contained imported files once and splices their html into the tokens of the pages.
+    """
+    def __init__(self, _env, include=None, folder="_fragments", base_url="/"):
+        """
+        :param _env: the environment of the build, its export manager renders the fragments
+        :param include: the include mode (see INCLUDE_TAGS), the html is inlined in the pages if None or "none"
+        :param folder: the folder of the fragment files, relative to the destination of the build
+        :param base_url: the url of the destination of the build on the server, used in the include tags
+        :type _env: bootstraparse.modules.environment.Environment
+        :type include: str | None
+        :type folder: str
+        :type base_url: str
+        """
+        self._env = _env
+        self._fragments = {}  # Text of the replaced block -> Fragment, None if the block is not self-contained
+        self.rendered = 0
+        self.spliced = 0
+        self.fallbacks = 0
+        if include in (None, "none"):
+            self.include_tag = None
+        elif include in INCLUDE_TAGS:
+            self.include_tag = INCLUDE_TAGS[include]
+        else:
+            error_mngr.log_exception(
+                ValueError(f"Unknown fragment include mode {include}, expected none or one of {list(INCLUDE_TAGS)}."),
+                level="CRITICAL"
+            )
+        self.folder = folder
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.files = []
+
+    def splice(self, tokens, preparser):
+        """
+        Replaces the tokens of the self-contained files imported by a page with their pre-rendered html.
+        :param tokens: the tokens of the page, as returned by parser.parse_line
+        :param preparser: the preparser of the page
+        :type tokens: list[syntax.SemanticType]
+        :type preparser: bootstraparse.modules.preparser.PreParser
+        :rtype: list[syntax.SemanticType]
+        """
+        if not preparser.replaced_imports:
+            return tokens
+        line_starts = [0]  # Index of the first token of each line
+        for index, token in enumerate(tokens):
+            if isinstance(token, syntax.Linebreak):
+                line_starts.append(index + 1)
+
+        output = []
+        opened: Dict[str, int] = {}
+        position = scanned = 0
+        for first_line, block, imported in preparser.replaced_imports:
+            start, end = line_starts[first_line], line_starts[first_line + block.output_lines]
+            if context_mngr.scan_matches(tokens[scanned:start], opened) is None:
+                break  # The context manager reports the error
+            scanned = start
+            fragment = self.fragment(block, tokens[start:end])
+            # A marker left open by the page would be closed by the same marker in the imported file
+            if fragment is None or any(opened.get(marker) for marker in fragment.markers):
+                self.fallbacks += 1
+                continue
+            if fragment.html is None:  # First page splicing it, the tokens are replaced and can be contextualised
+                fragment = self.render(block, fragment, tokens[start + fragment.lead:end - fragment.trail],
+                                       preparser, first_line, imported.name)
+            output += tokens[position:start + fragment.lead]
+            output.append(syntax.FragmentToken([fragment.html, fragment.nested_html, fragment.lines]))
+            position = scanned = end - fragment.trail
+            self.spliced += 1
+        return output + tokens[position:]
+
+    def fragment(self, block, tokens):
+        """
+        Returns the fragment of a replaced block, checks if it is self-contained on first use.
+        :param block: the replacements of the imported file
+        :param tokens: the tokens of the lines of the block in the page
+        :type block: bootstraparse.modules.preparser.ReplacedBlock
+        :type tokens: list[syntax.SemanticType]
+        :return: the fragment, without html until rendered, None if the imported file is not self-contained
+        :rtype: Fragment | None
+        """
+        if block.text not in self._fragments:
+            self._fragments[block.text] = self.analyse(tokens)
+        return self._fragments[block.text]
+
+    @staticmethod
+    def analyse(tokens):
+        """
+        Checks if the tokens of an imported file contextualise into closed containers, independently of the page.
+        :param tokens: the tokens of the lines of the imported file in the page
+        :type tokens: list[syntax.SemanticType]
+        :return: the fragment, without html, None if the tokens are not self-contained
+        :rtype: Fragment | None
+        """
+        lead = 0
+        while lead < len(tokens) and isinstance(tokens[lead], syntax.Linebreak):
+            lead += 1
+        trail = 0
+        while trail < len(tokens) - lead and isinstance(tokens[-1 - trail], syntax.Linebreak):
+            trail += 1
+        core = tokens[lead:len(tokens) - trail]
+        if (not core or isinstance(core[0], syntax.OptionalToken) or
+                core[0].label in context_mngr.LOOKAHEAD_LABELS or core[-1].label in context_mngr.LOOKAHEAD_LABELS):
+            return None
+        opened = context_mngr.scan_matches(core)
+        if opened is None or any(opened.values()):
+            return None
+        return Fragment(
+            html=None,
+            nested_html=None,
+            lines=sum(isinstance(token, syntax.Linebreak) for token in core),
+            lead=lead,
+            trail=trail,
+            markers=frozenset(token.counterpart() for token in core if isinstance(token, syntax.TokensToMatch)),
+        )
+
+    def render(self, block, fragment, core, preparser, first_line, name):
+        """
+        Contextualises and exports the tokens of a self-contained imported file on their own, once for the build.
+        In include mode, the html is written to the fragment files and the fragment holds the include tags.
+        :param block: the replacements of the imported file
+        :param fragment: the fragment returned by analyse
+        :param core: the tokens of the imported file, without its leading and trailing empty lines
+        :param preparser: the preparser of the page, giving the origin of the lines
+        :param first_line: the line of the page where the imported file starts (0-indexed)
+        :param name: the name of the imported file
+        :type block: bootstraparse.modules.preparser.ReplacedBlock
+        :type fragment: Fragment
+        :type core: list[syntax.SemanticType]
+        :type preparser: bootstraparse.modules.preparser.PreParser
+        :type first_line: int
+        :type name: str
+        :rtype: Fragment
+        """
+        def origin(line_number):
+            return preparser.line_origin(first_line + fragment.lead + line_number)
+
+        pile = context_mngr.ContextManager(core, name=preparser.name, origin=origin)()
+        parts = [container.export(self._env.export_mngr) for container in pile]
+        self.rendered += 1
+        html, nested_html = "".join(parts), " ".join(parts)
+        include_tag = self.include_tag
+        if include_tag is not None:
+            stem = f"{os.path.splitext(name)[0]}-{hashlib.sha256(html.encode()).hexdigest()[:12]}"
+            include = self.write_include(include_tag, stem, html)
+            nested_include = include if nested_html == html else \
+                self.write_include(include_tag, stem + ".nested", nested_html)
+            html, nested_html = include, nested_include
+        fragment = self._fragments[block.text] = fragment._replace(html=html, nested_html=nested_html)
+        return fragment
+
+    def write_include(self, include_tag, stem, html):
+        """
+        Writes the html of a fragment to its file and returns the tag including it.
+        :param include_tag: the format of the include tag (see INCLUDE_TAGS)
+        :param stem: the name of the file, without extension
+        :param html: the html of the fragment
+        :type include_tag: str
+        :type stem: str
+        :type html: str
+        :rtype: str
+        """
+        file_name = stem + ".html"
+        path = os.path.join(self._env.destination, self.folder, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as output_file:
+            output_file.write(html)
+        self.files.append(path)
+        return include_tag.format(url=f"{self.base_url}{self.folder}/{file_name}")
+
+    def remove_stale_files(self):
+        """
+        Removes the fragment files of the folder that the build did not write, left by previous builds.
+        Only a build of every page knows which files are still included.
+        :return: the paths of the files removed
+        :rtype: list[str]
+        """
+        stale = stale_files(os.path.join(self._env.destination, self.folder), self.files)
+        for path in stale:
+            os.remove(path)
+        return stale
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def __repr__(self):
+        return f"FragmentCache({self.rendered}/{len(self._fragments)} files rendered, {self.spliced} spliced, " \
+               f"{self.fallbacks} fallbacks)"
@@ -0,0 +1,305 @@
+# Persistent index of the imports between the files of a site
+# Every preparser reports the :: imports of its file when it scans it, the graph keeps them by path relative to the
+#   site, with the modification time and size of the file when scanned. When export.import_index names an index file,
+#   relative to the destination, it is saved there at the end of each build, and updated on the next one: the files
+#   scanned replace their entries, the files deleted from the site, and the partials no file imports anymore, are
+#   dropped. Queries only read the index. The index names the site relatively to its own folder, so it can be moved
+#   along with the site, but not published without it: point it outside the destination to keep it off the website.
+# Each shard of a sharded build saves the files it scanned to its own index, next to its manifest, and merging the
+#   shards merges their indexes into the index of the site.
+# Along with its imports, each file keeps the keys of the aliases config it uses, as 'shortcuts/name' or 'images/name'.
+#   The build saves as well the digest of the value of every alias and image, and of the rest of the configs and
+#   templates, so the next one knows which of them changed (see incremental).
+# The templates of the datasets are partials no file imports, the build names them so they are kept as well.
+# Usage:
+#   from bootstraparse.modules.importgraph import ImportGraph
+#   graph = ImportGraph.load(origin, index_path) # empty if there is no index yet, origin None to use the saved one
+#   graph.record(path, preparser.saved_import_list, preparser.used_aliases) # done by the preparsers when
+#     environment.import_graph is set
+#   graph.save() # prunes the deleted files and writes the index
+#   graph.update(ImportGraph.load(origin, shard_index_path)) # adds the files of the index of a shard
+#   graph.pages_including("_header.bpr") # the pages importing it, directly or not
+#   graph.dependencies("index.bpr") # every file it pulls in
+#   graph.most_shared(10) # the partials imported by the most pages
+#   graph.aliases_used("index.bpr") # the aliases and images used by the page and every file it pulls in
+#   graph.pages_using("shortcuts/site_name") # the pages using an alias, directly or through an import
+
+import json
+import os
+
+from bootstraparse.modules import error_mngr
+
+
+INDEX_VERSION = 3
+
+
+class ImportGraph:
+    """
+    Forward and reverse import graph of the files of a site, saved to and loaded from an index file.
+    """
+    def __init__(self, root, path):
+        """
+        :param root: the path of the site, the files are named relatively to it
+        :param path: the path of the index file
+        :type root: str
+        :type path: str
+        """
+        self.root = root
+        self.path = path
+        self.imports = {}  # File -> files it imports, in order
+        self.stamps = {}  # File -> (modification time in ns, size) when scanned
+        self.aliases = {}  # File -> keys of the aliases config it uses, sorted
+        self.context = None  # Digest of the configs and templates, without the aliases and images
+        self.digests = {}  # Key of the aliases config -> digest of its value
+        self.templates = set()  # Templates of the datasets, kept while they exist
+        self.recorded = set()  # Files scanned since the graph was created or loaded
+        self._reverse = None
+
+    @classmethod
+    def load(cls, root, path):
+        """
+        Loads the index file if it exists, an unreadable or outdated index is ignored.
+        :param root: the path of the site, the one saved in the index if None
+        :param path: the path of the index file
+        :type root: str | None
+        :type path: str
+        :rtype: ImportGraph
+        """
+        graph = cls(root, path)
+        if not os.path.exists(path):
+            return graph
+        try:
+            with open(path) as index_file:
+                index = json.load(index_file)
+            if index.get("version") != INDEX_VERSION:
+                raise ValueError(f"version {index.get('version')} instead of {INDEX_VERSION}")
+            if root is None:  # Saved relatively to the folder of the index
+                graph.root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(path)), index["root"]))
+            files, keys = index["files"], index["keys"]
+            for file, stamp, imports, aliases in zip(files, index["stamps"], index["imports"], index["aliases"]):
+                graph.stamps[file] = tuple(stamp)
+                graph.imports[file] = tuple(files[i] for i in imports)
+                graph.aliases[file] = tuple(keys[i] for i in aliases)
+            graph.context = index["context"]
+            graph.digests = dict(zip(keys, index["digests"]))
+            graph.templates = {files[i] for i in index["templates"]}
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            error_mngr.log_message(f"Ignoring the import index {path}: {e}.", level="WARNING")
+            graph.imports, graph.stamps, graph.aliases, graph.context, graph.digests = {}, {}, {}, None, {}
+            graph.templates = set()
+        return graph
+
+    def key(self, path):
+        """
+        Returns the name of a file in the graph: its path relative to the site, with / separators.
+        :type path: str
+        :rtype: str
+        """
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def record(self, path, import_list, aliases=()):
+        """
+        Replaces the imports of a file and the aliases it uses, once per build.
+        :param path: the path of the file
+        :param import_list: the imported files and the lines of the import statements, as saved by the preparser
+        :param aliases: the keys of the aliases config used by the file, as saved by the preparser
+        :type path: str
+        :type import_list: list[(str, int)]
+        :type aliases: collections.abc.Iterable[str]
+        """
+        key = self.key(path)
+        if key in self.recorded:
+            return
+        self.recorded.add(key)
+        stat = os.stat(path)
+        self.stamps[key] = (stat.st_mtime_ns, stat.st_size)
+        self.imports[key] = tuple(dict.fromkeys(self.key(imported) for imported, _ in import_list))
+        self.aliases[key] = tuple(sorted(aliases))
+        self._reverse = None
+
+    @property
+    def reverse(self):
+        """
+        File -> files importing it directly.
+        :rtype: dict[str, list[str]]
+        """
+        if self._reverse is None:
+            self._reverse = {}
+            for file in sorted(self.imports):
+                for imported in self.imports[file]:
+                    self._reverse.setdefault(imported, []).append(file)
+        return self._reverse
+
+    @staticmethod
+    def is_page(key):
+        """
+        Files starting with an underscore are partials, the others are built as pages.
+        :type key: str
+        :rtype: bool
+        """
+        return not key.rsplit("/", 1)[-1].startswith("_")
+
+    def resolve(self, name):
+        """
+        Returns the files of the graph matching a name: the file itself, or every file with that name in any folder.
+        :type name: str
+        :rtype: list[str]
+        """
+        name = name.replace(os.sep, "/")
+        if name in self.imports or name in self.reverse:
+            return [name]
+        return sorted(key for key in set(self.imports) | set(self.reverse) if key.endswith("/" + name))
+
+    @staticmethod
+    def walk(edges, key, transitive):
+        """
+        Returns the files reached from a file following edges, sorted.
+        :type edges: dict[str, list[str]]
+        :type key: str
+        :type transitive: bool
+        :rtype: list[str]
+        """
+        if not transitive:
+            return sorted(set(edges.get(key, ())))
+        reached = set()
+        to_visit = [key]
+        while to_visit:
+            for file in edges.get(to_visit.pop(), ()):
+                if file not in reached:
+                    reached.add(file)
+                    to_visit.append(file)
+        reached.discard(key)
+        return sorted(reached)
+
+    def dependencies(self, key, transitive=True):
+        """
+        Returns the files a file imports, directly or not.
+        :type key: str
+        :type transitive: bool
+        :rtype: list[str]
+        """
+        return self.walk(self.imports, key, transitive)
+
+    def dependents(self, key, transitive=True):
+        """
+        Returns the files importing a file, directly or not.
+        :type key: str
+        :type transitive: bool
+        :rtype: list[str]
+        """
+        return self.walk(self.reverse, key, transitive)
+
+    def pages_including(self, key, transitive=True):
+        """
+        Returns the pages importing a file, directly or not.
+        :type key: str
+        :type transitive: bool
+        :rtype: list[str]
+        """
+        return [file for file in self.dependents(key, transitive) if self.is_page(file)]
+
+    def most_shared(self, count):
+        """
+        Returns the partials imported by the most pages, with their number of pages.
+        :param count: the number of partials returned
+        :type count: int
+        :rtype: list[(str, int)]
+        """
+        shared = [(key, len(self.pages_including(key))) for key in self.reverse if not self.is_page(key)]
+        return sorted(shared, key=lambda item: (-item[1], item[0]))[:count]
+
+    def aliases_used(self, key):
+        """
+        Returns the keys of the aliases config used by a file and by every file it imports, directly or not.
+        :type key: str
+        :rtype: list[str]
+        """
+        used = set(self.aliases.get(key, ()))
+        for file in self.dependencies(key):
+            used.update(self.aliases.get(file, ()))
+        return sorted(used)
+
+    def pages_using(self, alias):
+        """
+        Returns the pages using a key of the aliases config, themselves or through the files they import.
+        :param alias: the key, as 'shortcuts/name' or 'images/name'
+        :type alias: str
+        :rtype: list[str]
+        """
+        files = [key for key, aliases in self.aliases.items() if alias in aliases]
+        pages = {file for file in files if self.is_page(file)}
+        for file in files:
+            pages.update(self.pages_including(file))
+        return sorted(pages)
+
+    def stale(self):
+        """
+        Returns the files modified or deleted since they were scanned, from their modification time and size only.
+        :rtype: list[str]
+        """
+        stale = []
+        for key, stamp in sorted(self.stamps.items()):
+            path = os.path.join(self.root, key)
+            if not os.path.exists(path) or (os.stat(path).st_mtime_ns, os.stat(path).st_size) != stamp:
+                stale.append(key)
+        return stale
+
+    def prune(self):
+        """
+        Drops the files deleted from the site, then the partials no file left imports, except the templates.
+        """
+        for key in list(self.imports):
+            if key not in self.recorded and not os.path.exists(os.path.join(self.root, key)):
+                del self.imports[key], self.stamps[key], self.aliases[key]
+        self._reverse = None
+        while True:
+            orphans = [key for key in self.imports
+                       if not self.is_page(key) and key not in self.reverse and key not in self.templates]
+            if not orphans:
+                break
+            for key in orphans:
+                del self.imports[key], self.stamps[key], self.aliases[key]
+            self._reverse = None
+
+    def save(self):
+        """
+        Prunes the graph and writes it to the index file.
+        """
+        self.prune()
+        files = sorted(set(self.imports) | set(self.reverse))
+        indexes = {file: i for i, file in enumerate(files)}
+        keys = sorted(set(self.digests).union(*self.aliases.values()))
+        key_indexes = {key: i for i, key in enumerate(keys)}
+        index = {
+            "version": INDEX_VERSION,
+            "root": os.path.relpath(self.root, os.path.dirname(os.path.abspath(self.path))).replace(os.sep, "/"),
+            "files": files,
+            "stamps": [list(self.stamps.get(file, (0, 0))) for file in files],
+            "imports": [[indexes[imported] for imported in self.imports.get(file, ())] for file in files],
+            "aliases": [[key_indexes[key] for key in self.aliases.get(file, ())] for file in files],
+            "keys": keys,
+            "digests": [self.digests.get(key) for key in keys],
+            "context": self.context,
+            "templates": [indexes[file] for file in sorted(self.templates) if file in indexes],
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as index_file:
+            json.dump(index, index_file, separators=(",", ":"))
+
+    def update(self, other):
+        """
+        Adds the files of another graph of the same site, their entries replacing the ones of the graph, and takes its
+        digests and templates.
+        :type other: ImportGraph
+        """
+        for key in other.imports:
+            self.imports[key], self.stamps[key], self.aliases[key] = other.imports[key], other.stamps[key], other.aliases[key]
+        self.context, self.digests = other.context, dict(other.digests)
+        self.templates |= other.templates
+        self._reverse = None
+
+    def __len__(self):
+        return len(self.imports)
+
+    def __repr__(self):
+        return f"ImportGraph({len(self.imports)} files, {sum(map(len, self.imports.values()))} imports)"
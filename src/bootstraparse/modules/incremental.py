@@ -0,0 +1,154 @@
+# Incremental builds: only the pages changed since the last build are built again
+# The import index (see importgraph) knows the imports of each file and the keys of the aliases config it uses, and
+#   keeps the digest of every alias and image of the last build, and of the rest of the configs and templates.
+# A page is built again if its html is missing, if it or a file it imports is new or changed, or if it uses an alias
+#   or image whose value changed, or which was added or removed. An edit of the aliases config only builds the pages
+#   using the keys edited, any other change of the configs, templates or version of bootstraparse builds every page.
+# The pages of a dataset are all built again under the same conditions for its template, or if one of them is
+#   missing. Its records are in the configs. The index must be enabled with export.import_index.
+# Usage:
+#   from bootstraparse.modules import incremental
+#   context, digests = incremental.config_digests(environment) # saved in the import index at the end of each build
+#   plan = incremental.plan(crawler, environment) # the pages and datasets to build, and why
+#   crawler.files = plan.files
+
+import hashlib
+import os
+from collections import namedtuple
+from collections.abc import Mapping
+
+import bootstraparse
+from bootstraparse.modules import datasets
+
+
+"""
+Named tuple holding the pages of an incremental build: the pages to build, as in SiteCrawler.files, the datasets to
+build, the reason each page or template of a dataset is built, by path relative to the site, and the number of pages
+and datasets left as they are.
+"""
+Plan = namedtuple("Plan", ["files", "datasets", "reasons", "skipped"])
+
+
+ALIAS_SECTIONS = ("shortcuts", "images")
+
+
+def digest(value):
+    """
+    :type value: object
+    :rtype: str
+    """
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:16]
+
+
+def read_sources(_config, skipped=()):
+    """
+    Returns the content of the files of a config by name, without parsing the names not looked up yet.
+    :param _config: the loaded config
+    :param skipped: the names left out
+    :type _config: bootstraparse.modules.config.ConfigLoader
+    :type skipped: tuple[str]
+    :rtype: list[(str, list[bytes])]
+    """
+    sources = []
+    for name, paths in sorted(_config.loaded_conf.sources.items()):
+        if name not in skipped:
+            contents = []
+            for path in paths:
+                with open(path, "rb") as source:
+                    contents.append(source.read())
+            sources.append((name, contents))
+    return sources
+
+
+def config_digests(_env):
+    """
+    Returns the digest of the configs and templates without the aliases and images, and the digest of each of them.
+    Only the aliases config is parsed, the other files are digested as they are.
+    :param _env: the environment of the build
+    :type _env: bootstraparse.modules.environment.Environment
+    :return: the digest of the context, and the digest of the value of each key of the aliases config by key
+    :rtype: (str, dict[str, str])
+    """
+    aliases = _env.config.loaded_conf.get("aliases")
+    digests = {}
+    if isinstance(aliases, Mapping):
+        for section in ALIAS_SECTIONS:
+            for name, value in (aliases.get(section) or {}).items():
+                digests[f"{section}/{name}"] = digest(value)
+        aliases = {section: value for section, value in aliases.items() if section not in ALIAS_SECTIONS}
+    context = digest((
+        bootstraparse.__version__, aliases, read_sources(_env.config, ("aliases",)), read_sources(_env.template)
+    ))
+    return context, digests
+
+
+def changed_aliases(old, new):
+    """
+    Returns the keys of the aliases config whose value changed, added or removed.
+    :type old: dict[str, str]
+    :type new: dict[str, str]
+    :rtype: set[str]
+    """
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+def reason(graph, key, destinations, stale, changed):
+    """
+    Returns why a page or the template of a dataset is built again, None if it is up to date.
+    :param graph: the import graph of the last build
+    :param key: the page or template, relative to the site
+    :param destinations: the paths of the html files it gives
+    :param stale: the files changed since the last build
+    :param changed: the keys of the aliases config changed since the last build
+    :type graph: bootstraparse.modules.importgraph.ImportGraph
+    :type key: str
+    :type destinations: list[str]
+    :type stale: set[str]
+    :type changed: set[str]
+    :rtype: str | None
+    """
+    if key not in graph.imports:
+        return "new"
+    if not all(os.path.exists(destination) for destination in destinations):
+        return "missing output"
+    if key in stale or not stale.isdisjoint(graph.dependencies(key)):
+        return "modified"
+    if not changed.isdisjoint(graph.aliases_used(key)):
+        return "aliases changed"
+    return None
+
+
+def plan(crawler, _env):
+    """
+    Returns the pages of the crawler and the datasets to build again since the last build saved to the import index.
+    :param crawler: the crawler of the site
+    :param _env: the environment of the build, with its import graph
+    :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+    :type _env: bootstraparse.modules.environment.Environment
+    :rtype: Plan
+    """
+    graph = _env.import_graph
+    context, digests = config_digests(_env)
+    all_datasets = datasets.load_datasets(_env)
+    if graph.context != context:
+        why = "new index" if graph.context is None else "configs changed"
+        files = list(crawler.files)
+        keys = [graph.key(os.path.join(crawler.initial_path, *file)) for file in files]
+        keys += [graph.key(dataset.template) for dataset in all_datasets]
+        return Plan(files, all_datasets, dict.fromkeys(keys, why), 0)
+    stale = set(graph.stale())
+    changed = changed_aliases(graph.digests, digests)
+    files, to_build, reasons = [], [], {}
+    for file, (path, destination) in zip(crawler.files, crawler.page_paths()):
+        key = graph.key(path)
+        why = reason(graph, key, [destination], stale, changed)
+        if why is not None:
+            files.append(file)
+            reasons[key] = why
+    for dataset in all_datasets:
+        key = graph.key(dataset.template)
+        why = reason(graph, key, datasets.page_paths(dataset, crawler.destination_path), stale, changed)
+        if why is not None:
+            to_build.append(dataset)
+            reasons[key] = why
+    return Plan(files, to_build, reasons, len(crawler.files) - len(files) + len(all_datasets) - len(to_build))
@@ -1,25 +1,86 @@
 # Main parser, gets config files and parses them for the context manager.
 # parse_line takes a io and outputs it all as a list of parsed elements
+# ParseCache remembers the tokens of the lines already parsed, as pickled bytes so every hit rebuilds fresh tokens
+#   (the context manager mutates them). Its size is set by parsing/cache_size in parser_config.
 # Usage:
-#   from bootstraparse.modules.parser import parse_line
+#   from bootstraparse.modules.parser import parse_line, ParseCache
 #   parse_line(io) -> [element, element, element]
+#   cache = ParseCache(1024)
+#   parse_line(io, cache) -> [element, element, element] # parses each distinct line only once
+#   cache.hit_rate() -> share of the lines found in the cache
 
+import pickle
+from collections import OrderedDict
 from io import StringIO
 
 import bootstraparse.modules.syntax as syntax
 
 
-def parse_line(io):
+class ParseCache:
+    """
+    Least recently used cache of the tokens parsed from a line, keyed by the text of the line.
+    """
+    def __init__(self, size=1024):
+        """
+        :param size: maximum number of lines remembered, 0 disables the cache
+        :type size: int
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __call__(self, line):
+        """
+        Returns fresh tokens for a line, parsing it only if it is not in the cache.
+        :param line: The line to parse.
+        :type line: str
+        :rtype: list[syntax.SemanticType]
+        """
+        frozen = self._entries.get(line)
+        if frozen is not None:
+            self.hits += 1
+            self._entries.move_to_end(line)
+            return pickle.loads(frozen)
+        self.misses += 1
+        tokens = syntax.line.parseString(line).asList()
+        if self.size > 0:
+            self._entries[line] = pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return tokens
+
+    def hit_rate(self):
+        """
+        Returns the share of the lookups found in the cache.
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"ParseCache({len(self._entries)}/{self.size} lines, {self.hits} hits, {self.misses} misses)"
+
+
+def parse_line(io, cache=None):
     """
     Takes an io string and returns the parsed output.
     :param io: The io string to parse.
+    :param cache: The cache of the lines already parsed, if any.
     :type io: StringIO
+    :type cache: ParseCache | None
     :return: The parsed output.
     :rtype: list[syntax.SemanticType]
     """
     output = []
     for line in io.readlines():
-        output += syntax.line.parseString(line).asList() + [syntax.Linebreak('')]
+        if cache is None:
+            output += syntax.line.parseString(line).asList() + [syntax.shared_token(syntax.Linebreak)]
+        else:
+            output += cache(line) + [syntax.shared_token(syntax.Linebreak)]
 
     return output
 
@@ -0,0 +1,181 @@
+# Asynchronous build pipeline overlapping the file reads and writes with the rendering of the pages
+# The pages go through three stages linked by bounded queues: the sources of the next pages are read and their html
+#   files created in executor threads, the current page is preparsed, parsed, contextualised and exported on the
+#   event loop, and the finished pages are written in executor threads. The queues hold depth pending reads and
+#   depth pending writes. The pages are rendered in order, one at a time: the stages sharing the caches of the build,
+#   and the counters, stay on the thread of the event loop.
+# Usage:
+#   from bootstraparse.modules.pipeline import Pipeline
+#   pipeline = Pipeline(crawler, render, write, depth=4)  # render(preparser, destination) -> html
+#   counters = pipeline.run()
+#   print(counters) # pages, bytes read and written, time spent in each stage and throughput
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+
+class PipelineCounters:
+    """
+    Throughput counters of a pipeline run. Times are in seconds, the read and write times add up over the threads.
+    """
+    def __init__(self):
+        self.pages = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.read_time = 0.0
+        self.render_time = 0.0
+        self.write_time = 0.0
+        self.wall_time = 0.0
+
+    def pages_per_second(self):
+        """
+        :rtype: float
+        """
+        return self.pages / self.wall_time if self.wall_time else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.pages} pages in {self.wall_time:.3f}s ({self.pages_per_second():.1f} pages/s), "
+            f"{self.bytes_read / 1024:.1f} KiB read in {self.read_time:.3f}s, "
+            f"{self.bytes_written / 1024:.1f} KiB written in {self.write_time:.3f}s, "
+            f"rendering {self.render_time:.3f}s"
+        )
+
+    def __repr__(self):
+        return f"PipelineCounters({self})"
+
+
+class Pipeline:
+    """
+    Builds the pages of a crawler, reading and writing the files in executor threads while the pages are rendered.
+    """
+    def __init__(self, crawler, render, write, depth=4, workers=None):
+        """
+        :param crawler: the crawler of the site, its pages are opened and closed by the pipeline
+        :param render: function returning the html of a page from its preparser and destination
+        :param write: function writing the html of a page to its destination
+        :param depth: maximum number of pages read ahead, and of pages waiting to be written
+        :param workers: number of executor threads, twice the depth by default
+        :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+        :type render: callable
+        :type write: callable
+        :type depth: int
+        :type workers: int | None
+        """
+        self.crawler = crawler
+        self.render = render
+        self.write = write
+        self.depth = max(1, depth)
+        self.workers = workers or 2 * self.depth
+        self.counters = PipelineCounters()
+
+    def run(self):
+        """
+        Runs the pipeline until every page is written.
+        :return: the counters of the run
+        :rtype: PipelineCounters
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bparse-io") as executor:
+            asyncio.run(self.run_stages(executor))
+        self.counters.wall_time = time.perf_counter() - start
+        return self.counters
+
+    async def run_stages(self, executor):
+        """
+        Runs the three stages, cancels the others as soon as one fails.
+        :param executor: the executor of the reads and writes
+        :type executor: ThreadPoolExecutor
+        """
+        # Pending reads: (index, preparser, future of the read), then None; pending writes: futures, then None
+        reads: "asyncio.Queue[Optional[Tuple[int, Any, asyncio.Future[Tuple[str, int, float]]]]]" = asyncio.Queue(self.depth)
+        writes: "asyncio.Queue[Optional[asyncio.Future[Tuple[int, float]]]]" = asyncio.Queue(self.depth)
+        tasks = [
+            asyncio.ensure_future(self.reader(executor, reads)),
+            asyncio.ensure_future(self.renderer(executor, reads, writes)),
+            asyncio.ensure_future(self.writer(writes)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def reader(self, executor, reads):
+        """
+        Opens the pages in order and starts reading them, the queue holds the pending reads.
+        :type executor: ThreadPoolExecutor
+        :type reads: asyncio.Queue
+        """
+        loop = asyncio.get_running_loop()
+        for index, (path, destination) in enumerate(self.crawler.page_paths()):
+            pp = self.crawler.open_page(path)
+            await reads.put((index, pp, loop.run_in_executor(executor, self.read, pp, destination)))
+        await reads.put(None)
+
+    def read(self, pp, destination):
+        """
+        Executor thread: creates the html file of a page and reads its source.
+        :type pp: bootstraparse.modules.preparser.PreParser
+        :type destination: str
+        :return: the destination of the page, the size of its source and the duration of the read
+        :rtype: (str, int, float)
+        """
+        start = time.perf_counter()
+        destination = self.crawler.create_file(destination)
+        pp.get_source_buffer()
+        return destination, os.path.getsize(pp.path), time.perf_counter() - start
+
+    async def renderer(self, executor, reads, writes):
+        """
+        Renders the pages in order once read, and starts writing them, the queue holds the pending writes.
+        :type executor: ThreadPoolExecutor
+        :type reads: asyncio.Queue
+        :type writes: asyncio.Queue
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await reads.get()
+            if item is None:
+                break
+            index, pp, read = item
+            destination, size, duration = await read
+            self.counters.bytes_read += size
+            self.counters.read_time += duration
+            start = time.perf_counter()
+            html = self.render(pp, destination)
+            self.counters.render_time += time.perf_counter() - start
+            self.crawler.close_page(index, pp)
+            await writes.put(loop.run_in_executor(executor, self.write_page, html, destination))
+        await writes.put(None)
+
+    def write_page(self, html, destination):
+        """
+        Executor thread: writes the html of a page.
+        :type html: str
+        :type destination: str
+        :return: the size of the html and the duration of the write
+        :rtype: (int, float)
+        """
+        start = time.perf_counter()
+        self.write(html, destination)
+        return len(html.encode()), time.perf_counter() - start
+
+    async def writer(self, writes):
+        """
+        Waits for the pending writes in order.
+        :type writes: asyncio.Queue
+        """
+        while True:
+            write = await writes.get()
+            if write is None:
+                break
+            size, duration = await write
+            self.counters.bytes_written += size
+            self.counters.write_time += duration
+            self.counters.pages += 1
@@ -6,22 +6,306 @@
 #   pp.do_replacements() # replaces all images and shortcuts in the file
 #   pp.readlines() # returns the lines of ORIGINAL file
 #   pp.get_all_lines() # returns the lines of the file after replacements and imports
+#   pp.line_origin(n) # returns the (file, line) the nth line of the file after replacements comes from
+#   AliasTable(enviroment) # compiles the aliases and images of the config once, shared by all the preparsers
+#   pp.replaced_block() # returns the replacements of an imported file, computed once per content and alias config
+#   ImportCache(size) # dictionary of the imported preparsers, shared by the pages, keeping the size last used ones
+#   ReplacementCache(size) # replaced blocks of the imported files, shared by the pages, keeping the size last used ones
+#   resolve_imports(preparsers) # resolves the imports of several files at once, returns them in topological order
 
 
+import copy
+import hashlib
 import os
+import re
+import string
+from bisect import bisect_right
+from collections import namedtuple
 from io import StringIO
+from typing import Any, FrozenSet, List, Optional, OrderedDict, Set, Tuple, Union
 
 from bootstraparse.modules import pathresolver as pr
 from bootstraparse.modules import environment
 from bootstraparse.modules import syntax
 from bootstraparse.modules import error_mngr
 from bootstraparse.modules import export
+from bootstraparse.modules import rope
 
 import rich
 from rich.tree import Tree
 
-# list of regexps
-_rgx_import_file = syntax.rgx_import_file
+# list of scanners
+_scan_preparse_line = syntax.scan_preparse_line
+_scan_markers = syntax.scan_markers
+_marker_sections = {"image": "images", "alias": "shortcuts"}
+_rgx_field_index = re.compile(r"[0-9]+")
+
+
+"""
+Named tuple holding the replacements of a whole expanded file: the text, its number of lines before and after
+the replacements, and its anchors (see PreParser.replacement_anchors), relative to the start of the file.
+"""
+ReplacedBlock = namedtuple("ReplacedBlock", ["text", "input_lines", "output_lines", "anchors"])
+
+
+class ImportCache(OrderedDict[str, Any]):
+    """
+    Dictionary of the imported files and their preparsers, evicting the least recently used ones above a given size.
+    An evicted preparser is simply created and expanded again by the next file importing it, its replaced block is
+    dropped from the replacement cache right away (see PreParser.release_block).
+    """
+    def __init__(self, size=0):
+        """
+        :param size: maximum number of preparsers kept, 0 for no limit
+        :type size: int
+        """
+        super().__init__()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the preparser of an imported file and marks it as recently used, counting hits and misses.
+        :param key: path of the imported file
+        :param default: value returned if the file is not in the cache
+        :type key: str
+        :rtype: PreParser
+        """
+        if key in self:
+            self.hits += 1
+            self.move_to_end(key)
+            return self[key]
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while 0 < self.size < len(self):
+            self.evict(self.popitem(last=False)[1])
+            self.evictions += 1
+
+    def evict(self, value):
+        """
+        Called with each value evicted from the cache: drops the replaced block of an evicted preparser.
+        Its buffers are kept, the files importing it may still share it.
+        :param value: the evicted value
+        :type value: PreParser
+        """
+        if isinstance(value, PreParser):
+            value.release_block()
+
+    def __repr__(self):
+        return f"ImportCache({len(self)}/{self.size or 'unlimited'} files, {self.hits} hits, " \
+               f"{self.misses} misses, {self.evictions} evictions)"
+
+
+class ReplacementCache(ImportCache):
+    """
+    Replaced blocks of the imported files (see PreParser.replaced_block), evicting the least recently used ones above a
+    given size. An evicted block is simply replaced again by the next file importing it.
+    """
+    def __init__(self, size=256):
+        """
+        :param size: maximum number of blocks kept, 0 for no limit
+        :type size: int
+        """
+        super().__init__(size)
+
+    def __repr__(self):
+        return f"ReplacementCache({len(self)}/{self.size or 'unlimited'} blocks, {self.hits} hits, " \
+               f"{self.misses} misses, {self.evictions} evictions)"
+
+
+class PreparedFormat:
+    """
+    Format string of an alias or image, parsed once instead of at each str.format call.
+    Strings without any replacement field are resolved to a constant,
+    strings with fields other than {}, {0} or {name} are left to str.format.
+    """
+    def __init__(self, message):
+        """
+        :param message: the format string from the config
+        :type message: str
+        """
+        self.message = message
+        self.constant: Optional[str] = None
+        self.pieces: Optional[List[Tuple[str, Union[int, str, None]]]] = None  # (literal, None, an index or a name)
+        if not isinstance(message, str):
+            return
+        try:
+            parsed = list(string.Formatter().parse(message))
+        except ValueError:  # Left to str.format to raise at use
+            return
+        pieces: List[Tuple[str, Union[int, str, None]]] = []
+        automatic, manual = 0, False
+        for literal, field, spec, conversion in parsed:
+            if field is None:
+                pieces.append((literal, None))
+                continue
+            if spec or conversion:
+                return
+            key: Union[int, str] = field
+            if field == "":
+                key = automatic
+                automatic += 1
+            elif _rgx_field_index.fullmatch(field):
+                key = int(field)
+                manual = True
+            elif not field.isidentifier():
+                return
+            pieces.append((literal, key))
+        if automatic and manual:  # Mixing {} and {0} is an error for str.format
+            return
+        if all(field is None for _, field in pieces):
+            self.constant = "".join(literal for literal, _ in pieces)
+        else:
+            self.pieces = pieces
+
+    def __call__(self, var_list, var_dict):
+        """
+        Formats the message with the variables given, with the same output as PreParser.make_replacements.
+        :param var_list: the list of variables to replace in the message
+        :type var_list: list[str]
+        :param var_dict: the dictionary of variables to replace in the message
+        :type var_dict: dict[str, str]
+        :rtype: str
+        """
+        if self.constant is not None:
+            return self.constant
+        if self.pieces is None:
+            return PreParser.make_replacements(self.message, *var_list, **var_dict)
+        output = []
+        try:
+            for literal, field in self.pieces:
+                output.append(literal)
+                if field is not None:
+                    output.append(format(var_list[field] if type(field) is int else var_dict[field]))
+        except (KeyError, IndexError):  # Logs the same warning as make_replacements
+            return PreParser.make_replacements(self.message, *var_list, **var_dict)
+        return "".join(output)
+
+
+class AliasTable:
+    """
+    Flat lookup tables of the aliases.shortcuts and aliases.images sections of the config,
+    compiled once per build into prepared formats and shared by every PreParser through the environment.
+    """
+    def __init__(self, _env):
+        """
+        :param _env: the environment object, providing the config and the export manager
+        :type _env: environment.Environment
+        """
+        self.shortcuts = self.compile_section(_env.config, 'shortcuts')
+        self.images = self.compile_section(_env.config, 'images')
+        self.fingerprint = self.make_fingerprint(_env)
+
+        # Images without optionals always give the same html
+        image_start, image_end = _env.export_mngr(export.ExportRequest('inline_elements', 'image', None))
+        self.bare_images = {
+            name: image_start + prepared.constant + image_end
+            for name, prepared in self.images.items() if prepared.constant is not None
+        }
+
+    @staticmethod
+    def make_fingerprint(_env):
+        """
+        Returns a hash of everything the replacements depend on: the aliases config and the image template.
+        :param _env: the environment object, providing the config and the templates
+        :type _env: environment.Environment
+        :rtype: str
+        """
+        aliases = _env.config.loaded_conf.get('aliases')
+        try:
+            image_template = _env.export_mngr.templates.loaded_conf['bootstrap']['inline_elements']['image']
+        except (KeyError, TypeError):
+            image_template = None
+        return hashlib.sha256(repr((aliases, image_template)).encode()).hexdigest()
+
+    def with_shortcuts(self, shortcuts):
+        """
+        Returns a copy of the table with more aliases, its fingerprint accounting for them.
+        :param shortcuts: the messages of the aliases to add, by name
+        :type shortcuts: dict[str, str]
+        :rtype: AliasTable
+        """
+        table = copy.copy(self)
+        table.shortcuts = {**self.shortcuts, **{name: PreparedFormat(message) for name, message in shortcuts.items()}}
+        table.fingerprint = hashlib.sha256(repr((self.fingerprint, sorted(shortcuts.items()))).encode()).hexdigest()
+        return table
+
+    @staticmethod
+    def compile_section(_config, section):
+        """
+        Compiles a section of the aliases config, returns an empty table if the section is missing
+        (PreParser.get_element_from_config raises the appropriate error when an element is requested).
+        :param _config: the loaded config
+        :type _config: config.ConfigLoader
+        :param section: name of the section in the aliases config
+        :type section: str
+        :rtype: dict[str, PreparedFormat]
+        """
+        try:
+            elements = _config.loaded_conf['aliases'][section]
+        except (KeyError, TypeError):
+            return {}
+        return {str(name): PreparedFormat(message) for name, message in elements.items()}
+
+
+def resolve_imports(preparsers):
+    """
+    Resolves the imports of files at once, following them in an iterative depth-first search.
+    Creates the preparser of each imported file once, shared through the dictionary of imports of the files.
+    The files on the current branch of the search are kept in a set, an import of one of them closes a cycle:
+    the search goes on without it, and every cycle found is reported at the end.
+    :param preparsers: the preparsers of the files, usually the pages of a site, each one resolved before the next
+    :type preparsers: collections.abc.Iterable[PreParser]
+    :raises RecursionError: listing every import cycle found
+    :return: the files resolved, in topological order: each one after every file it imports
+    :rtype: list[PreParser]
+    """
+    order = []
+    cycles = []
+    for root in preparsers:
+        if root.is_global_dict_of_imports_initialized:
+            continue
+        branch = [root.list_of_paths[-1]]
+        on_branch = {branch[0]: 0}  # Path -> position in the branch
+        stack = [(root, iter(root.parse_import_list()))]
+        while stack:
+            pp, imports = stack[-1]
+            for e, l in imports:
+                if e in on_branch:
+                    cycles.append(branch[on_branch[e]:] + [e])
+                    continue
+                imported = pp.global_dict_of_imports.get(e)
+                if imported is None:
+                    try:
+                        imported = PreParser(e, pp._env, dict_of_imports=pp.global_dict_of_imports)
+                        imported.parse_import_list()
+                    except FileNotFoundError:
+                        error_mngr.log_exception(
+                            ImportError("The import {} in file {} line {} doesn't exist".format(e, pp.name, l))
+                        )
+                    pp.global_dict_of_imports[e] = imported
+                pp.local_dict_of_imports[e] = imported
+                if not imported.is_global_dict_of_imports_initialized:
+                    on_branch[e] = len(branch)
+                    branch.append(e)
+                    stack.append((imported, iter(imported.parse_import_list())))
+                    break
+            else:
+                stack.pop()
+                del on_branch[branch.pop()]
+                pp.is_global_dict_of_imports_initialized = True
+                order.append(pp)
+    if cycles:
+        error_mngr.log_exception(RecursionError(
+            f"Error: {len(cycles)} import cycles: " + "; ".join(" -> ".join(cycle) for cycle in cycles)
+        ), level='CRITICAL')
+    return order
 
 
 class PreParser:
@@ -58,15 +342,25 @@ class PreParser:
         self.global_dict_of_imports = dict_of_imports
         self.local_dict_of_imports = {}  # Dictionary of all local imports made to avoid duplicate file opening ?
         self.saved_import_list = None
+        self.used_aliases: FrozenSet[str] = frozenset()  # Keys of the aliases config used by the file itself, as 'section/name'
 
         # The tree view of the import tree (if saved)
         self.tree_view = None
 
+        # Original file, read once
+        self.source_buffer = None
+
         # Temporary files, or streams
-        self.file_with_all_imports = None
+        self.file_with_all_imports: Any = None  # rope.Rope, None once released
         self.file_with_all_replacements = None
+        self.import_spans = []  # (first segment, end segment, preparser) of each import in file_with_all_imports
+        self.replaced_imports = []  # (first line, ReplacedBlock, preparser) of each import replaced as a whole
+        self.replacement_key = None  # Key of the replaced block of the file in the replacement cache, once computed
         self.make_temporary_files()
 
+        # Compiled aliases and images, shared by the whole build
+        self.alias_table = None
+
         # File you are supposed to read from
         self.current_origin_for_read = None
 
@@ -78,9 +372,13 @@ class PreParser:
     def make_temporary_files(self):
         """
         Creates temporary files for the import list and the replacement.
+        The file with all imports is a rope referencing the lines of the original files.
         """
-        self.file_with_all_imports = StringIO()
+        self.file_with_all_imports = rope.Rope()
         self.file_with_all_replacements = StringIO()
+        self.replacement_anchors: Tuple[List[int], List[Tuple[int, int]]] = ([], [])
+        self.import_spans = []
+        self.replaced_imports = []
         self.imports_done = False
         self.replacements_done = False
 
@@ -91,11 +389,32 @@ class PreParser:
         """
         self.make_temporary_files()
 
+    def release(self):
+        """
+        Drops the buffers of the preparser once it is not needed anymore, so that the garbage collector can free them.
+        Its replaced block is dropped from the replacement cache as well.
+        """
+        self.release_block()
+        self.source_buffer = None
+        self.file_with_all_imports = None
+        self.file_with_all_replacements = None
+        self.current_origin_for_read = None
+        self.local_dict_of_imports = {}
+        self.replaced_imports = []
+
+    def release_block(self):
+        """
+        Drops the replaced block of the file from the replacement cache, if it was computed.
+        """
+        if self.replacement_key is not None and self._env.replacement_cache is not None:
+            self._env.replacement_cache.pop(self.replacement_key, None)
+            self.replacement_key = None
+
     def do_imports(self):
         """
         Execute all actions needed to do the imports and setup for the next step
-        :return: The file descriptor of the file with all imports
-        :rtype: StringIO
+        :return: The rope of the file with all imports
+        :rtype: rope.Rope
         """
         self.parse_import_list()
         self.make_import_list()
@@ -114,14 +433,23 @@ class PreParser:
         self.current_origin_for_read = self.file_with_all_replacements
         return self.current_origin_for_read
 
+    def get_source_buffer(self):
+        """
+        Reads the original file once and keeps its lines for every later use.
+        :return: the buffer holding the lines of the original file
+        :rtype: rope.SourceBuffer
+        """
+        if self.source_buffer is None:
+            self.source_buffer = rope.SourceBuffer.from_file(self.relative_path_resolver(self.name))
+        return self.source_buffer
+
     def readlines(self):
         """
         Reads the original file and returns a list of lines.
         :return: a list of lines
         :rtype: list[str]
         """
-        with open(self.relative_path_resolver(self.name), 'r') as f:
-            return f.readlines()
+        return list(self.get_source_buffer().lines)
 
     def get_all_lines(self):
         """
@@ -138,32 +466,12 @@ class PreParser:
         """
         Creates a list of all files to be imported.
         Makes sure that the files are not already imported through a previous import statement.
-        Recursively build a list of PreParser object for each file to be imported.
+        Builds a PreParser object for each file to be imported, directly or not (see resolve_imports).
         :return: the dictionary of all files to be imported (key: file name, value: PreParser object)
         :rtype: dict[str, PreParser]
         """
-        import_list = self.parse_import_list()
-        if self.is_global_dict_of_imports_initialized:
-            return self.local_dict_of_imports
-
-        for e, l in import_list:
-            if e in self.list_of_paths:
-                error_mngr.log_exception(
-                    RecursionError(f"Error: {e} was imported earlier in {self.list_of_paths}"), level='CRITICAL'
-                )
-            if e in self.global_dict_of_imports:
-                self.local_dict_of_imports[e] = self.global_dict_of_imports[e]
-            else:
-                try:
-                    pp = PreParser(e, self._env, self.list_of_paths.copy(), self.global_dict_of_imports)
-                    self.global_dict_of_imports[e] = pp
-                    pp.make_import_list()
-                    self.local_dict_of_imports[e] = pp
-                except FileNotFoundError:
-                    error_mngr.log_exception(
-                        ImportError("The import {} in file {} line {} doesn't exist".format(e, self.name, l))
-                    )
-        self.is_global_dict_of_imports_initialized = True
+        if not self.is_global_dict_of_imports_initialized:
+            resolve_imports([self])
         return self.local_dict_of_imports
 
     def parse_import_list(self):
@@ -172,53 +480,92 @@ class PreParser:
         :return: a list of files to be imported, and the line number of the import statement
         :rtype: list[(str, int)]
         """
-        if self.saved_import_list:
-            return self.saved_import_list
+        if self.saved_import_list is None:
+            self.scan_source()
+        return self.saved_import_list
+
+    def scan_source(self):
+        """
+        Scans the original file in a single pass for import statements and image or alias markers.
+        Saves the import list and marks the lines to replace in the source buffer,
+        so that lines without markers can be copied as they are by parse_shortcuts_and_images.
+        The images and aliases of the marked lines are saved as well, and reported with the imports to the import graph.
+        :return: a list of files to be imported, and the line number of the import statement
+        :rtype: list[(str, int)]
+        """
+        source = self.get_source_buffer()
         import_list = []
-        line_count = 0
-
-        for line in self.readlines():
-            results = _rgx_import_file.searchString(line)
-            if results:
-                for e in results[0]:
-                    import_list += [(e.rstrip(), line_count)]
-            line_count += 1
+        marked_lines = set()
+        used_aliases: Set[str] = set()
+        for line_count, line in enumerate(source.lines):
+            imports, has_markers = _scan_preparse_line(line)
+            for e in imports:
+                import_list.append((e, line_count))
+            if has_markers:
+                marked_lines.add(line_count)
+                used_aliases.update(f"{_marker_sections[kind]}/{name}" for kind, name in _scan_markers(line))
+        source.marked_lines = frozenset(marked_lines)
+        self.used_aliases = frozenset(used_aliases)
         # converts relative paths to absolute and returns a table
         self.saved_import_list = [(self.relative_path_resolver(p), l) for p, l in import_list]
+        if self._env.import_graph is not None:
+            self._env.import_graph.record(
+                self.relative_path_resolver(self.name), self.saved_import_list, self.used_aliases
+            )
         return self.saved_import_list
 
     def export_with_imports(self):
         """
-        Return the file object with all file imports done
-        :return: a filelike object with all file imports done
-        :rtype: StringIO
+        Return the file object with all file imports done.
+        The imported files are referenced in the rope, not copied, whatever the depth of the imports.
+        They are expanded first, in topological order, so each one is expanded once before the files importing it.
+        The rope is frozen once built, every importer then shares it as is.
+        :return: a frozen rope with all file imports done
+        :rtype: rope.Rope
         """
         self.make_import_list()
+        if not self.imports_done:
+            for pp in self.expansion_order():
+                pp.expand_imports()
+        return self.file_with_all_imports
+
+    def expansion_order(self):
+        """
+        Returns the files left to expand among this one and its imports, each one after the files it imports.
+        :rtype: list[PreParser]
+        """
+        order = []
+        seen = {id(self)}
+        stack = [(self, iter(self.local_dict_of_imports.values()))]
+        while stack:
+            pp, imports = stack[-1]
+            for imported in imports:
+                if id(imported) not in seen and not imported.imports_done:
+                    seen.add(id(imported))
+                    stack.append((imported, iter(imported.local_dict_of_imports.values())))
+                    break
+            else:
+                stack.pop()
+                order.append(pp)
+        return order
 
-        # If the imports are already done, reset the cursor position and return the file
-        # We could also decide to duplicate the file instead of resetting the cursor
-        if self.imports_done:
-            self.file_with_all_imports.seek(0)
-            error_mngr.log_message(
-                level='INFO',
-                message=f'Imports were already done on {self.path}, returning as is;'
-                        f' rewound to the beginning of the file.'
-            )
-            return self.file_with_all_imports
-
-        temp_file = self.file_with_all_imports
+    def expand_imports(self):
+        """
+        Builds the rope of the file with all imports from the ropes of the files it imports, already expanded.
+        :rtype: rope.Rope
+        """
+        expanded = self.file_with_all_imports
+        source = self.get_source_buffer()
         source_line_count = 0
-        import_list = self.parse_import_list()
-        source_lines = self.readlines()
-        for import_path, import_line in import_list:
-            source_lines[import_line] = ""  # remove the line where the import was
-            temp_file.writelines(source_lines[source_line_count:import_line])  # copy origin to destination
-            source_line_count = import_line  # update origin for next import
-            import_file = self.global_dict_of_imports[import_path].export_with_imports()
-            temp_file.writelines(import_file.readlines())
-        temp_file.writelines(source_lines[source_line_count:])
-        temp_file.seek(0)
-        self.current_origin_for_read = temp_file
+        for import_path, import_line in self.parse_import_list():
+            expanded.append(source, source_line_count, import_line)  # reference origin up to the import
+            source_line_count = import_line + 1  # skip the line where the import was
+            imported = self.local_dict_of_imports[import_path]
+            first_segment = len(expanded.segments)
+            expanded.extend(imported.file_with_all_imports)
+            self.import_spans.append((first_segment, len(expanded.segments), imported))
+        expanded.append(source, source_line_count, len(source))
+        self.current_origin_for_read = expanded.freeze()
         self.imports_done = True
         return self.current_origin_for_read
 
@@ -226,25 +573,141 @@ class PreParser:
         """
         Parses through the output files from export_with_imports
         and replaces shortcuts and images calls with appropriate html
+        Lines without any marker are copied as the parser would output them, without parsing.
+        Imported files made of whole lines are not parsed again, their replacements come from replaced_block.
+        Replacements spanning several lines are recorded in self.replacement_anchors for line_origin,
+        the imported files replaced as a whole in self.replaced_imports.
         :return: The file descriptor of the file with all replacements
         :rtype: StringIO
         """
-        temp_file = self.file_with_all_imports
+        self.replaced_imports = []
+        self.replacement_anchors = self.replace_expanded(self.file_with_all_replacements, self.replaced_imports)[2]
+        self.file_with_all_replacements.seek(0)
+        self.replacements_done = True
+        return self.file_with_all_replacements
+
+    def replace_expanded(self, output, blocks=None):
+        """
+        Writes the file with all imports, with the replacements done, to output.
+        :param output: where to write
+        :param blocks: list completed with the first line, the block and the preparser of each import replaced as a
+            whole, if given
+        :type output: StringIO
+        :type blocks: list[(int, ReplacedBlock, PreParser)] | None
+        :return: the number of lines before and after the replacements, and the anchors of multi-line replacements
+        :rtype: (int, int, (list[int], list[(int, int)]))
+        """
+        expanded = self.file_with_all_imports
+        anchors: Tuple[List[int], List[Tuple[int, int]]] = ([], [])
+        input_line, output_line = 0, 0
+        segment = 0
+        for first_segment, end_segment, imported in self.import_spans:
+            # An imported file can be replaced on its own if it starts and ends on complete lines
+            if first_segment == end_segment or not (expanded.ends_line(first_segment) and
+                                                    expanded.ends_line(end_segment)):
+                continue
+            input_line, output_line = self.replace_lines(
+                expanded.sub_rope(segment, first_segment), output, anchors, input_line, output_line
+            )
+            block = imported.replaced_block()
+            if blocks is not None:
+                blocks.append((output_line, block, imported))
+            output.write(block.text)
+            for start, (block_input_line, block_size) in zip(*block.anchors):
+                anchors[0].append(output_line + start)
+                anchors[1].append((input_line + block_input_line, block_size))
+            input_line += block.input_lines
+            output_line += block.output_lines
+            segment = end_segment
+        input_line, output_line = self.replace_lines(
+            expanded.sub_rope(segment, len(expanded.segments)), output, anchors, input_line, output_line
+        )
+        return input_line, output_line, anchors
+
+    def replace_lines(self, lines, output, anchors, input_line, output_line):
+        """
+        Writes the lines of a rope to output, with the replacements done.
+        :param lines: the lines to replace
+        :param output: where to write
+        :param anchors: the anchors of multi-line replacements, completed in place
+        :param input_line: number of the first line of the rope in the file before the replacements
+        :param output_line: number of the first line of the rope in the file after the replacements
+        :type lines: rope.Rope
+        :type output: StringIO
+        :type anchors: (list[int], list[(int, int)])
+        :type input_line: int
+        :type output_line: int
+        :return: the numbers of the lines following the rope, before and after the replacements
+        :rtype: (int, int)
+        """
         temp_text = ''
-        for line in temp_file.readlines():
+        for line, marked in lines.marked_readlines():
+            if not marked:  # Same output as the rest_of_line text token, without the parsing
+                output.write((line[:-1] if line[-1:] == "\n" else line).expandtabs())
+                output.write("\n")
+                input_line += 1
+                output_line += 1
+                continue
             line_match = syntax.line_to_replace.parse_string(line)
+            added_lines = 0
             for match in line_match:
                 if match.label == 'text':
-                    temp_text = match.content.text
+                    temp_text = match.content[0]
                 elif match.label == 'image':
-                    temp_text = self.get_image_from_config(match.content.image_name, match.content.optional)
+                    temp_text = self.get_image_from_config(match.image_name, match.optional)
                 elif match.label == 'alias':
-                    temp_text = self.get_alias_from_config(match.content.alias_name, match.content.optional)
-                self.file_with_all_replacements.write(temp_text)
-            self.file_with_all_replacements.write("\n")
-        self.file_with_all_replacements.seek(0)
-        self.replacements_done = True
-        return self.file_with_all_replacements
+                    temp_text = self.get_alias_from_config(match.alias_name, match.optional)
+                added_lines += temp_text.count("\n")
+                output.write(temp_text)
+            output.write("\n")
+            if added_lines:
+                anchors[0].append(output_line)
+                anchors[1].append((input_line, added_lines + 1))
+            input_line += 1
+            output_line += added_lines + 1
+        return input_line, output_line
+
+    def replaced_block(self):
+        """
+        Returns the replacements of the whole file with all imports, computed once per content and alias config:
+        the blocks are shared through the environment, keyed by the hash of the expanded text and the fingerprint
+        of the aliases, so every file importing this one reuses them, as long as the cache keeps them.
+        :rtype: ReplacedBlock
+        """
+        text = self.export_with_imports().read()
+        key = self.replacement_key = (hashlib.sha256(text.encode()).hexdigest(), self.get_alias_table().fingerprint)
+        if self._env.replacement_cache is None:
+            self._env.replacement_cache = ReplacementCache()
+        block = self._env.replacement_cache.get(key)
+        if block is None:
+            output = StringIO()
+            input_lines, output_lines, anchors = self.replace_expanded(output)
+            block = self._env.replacement_cache[key] = ReplacedBlock(output.getvalue(), input_lines, output_lines, anchors)
+        return block
+
+    def line_origin(self, line_number):
+        """
+        Returns the file and line a line of the file after replacements comes from.
+        Lines added by a multi-line alias are attributed to the line of the alias.
+        :param line_number: number of the line (1-indexed, as counted by the context manager)
+        :type line_number: int
+        :return: the path of the original file and the number of the line in it (1-indexed)
+        :rtype: rope.LineOrigin
+        """
+        index = line_number - 1
+        starts, blocks = self.replacement_anchors
+        i = bisect_right(starts, index) - 1
+        if i >= 0:
+            input_line, block_size = blocks[i]
+            if index < starts[i] + block_size:
+                index = input_line
+            else:
+                index = input_line + 1 + index - starts[i] - block_size
+        try:
+            origin = self.file_with_all_imports.origin(index)
+        except IndexError:  # Lines past the end of the file (trailing linebreaks)
+            return rope.LineOrigin(self.path, line_number)
+        return rope.LineOrigin(origin.file_name, origin.line_number + 1)
 
     def get_element_from_config(self, *list_keys):
         """
@@ -288,6 +751,17 @@ class PreParser:
             )
             return message
 
+    def get_alias_table(self):
+        """
+        Returns the compiled aliases of the environment, compiles them if no one did it yet.
+        :rtype: AliasTable
+        """
+        if self.alias_table is None:
+            if self._env.alias_table is None:
+                self._env.alias_table = AliasTable(self._env)
+            self.alias_table = self._env.alias_table
+        return self.alias_table
+
     def get_alias_from_config(self, shortcut, optionals):
         """
         Returns the alias from the config and makes the replacements with the options provided
@@ -298,10 +772,14 @@ class PreParser:
         :return: the html to insert as a string
         :rtype: str
         """
-        output = self.get_element_from_config('aliases', 'shortcuts', shortcut)
+        prepared = self.get_alias_table().shortcuts.get(shortcut)
+        if prepared is None:
+            return self.make_replacements(self.get_element_from_config('aliases', 'shortcuts', shortcut))
+        if prepared.constant is not None:
+            return prepared.constant
         _, _, var_list, var_dict = syntax.split_optionals(optionals)
 
-        return self.make_replacements(output, *var_list, **var_dict)
+        return prepared(var_list, var_dict)
 
     def get_image_from_config(self, shortcut, optionals):
         """
@@ -312,13 +790,18 @@ class PreParser:
         :type optionals: syntax.Optional
         :return: the html to insert as a string
         """
-        shortcut_s = self.get_element_from_config('aliases', 'images', shortcut)
+        table = self.get_alias_table()
+        if not optionals and shortcut in table.bare_images:
+            return table.bare_images[shortcut]
+        prepared = table.images.get(shortcut)
+        if prepared is None:
+            prepared = PreparedFormat(self.get_element_from_config('aliases', 'images', shortcut))
 
         _, _, var_list, var_dict = syntax.split_optionals(optionals)
         request = export.ExportRequest('inline_elements', 'image', optionals)  # noqa : F841
         output = self._env.export_mngr(request)
 
-        return output.start + self.make_replacements(shortcut_s, *var_list, **var_dict) + output.end
+        return output.start + prepared(var_list, var_dict) + output.end
 
     def __repr__(self):
         """
@@ -383,7 +866,7 @@ class PreParser:
         self.tree_view = Tree(prefix+stripped_name+suffix)
         for p, l in self.parse_import_list():
             try:
-                self.tree_view.add(self.global_dict_of_imports[p].rich_tree(suffix=" (Line:{})".format(l), force=True, strip_prefix=strip_prefix))  # noqa
+                self.tree_view.add(self.local_dict_of_imports[p].rich_tree(suffix=" (Line:{})".format(l), force=True, strip_prefix=strip_prefix))  # noqa
             except KeyError:  # The key isn't in the global dict yet
                 self.tree_view.add(Tree(prefix+p+suffix+" !!"))
                 unparsed = True
@@ -0,0 +1,203 @@
+# Module measuring the time spent by each stage of the build on each page
+# A Profiler records the wall time (time.perf_counter) and the CPU time (time.process_time) of every stage it is told
+#   about, summarizes the slowest pages and stages, and can wrap the whole run in cProfile.
+# With memory=True, it also records the peak memory allocated during each stage (tracemalloc), and keeps the top
+#   allocation sites in bootstraparse.modules at the end of the stage with the highest peak. Before Python 3.9, which
+#   has no tracemalloc.reset_peak, the traces are cleared at the start of each stage instead: the peaks are the same,
+#   the allocation sites only hold what the stage allocated.
+# A disabled Profiler costs next to nothing, so the stages can be wrapped unconditionally.
+# Usage:
+#   from bootstraparse.modules.profiler import Profiler
+#   prof = Profiler(enabled=True, cprofile_path="run.prof", memory=True)
+#   prof.start() # starts cProfile if a path was given, and tracemalloc if memory is measured
+#   with prof.stage("index.bpr", "parse"):
+#       ...
+#   prof.stop() # stops cProfile and writes its dump, stops tracemalloc
+#   print(prof.summary(top=10))
+
+import contextlib
+import cProfile
+import os
+import time
+import tracemalloc
+from collections import namedtuple
+from typing import Dict
+
+"""
+Stages of the build, in the order they happen.
+"""
+STAGES = ["crawl", "preparse", "parse", "contextualise", "export", "write"]
+
+"""
+Named tuple holding the measures of one stage for one page: wall and cpu time in seconds,
+peak memory allocated during the stage in bytes (0 if memory is not measured).
+"""
+StageTime = namedtuple("StageTime", ["wall", "cpu", "peak"], defaults=[0])
+
+"""
+Named tuple locating the allocation sites reported by the memory profiler.
+"""
+AllocationSite = namedtuple("AllocationSite", ["file_name", "line_number", "size", "count"])
+
+"""
+Only the allocations made by the modules of bootstraparse are reported.
+"""
+_MODULES_FILTER = tracemalloc.Filter(True, os.path.join("*", "bootstraparse", "modules", "*"))
+
+
+def reset_peak():
+    """
+    Sets the peak of the traced memory to the memory traced right now, or clears the traces before Python 3.9.
+    """
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.clear_traces()
+
+
+class Profiler:
+    """
+    Records the wall and CPU time of each stage of each page.
+    """
+    def __init__(self, enabled=False, cprofile_path=None, memory=False):
+        """
+        :param enabled: whether the stages are measured
+        :param cprofile_path: if given, path of the cProfile dump of the whole run
+        :param memory: whether the peak memory of each stage is measured as well (implies enabled)
+        :type enabled: bool
+        :type cprofile_path: str | None
+        :type memory: bool
+        """
+        self.enabled = enabled or memory
+        self.cprofile_path = cprofile_path
+        self.memory = memory
+        self.records = {}  # {page: {stage: StageTime}}
+        self.top_sites = []  # [AllocationSite] at the end of the stage with the highest peak
+        self.top_stage = None  # (page, stage) of the highest peak
+        self._cprofile = None
+        self._tracing = False
+
+    def start(self):
+        """
+        Starts cProfile, if a dump was requested, and tracemalloc, if memory is measured.
+        """
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if self.cprofile_path is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        """
+        Stops cProfile and writes its dump, and tracemalloc, if they were started.
+        """
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, page, name):
+        """
+        Context manager measuring a stage of a page, times add up if the same stage is measured twice.
+        :param page: name of the page (or of the site for global stages)
+        :param name: name of the stage, see STAGES
+        :type page: str
+        :type name: str
+        """
+        if not self.enabled:
+            yield
+            return
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] - memory if tracing else 0
+            stages = self.records.setdefault(page, {})
+            previous = stages.get(name, StageTime(0.0, 0.0))
+            stages[name] = StageTime(previous.wall + wall, previous.cpu + cpu, max(previous.peak, peak))
+            if tracing and peak > self.highest_peak():
+                self.top_stage = (page, name)
+                self.top_sites = self.allocation_sites()
+
+    def highest_peak(self):
+        """
+        Returns the highest peak recorded for the stage holding the top allocation sites.
+        :rtype: int
+        """
+        if self.top_stage is None:
+            return 0
+        page, name = self.top_stage
+        return self.records[page][name].peak
+
+    @staticmethod
+    def allocation_sites(top=10):
+        """
+        Returns the lines of bootstraparse.modules holding the most memory right now.
+        :param top: maximum number of sites returned
+        :type top: int
+        :rtype: list[AllocationSite]
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([_MODULES_FILTER])
+        return [
+            AllocationSite(stat.traceback[0].filename, stat.traceback[0].lineno, stat.size, stat.count)
+            for stat in snapshot.statistics("lineno")[:top]
+        ]
+
+    def page_totals(self):
+        """
+        Returns the total time and the highest peak of each page, slowest first.
+        :rtype: list[(str, StageTime)]
+        """
+        totals = [
+            (page, StageTime(
+                sum(t.wall for t in stages.values()), sum(t.cpu for t in stages.values()),
+                max(t.peak for t in stages.values())
+            ))
+            for page, stages in self.records.items()
+        ]
+        return sorted(totals, key=lambda total: total[1].wall, reverse=True)
+
+    def stage_totals(self):
+        """
+        Returns the total time and the highest peak of each stage over all pages, slowest first.
+        :rtype: list[(str, StageTime)]
+        """
+        totals: Dict[str, StageTime] = {}
+        for stages in self.records.values():
+            for name, t in stages.items():
+                previous = totals.get(name, StageTime(0.0, 0.0))
+                totals[name] = StageTime(previous.wall + t.wall, previous.cpu + t.cpu, max(previous.peak, t.peak))
+        return sorted(totals.items(), key=lambda total: total[1].wall, reverse=True)
+
+    def summary(self, top=10):
+        """
+        Returns a human-readable summary of the slowest stages and pages.
+        :param top: maximum number of pages listed
+        :type top: int
+        :rtype: str
+        """
+        peak = (lambda t: f"{t.peak / 1024:>12.1f}") if self.memory else (lambda t: "")
+        header = "wall / cpu, ms / peak, KiB" if self.memory else "wall / cpu, ms"
+        lines = [f"Stages ({header}):"]
+        for name, t in self.stage_totals():
+            lines.append(f"  {name:<14}{t.wall * 1000:>10.2f}{t.cpu * 1000:>10.2f}{peak(t)}")
+        lines.append(f"Slowest pages ({header}):")
+        for page, t in self.page_totals()[:top]:
+            slowest = max(self.records[page].items(), key=lambda stage: stage[1].wall)[0]
+            lines.append(f"  {t.wall * 1000:>10.2f}{t.cpu * 1000:>10.2f}{peak(t)}  {page} (mostly {slowest})")
+        if self.top_stage is not None:
+            lines.append("Top allocation sites at the end of {1} of {0} (KiB, blocks):".format(*self.top_stage))
+            for site in self.top_sites:
+                location = f"{os.path.basename(site.file_name)}:{site.line_number}"
+                lines.append(f"  {site.size / 1024:>10.1f}{site.count:>10}  {location}")
+        return "\n".join(lines)
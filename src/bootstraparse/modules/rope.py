@@ -0,0 +1,256 @@
+# Module representing expanded files as ropes of line segments pointing into the original source buffers
+# A SourceBuffer holds the lines of a file, read once. A Rope is a list of Segment(source, start, end)
+#   referencing ranges of those lines, so nested imports are never copied, only referenced.
+# The Rope also maps every expanded line back to the file and line it comes from (see Rope.origin).
+# Source lines are stored as tuples, and a frozen Rope (see Rope.freeze) cannot be modified anymore: expanded
+#   partials can be read by any number of pages or threads at once, there is no cursor to share.
+# Usage:
+#   from bootstraparse.modules.rope import SourceBuffer, Rope
+#   src = SourceBuffer.from_file("path/to/file.bpr")
+#   rope = Rope()
+#   rope.append(src, 0, 3) # references lines 0 to 2 of src
+#   rope.extend(other_rope) # references all the segments of another rope
+#   rope.freeze() # makes the rope immutable and safe to share
+#   rope.sub_rope(2, 5) # returns a new rope referencing the segments 2 to 4
+#   rope.readlines() # returns the expanded lines, rope.read() the expanded text
+#   rope.marked_readlines() # returns the expanded lines along with whether they hold a marked source line
+#   rope.origin(4) # returns LineOrigin(file_name, line_number) of the 5th expanded line (0-indexed)
+
+from bisect import bisect_right
+from collections import namedtuple
+
+from bootstraparse.modules import error_mngr
+
+"""
+Named tuple locating a line in its original file (line_number is 0-indexed).
+"""
+LineOrigin = namedtuple("LineOrigin", ["file_name", "line_number"])
+
+"""
+Named tuple referencing the lines [start:end] of a SourceBuffer.
+"""
+Segment = namedtuple("Segment", ["source", "start", "end"])
+
+
+class SourceBuffer:
+    """
+    Holds the lines of a source file, read once and shared by every rope referencing it.
+    """
+    def __init__(self, path, lines):
+        """
+        :param path: path of the source file
+        :param lines: lines of the file, as returned by readlines()
+        :type path: str
+        :type lines: list[str] | tuple[str]
+        """
+        self.path = path
+        self.lines = tuple(lines)
+        self.marked_lines = None  # Frozenset of the indexes of lines needing further processing, None if unknown
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Reads a file and returns its SourceBuffer.
+        :param path: path of the file to read
+        :type path: str
+        :rtype: SourceBuffer
+        """
+        with open(path, 'r') as f:
+            return cls(path, f.readlines())
+
+    def ends_with_newline(self, end):
+        """
+        Checks if the slice of lines ending at end terminates a line.
+        :param end: index of the end of the slice (excluded)
+        :type end: int
+        :rtype: bool
+        """
+        return self.lines[end - 1][-1:] == "\n"
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __repr__(self):
+        return f"SourceBuffer({self.path}, {len(self.lines)} lines)"
+
+
+class Rope:
+    """
+    List of segments referencing source buffers, behaves like a read-only file object.
+    Lines of a source not ending with a newline are joined with the first line of the next segment,
+    exactly like writing the segments one after the other in a file would.
+    """
+    def __init__(self):
+        self.segments = []
+        self.frozen = False
+        self._anchors = None  # Lazily computed, see _make_anchors
+
+    def _check_not_frozen(self):
+        if self.frozen:
+            error_mngr.log_exception(TypeError(f"{self} is frozen and cannot be modified."), level="CRITICAL")
+
+    def freeze(self):
+        """
+        Makes the rope immutable: it cannot be appended to or extended anymore, and its line anchors are computed once
+        and for all. Any number of readers can then share it without copying.
+        :return: the rope itself
+        :rtype: Rope
+        """
+        if not self.frozen:
+            self._make_anchors()
+            self.frozen = True
+        return self
+
+    def append(self, source, start, end):
+        """
+        References the lines [start:end] of a source, empty ranges are ignored.
+        :param source: the source buffer to reference
+        :param start: index of the first line
+        :param end: index of the last line (excluded)
+        :type source: SourceBuffer
+        :type start: int
+        :type end: int
+        """
+        self._check_not_frozen()
+        if start < end:
+            self.segments.append(Segment(source, start, end))
+            self._anchors = None
+
+    def extend(self, other):
+        """
+        References all the segments of another rope (the lines themselves are not copied).
+        :param other: the rope to reference
+        :type other: Rope
+        """
+        self._check_not_frozen()
+        self.segments += other.segments
+        self._anchors = None
+
+    def sub_rope(self, start, end):
+        """
+        Returns a new rope referencing the segments [start:end] of this one.
+        :param start: index of the first segment
+        :param end: index of the last segment (excluded)
+        :type start: int
+        :type end: int
+        :rtype: Rope
+        """
+        sub = Rope()
+        sub.segments = list(self.segments[start:end])
+        return sub
+
+    def ends_line(self, index):
+        """
+        Checks if the segments before index end on a complete line, i.e. the segment at index starts a new line.
+        :param index: index of a segment (len(self.segments) checks the end of the rope)
+        :type index: int
+        :rtype: bool
+        """
+        if index == 0:
+            return True
+        source, _, end = self.segments[index - 1]
+        return source.ends_with_newline(end)
+
+    def raw_lines(self):
+        """
+        Yields the lines of every segment, as stored in their sources.
+        :ytype: str
+        """
+        for source, start, end in self.segments:
+            for i in range(start, end):
+                yield source.lines[i]
+
+    def readlines(self):
+        """
+        Returns the expanded lines, as a file containing all the segments would.
+        :rtype: list[str]
+        """
+        output = []
+        pending = ""
+        for line in self.raw_lines():
+            if line[-1:] == "\n":
+                output.append(pending + line)
+                pending = ""
+            else:
+                pending += line
+        if pending:
+            output.append(pending)
+        return output
+
+    def marked_readlines(self):
+        """
+        Returns the expanded lines, each with a flag telling if it needs further processing:
+        that is if it is marked in its source, if its source has no marked_lines or if it joins several lines.
+        :rtype: list[(str, bool)]
+        """
+        output = []
+        pending = None
+        for source, start, end in self.segments:
+            marked_lines = source.marked_lines
+            for i in range(start, end):
+                line = source.lines[i]
+                if pending is not None:
+                    line = pending + line
+                    marked = True
+                else:
+                    marked = marked_lines is None or i in marked_lines
+                if line[-1:] == "\n":
+                    output.append((line, marked))
+                    pending = None
+                else:
+                    pending = line
+        if pending:
+            output.append((pending, True))
+        return output
+
+    def read(self):
+        """
+        Returns the expanded text.
+        :rtype: str
+        """
+        return "".join(self.raw_lines())
+
+    def _make_anchors(self):
+        """
+        Computes the expanded line at which each segment starts, and the total number of expanded lines.
+        A segment continuing a line left open by the previous one is anchored on its second line.
+        :rtype: (list[int], list[(Segment, int)], int)
+        """
+        lines, anchors = [], []
+        expanded_line = 0
+        open_line = False
+        for segment in self.segments:
+            size = segment.end - segment.start
+            offset = 1 if open_line else 0
+            if size > offset:
+                lines.append(expanded_line + offset)
+                anchors.append((segment, offset))
+            open_line = not segment.source.ends_with_newline(segment.end)
+            expanded_line += size - 1 if open_line else size
+        self._anchors = lines, anchors, expanded_line + (1 if open_line else 0)
+        return self._anchors
+
+    def origin(self, line_number):
+        """
+        Returns the origin of an expanded line.
+        A line joining several sources is attributed to the source it starts in.
+        :param line_number: index of the expanded line (0-indexed)
+        :type line_number: int
+        :rtype: LineOrigin
+        :raise IndexError: if the line is not in the rope
+        """
+        lines, anchors, total = self._anchors or self._make_anchors()
+        if not 0 <= line_number < total:
+            raise IndexError(f"Line {line_number} is not in the rope ({total} lines).")
+        i = bisect_right(lines, line_number) - 1
+        segment, offset = anchors[i]
+        return LineOrigin(segment.source.path, segment.start + offset + line_number - lines[i])
+
+    def __len__(self):
+        """
+        Number of expanded lines.
+        """
+        return (self._anchors or self._make_anchors())[2]
+
+    def __repr__(self):
+        return f"Rope({len(self.segments)} segments)"
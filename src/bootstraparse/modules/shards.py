@@ -0,0 +1,220 @@
+# Splitting of a build over several machines, and check of the merged outputs
+# The pages found by the crawler are split into N shards weighted by the size of their source, and so are the
+#   unparsable files to copy. The split only depends on the relative paths and sizes of the files, so every machine
+#   building the same tree computes the same shards. The pages of the datasets are built by the first shard. Each
+#   shard writes its pages and copies into the shared layout of the destination, and a manifest listing them in
+#   <destination>/<folder>/shard-<i>-of-<N>.json. Once the outputs of all the shards are gathered in one destination,
+#   merge checks that their manifests cover the site exactly once, and lists the fragment files no shard wrote.
+# When the import index is enabled, each shard saves its own next to its manifest, in imports-<i>-of-<N>.json, merged
+#   into the index of the site along with the shards (see importgraph).
+# Usage:
+#   from bootstraparse.modules import shards
+#   shard = shards.parse_shard("2/4") # Shard(index=2, count=4), the index starts at 1
+#   shards.select(crawler.files, shard, crawler.initial_path) # the (root, file) entries of the shard
+#   shards.write_manifest(crawler, shard, "_shards", copied, fragment_files, dataset_pages)
+#   shards.index_path(destination, "_shards", shard) # the import index of the shard
+#   report = shards.merge(crawler, "_shards") # raises error_mngr.ShardError on gaps or overlaps
+
+import json
+import os
+from collections import namedtuple, Counter
+from typing import List, Set
+
+from bootstraparse.modules import error_mngr, datasets, fragments
+
+
+"""
+Named tuple holding a shard: its index, from 1 to count, and the number of shards of the build.
+"""
+Shard = namedtuple("Shard", ["index", "count"])
+
+"""
+Named tuple holding the result of a merge check: the number of shards, pages, copied files, fragment files and pages
+of the datasets.
+"""
+MergeReport = namedtuple("MergeReport", ["shards", "pages", "copies", "fragments", "datasets"])
+
+
+def parse_shard(spec):
+    """
+    Parses a shard given as i/N.
+    :param spec: The shard, its index from 1 to N and the number of shards N
+    :type spec: str
+    :raises ValueError: If the shard is not of the form i/N with 1 <= i <= N
+    :rtype: Shard
+    """
+    index, _, count = spec.partition("/")
+    if not (index.isdigit() and count.isdigit() and 1 <= int(index) <= int(count)):
+        raise ValueError(f'Invalid shard "{spec}", expected i/N with 1 <= i <= N.')
+    return Shard(int(index), int(count))
+
+
+def relative(root, file):
+    """
+    Returns the path of a crawled file relative to the site, with / separators on every system.
+    :param root: The directory of the file, relative to the site
+    :param file: The name of the file
+    :type root: str
+    :type file: str
+    :rtype: str
+    """
+    return os.path.normpath(os.path.join(root, file)).replace(os.sep, "/")
+
+
+def partition(weights, count):
+    """
+    Splits weighted keys into count groups of similar total weight: the heaviest keys first, each one to the lightest
+    group so far, the lowest index on ties. Equal keys and weights always give the same groups.
+    :param weights: The weight of each key
+    :param count: The number of groups
+    :type weights: dict[str, int]
+    :type count: int
+    :rtype: list[set[str]]
+    """
+    groups: List[Set[str]] = [set() for _ in range(count)]
+    loads = [0] * count
+    for key in sorted(weights, key=lambda k: (-weights[k], k)):
+        lightest = min(range(count), key=lambda i: (loads[i], i))
+        groups[lightest].add(key)
+        loads[lightest] += weights[key]
+    return groups
+
+
+def select(entries, shard, base):
+    """
+    Returns the entries of a shard, in their original order, weighted by the size of their file.
+    :param entries: The (root, file) entries of the crawler
+    :param shard: The shard to keep
+    :param base: The path of the site
+    :type entries: list[(str, str)]
+    :type shard: Shard
+    :type base: str
+    :rtype: list[(str, str)]
+    """
+    weights = {relative(root, file): os.path.getsize(os.path.join(base, root, file)) + 1 for root, file in entries}
+    kept = partition(weights, shard.count)[shard.index - 1]
+    return [(root, file) for root, file in entries if relative(root, file) in kept]
+
+
+def manifest_path(destination, folder, shard):
+    """
+    :type destination: str
+    :type folder: str
+    :type shard: Shard
+    :rtype: str
+    """
+    return os.path.join(destination, folder, f"shard-{shard.index}-of-{shard.count}.json")
+
+
+def index_path(destination, folder, shard):
+    """
+    Returns the path of the import index of a shard.
+    :type destination: str
+    :type folder: str
+    :type shard: Shard
+    :rtype: str
+    """
+    return os.path.join(destination, folder, f"imports-{shard.index}-of-{shard.count}.json")
+
+
+def write_manifest(crawler, shard, folder, copied, fragment_files=(), dataset_pages=()):
+    """
+    Writes the manifest of a shard: the pages it built, the files it copied, the fragment files it wrote and the pages
+    of the datasets it built.
+    :param crawler: The crawler of the shard
+    :param shard: The shard built
+    :param folder: The folder of the manifests, relative to the destination
+    :param copied: The (root, file) entries copied by the shard
+    :param fragment_files: The paths of the fragment files written by the shard
+    :param dataset_pages: The paths of the pages of the datasets written by the shard
+    :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+    :type shard: Shard
+    :type folder: str
+    :type copied: list[(str, str)]
+    :type fragment_files: list[str]
+    :type dataset_pages: list[str]
+    :return: The path of the manifest
+    :rtype: str
+    """
+    destination = crawler.destination_path
+    manifest = {
+        "shard": shard.index,
+        "count": shard.count,
+        "pages": [[relative(root, file), relative(root, os.path.splitext(file)[0] + ".html")]
+                  for root, file in crawler.files],
+        "copies": [relative(root, file) for root, file in copied],
+        "fragments": sorted({os.path.relpath(path, destination).replace(os.sep, "/") for path in fragment_files}),
+        "datasets": sorted(os.path.relpath(path, destination).replace(os.sep, "/") for path in dataset_pages),
+    }
+    path = manifest_path(destination, folder, shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    return path
+
+
+def merge(crawler, folder):
+    """
+    Checks that the manifests of the shards in the destination of a crawler cover its site exactly once: one manifest
+    per shard, every page, page of a dataset and file to copy listed by one shard only, and every output present.
+    Warns about the fragment files no shard wrote, which no page of the site includes anymore.
+    :param crawler: The crawler of the whole site, without shard
+    :param folder: The folder of the manifests, relative to the destination
+    :type crawler: bootstraparse.modules.sitecrawler.SiteCrawler
+    :type folder: str
+    :raises error_mngr.ShardError: Listing every problem found
+    :rtype: MergeReport
+    """
+    destination = crawler.destination_path
+    manifests = []
+    manifest_folder = os.path.join(destination, folder)
+    if os.path.isdir(manifest_folder):
+        for name in sorted(os.listdir(manifest_folder)):
+            if name.startswith("shard-") and name.endswith(".json"):
+                with open(os.path.join(manifest_folder, name)) as manifest_file:
+                    manifests.append(json.load(manifest_file))
+
+    problems = []
+    counts = {manifest["count"] for manifest in manifests}
+    if not manifests:
+        problems.append(f'no shard manifest in "{manifest_folder}"')
+    elif len(counts) > 1:
+        problems.append(f"manifests of builds split in {sorted(counts)} shards")
+    else:
+        missing = set(range(1, counts.pop() + 1)) - {manifest["shard"] for manifest in manifests}
+        if missing:
+            problems.append(f"missing shards {sorted(missing)}")
+
+    expected_pages = {relative(root, file) for root, file in crawler.files}
+    expected_copies = {relative(root, file) for root, file in crawler.unparsable_files()}
+    expected_datasets = {os.path.relpath(path, destination).replace(os.sep, "/")
+                         for dataset in datasets.load_datasets(crawler._env)
+                         for path in datasets.page_paths(dataset, destination)}
+    pages = Counter(source for manifest in manifests for source, _ in manifest["pages"])
+    copies = Counter(file for manifest in manifests for file in manifest["copies"])
+    dataset_pages = Counter(file for manifest in manifests for file in manifest["datasets"])
+    for kind, listed, expected in (("page", pages, expected_pages), ("copied file", copies, expected_copies),
+                                   ("dataset page", dataset_pages, expected_datasets)):
+        problems += [f"{kind} {file} not listed by any shard" for file in sorted(set(expected) - set(listed))]
+        problems += [f"{kind} {file} listed by {n} shards" for file, n in sorted(listed.items()) if n > 1]
+        problems += [f"{kind} {file} is not part of the site" for file in sorted(set(listed) - set(expected))]
+
+    outputs = [output for manifest in manifests for _, output in manifest["pages"]]
+    outputs += [file for manifest in manifests for file in manifest["copies"]]
+    outputs += list(dataset_pages)
+    fragment_files = {file for manifest in manifests for file in manifest["fragments"]}  # Shared by the shards
+    problems += [f"output {file} missing" for file in sorted(set(outputs) | fragment_files)
+                 if not os.path.isfile(os.path.join(destination, file))]
+
+    if problems:
+        error_mngr.log_exception(error_mngr.ShardError(problems))
+    fragment_folder = crawler._env.config["parser_config"]["export"].get("fragment_folder", "_fragments")
+    stale = fragments.stale_files(os.path.join(destination, fragment_folder),
+                                  [os.path.join(destination, file) for file in fragment_files])
+    if stale:
+        error_mngr.log_message(
+            f"{len(stale)} fragment files written by no shard, left by a previous build: "
+            + ", ".join(os.path.relpath(path, destination).replace(os.sep, "/") for path in stale) + ".",
+            level="WARNING"
+        )
+    return MergeReport(len(manifests), len(pages), len(copies), len(fragment_files), len(dataset_pages))
@@ -1,7 +1,7 @@
 # Module for file and directories repartition
 import os
 import shutil
-from bootstraparse.modules import pathresolver, preparser, error_mngr, environment, export
+from bootstraparse.modules import pathresolver, preparser, error_mngr, environment, export, shards
 
 
 class SiteCrawler:
@@ -11,15 +11,21 @@ class SiteCrawler:
     the files and directories in the initial path.
     This generator is to be used in a for loop to parse all the files and produce
     the final website.
+    In lazy mode (parsing/lazy_preparse in parser_config), the preparser of a page is only created when the page is
+    yielded, and released once the page is done, along with the partials no page left needs (see count_imports).
+    With a shard, only the pages and unparsable files of the shard are kept (see shards.select), the directories of
+    the whole site are still created.
     """
-    def __init__(self, path, destination, _env):
+    def __init__(self, path, destination, _env, shard=None):
         """
         :param path: The path to the directory to be crawled
         :param destination: The path to the directory where the website will be created
         :param _env: The environment object
+        :param shard: The shard of the site to build, the whole site if None
         :type path: str
         :type destination: str
         :type _env: environment.Environment
+        :type shard: shards.Shard | None
         """
         if not os.path.exists(path):
             error_mngr.log_exception(
@@ -31,14 +37,20 @@ class SiteCrawler:
         self._env = _env
         self.initial_path = path
         self.destination_path = destination
+        self.shard = shard
 
         # initialize variables
         self.force_rewrite = self._env.config["parser_config"]["export"]["force_rewrite"]
+        self.lazy = self._env.config["parser_config"]["parsing"].get("lazy_preparse", False)
         self.directories = []
         self.files = []
         self.files_to_copy = []
         self.preparsers = []
-        self.global_dict_of_imports = {}
+        self.global_dict_of_imports = preparser.ImportCache(
+            self._env.config["parser_config"]["parsing"].get("import_cache_size", 0)
+        )
+        self.import_counts = {}  # Lazy mode: number of pages left needing each import
+        self.page_imports = []  # Lazy mode: imports needed by each page, directly or not
 
         # dictionaries
         self.authorised_extensions = [".bpr"]
@@ -55,6 +67,9 @@ class SiteCrawler:
         the self.directories and self.files, self.files_to_copy variables.
         """
         self.files, self.files_to_copy, self.directories = self.list_recursively(self.initial_path, self.initial_path)
+        if self.shard is not None:
+            self.files = shards.select(self.files, self.shard, self.initial_path)
+            self.files_to_copy = shards.select(self.files_to_copy, self.shard, self.initial_path)
 
     def list_recursively(self, path, root):
         """
@@ -105,22 +120,112 @@ class SiteCrawler:
         :return: self.preparsers
         :rtype: list[preparser.PreParser]
         """
-        for root, file in self.files:
-            preparser_path = os.path.join(self.initial_path, root, file)
-            pp = preparser.PreParser(preparser_path, self._env, dict_of_imports=self.global_dict_of_imports)
+        pages = [(self.open_page(path), destination) for path, destination in self.page_paths()]
+        preparser.resolve_imports([pp for pp, _ in pages])  # Reports the import cycles of the whole site at once
+        for pp, destination in pages:
             pp.do_imports()
-            p = self.create_file(os.path.join(self.destination_path, root, os.path.splitext(file)[0] + ".html"))
-            self.preparsers.append((pp, p))
+            self.preparsers.append((pp, self.create_file(destination)))
 
         return self.preparsers
 
+    def page_paths(self):
+        """
+        Returns the path of every page to build, and the path of its html file in the destination.
+        :rtype: list[(str, str)]
+        """
+        return [
+            (os.path.join(self.initial_path, root, file),
+             os.path.join(self.destination_path, root, os.path.splitext(file)[0] + ".html"))
+            for root, file in self.files
+        ]
+
+    def open_page(self, path):
+        """
+        Returns a new preparser for a page, sharing the imports of the whole build. Nothing is read yet.
+        :param path: The path of the page
+        :type path: str
+        :rtype: preparser.PreParser
+        """
+        return preparser.PreParser(path, self._env, dict_of_imports=self.global_dict_of_imports)
+
+    def close_page(self, index, pp):
+        """
+        Releases the preparser of a page once it is done. In lazy mode, releases as well the imports no page left needs.
+        :param index: The index of the page in self.files
+        :param pp: The preparser of the page
+        :type index: int
+        :type pp: preparser.PreParser
+        """
+        pp.release()
+        if not self.lazy:
+            return
+        for import_path in self.page_imports[index]:
+            self.import_counts[import_path] -= 1
+            if self.import_counts[import_path] == 0 and import_path in self.global_dict_of_imports:
+                self.global_dict_of_imports.pop(import_path).release()
+
+    def count_imports(self):
+        """
+        Lazy mode: scans the imports of every page, and counts how many pages need each import, directly or not.
+        The imported files are preparsed once into self.global_dict_of_imports, the pages themselves are not kept.
+        :return: self.import_counts
+        :rtype: dict[str, int]
+        """
+        self.import_counts = {}
+        self.page_imports = []
+
+        def pages():
+            for path, _ in self.page_paths():
+                page = self.open_page(path)
+                yield page
+                # Resolved by the time the next page is asked for, the page can be counted and released
+                needed = set()
+                to_visit = [page]
+                while to_visit:
+                    for import_path, imported in to_visit.pop().local_dict_of_imports.items():
+                        if import_path not in needed:
+                            needed.add(import_path)
+                            to_visit.append(imported)
+                for import_path in needed:
+                    self.import_counts[import_path] = self.import_counts.get(import_path, 0) + 1
+                self.page_imports.append(needed)
+                page.release()
+
+        preparser.resolve_imports(pages())  # Reports the import cycles of the whole site at once
+        return self.import_counts
+
+    def iter_lazy(self):
+        """
+        Lazy mode: creates the preparser of each page just before yielding it, and releases it once the page is done,
+        along with the imports no page left needs.
+        :yield: A tuple of the form (PreParser, file)
+        :ytype: (preparser.PreParser, str)
+        """
+        for index, (path, destination) in enumerate(self.page_paths()):
+            pp = self.open_page(path)
+            pp.do_imports()
+            yield pp, self.create_file(destination)
+            self.close_page(index, pp)
+
+    def unparsable_files(self):
+        """
+        Returns the files that could not be parsed and are copied as they are, none if copying is disabled.
+        :rtype: list[(str, str)]
+        """
+        if self._env.config["parser_config"]["export"]["copy_unparsable_files"].lower() == "copy":
+            return self.files_to_copy
+        return []
+
     def copy_unparsable_files(self):
         """
         This method is used to copy all the files that could not be parsed.
+        :return: The files copied
+        :rtype: list[(str, str)]
         """
-        if self._env.config["parser_config"]["export"]["copy_unparsable_files"].lower() == "copy":
-            for root, file in self.files_to_copy:
-                shutil.copy(os.path.join(self.initial_path, root, file), os.path.join(self.destination_path, root, file))
+        copied = self.unparsable_files()
+        for root, file in copied:
+            shutil.copy(os.path.join(self.initial_path, root, file), os.path.join(self.destination_path, root, file))
+        return copied
 
     def create_file(self, path):
         """
@@ -145,6 +250,9 @@ class SiteCrawler:
         :yield: A tuple of the form (PreParser, file)
         :ytype: (preparser.PreParser, str)
         """
+        if self.lazy:
+            yield from self.iter_lazy()
+            return
         for pre in self.preparsers:
             yield pre
 
@@ -2,28 +2,204 @@
 import os
 
 from bootstraparse.modules import pathresolver, sitecrawler, environment, config, export, parser, context_mngr
+from bootstraparse.modules import profiler, error_mngr, fragments, pipeline, shards, importgraph, datasets, compiler
+from bootstraparse.modules import treecache, incremental, preparser
 
 
-def create_website(origin, destination):
+def create_website(origin, destination, _profiler=None, shard=None):
     """
     First function called by bparse.py,
     calls all other modules in the right order.
     :param origin: The path of the website to be built.
     :param destination: The destination path of the built website.
+    :param _profiler: The profiler measuring each stage, none by default.
+    :param shard: The shard of the website to build, with its manifest, the whole website if None.
     :type origin: str
     :type destination: str
+    :type _profiler: profiler.Profiler
+    :type shard: shards.Shard
     :return: 0 if everything went well, 1 otherwise.
     """
+    prof = _profiler or profiler.Profiler()
     env = create_environment(origin, destination)
-    crwlr = create_crawler(origin, destination, env)
-    crwlr.set_all_preparsers()
-    crwlr.copy_unparsable_files()
-    for element, destination in crwlr:
-        save(preparse_parse(element), destination, env)
+    shard_folder = env.config["parser_config"]["export"].get("shard_folder", "_shards")
+    if shard is not None and env.import_graph is not None:  # Each shard indexes the files it scans, see merge_shards
+        env.import_graph = importgraph.ImportGraph(origin, shards.index_path(destination, shard_folder, shard))
+    parsing = env.config["parser_config"]["parsing"]
+    depth = parsing.get("pipeline_depth", 0)
+    with prof.stage(origin, "crawl"):
+        crwlr = create_crawler(origin, destination, env, shard)
+        export_config = env.config["parser_config"]["export"]
+        all_datasets = datasets.load_datasets(env)
+        to_build = all_datasets if shard is None or shard.index == 1 else []  # The datasets go with the first shard
+        incremental_build = export_config.get("incremental", False) and env.import_graph is not None and shard is None
+        if incremental_build:
+            plan = incremental.plan(crwlr, env)
+            crwlr.files, to_build = plan.files, plan.datasets
+            error_mngr.log_message(
+                f"Incremental build: {len(plan.files)} pages and {len(plan.datasets)} datasets to build, "
+                f"{plan.skipped} up to date.",
+                level="INFO"
+            )
+            for page, reason in sorted(plan.reasons.items()):
+                error_mngr.log_message(f"Building {page}: {reason}.", level="DEBUG")
+        if crwlr.lazy:  # The preparsers are created page by page
+            crwlr.count_imports()
+        elif not depth:  # The pipeline creates the preparsers as it reads the pages
+            crwlr.set_all_preparsers()
+        copied = crwlr.copy_unparsable_files()
 
+    def render(element, _destination):
+        return render_page(element, _destination, env, prof, origin)
+
+    if depth:
+        counters = pipeline.Pipeline(crwlr, render, write, depth, parsing.get("pipeline_workers")).run()
+        error_mngr.log_message(f"Pipeline: {counters}.", level="INFO")
+    else:
+        for element, destination in crwlr:
+            html = render(element, destination)
+            with prof.stage(os.path.relpath(element.path, origin), "write"):
+                write(html, destination)
+
+    dataset_pages = []
+    for dataset in to_build:
+        pages = datasets.build(dataset, crwlr, render)
+        dataset_pages += pages
+        error_mngr.log_message(
+            f"Dataset {dataset.name}: {len(pages)} pages from {os.path.relpath(dataset.template, origin)}.",
+            level="INFO"
+        )
+
+    imports = crwlr.global_dict_of_imports
+    error_mngr.log_message(
+        f"Import cache: {imports.hits} hits, {imports.misses} misses, {imports.evictions} evictions.",
+        level="INFO"
+    )
+    error_mngr.log_message(f"Replacement cache: {env.replacement_cache!r}.", level="INFO")
+    if env.parse_cache is not None:
+        error_mngr.log_message(
+            f"Parse cache: {env.parse_cache.hit_rate():.1%} of the lines found "
+            f"({env.parse_cache.hits} hits, {env.parse_cache.misses} misses).",
+            level="INFO"
+        )
+    if env.fragment_cache is not None:
+        error_mngr.log_message(
+            f"Fragment cache: {env.fragment_cache.rendered} imported files rendered once, "
+            f"{env.fragment_cache.spliced} imports spliced, {env.fragment_cache.fallbacks} fallbacks, "
+            f"{len(env.fragment_cache.files)} fragment files written.",
+            level="INFO"
+        )
+        # The pages of the other shards, or the ones an incremental build skips, include fragments not written here
+        if env.fragment_cache.include_tag is not None and shard is None and not incremental_build:
+            removed = env.fragment_cache.remove_stale_files()
+            error_mngr.log_message(f"Fragment cache: {len(removed)} stale fragment files removed.", level="INFO")
+    if env.container_cache is not None:
+        error_mngr.log_message(f"Container cache: {env.container_cache!r}.", level="INFO")
+    if env.page_compiler is not None:
+        error_mngr.log_message(f"Compiled pages: {env.page_compiler!r}.", level="INFO")
+    if env.import_graph is not None:
+        env.import_graph.context, env.import_graph.digests = incremental.config_digests(env)
+        env.import_graph.templates = {env.import_graph.key(dataset.template) for dataset in all_datasets}
+        env.import_graph.save()
+        error_mngr.log_message(f"Import index: {env.import_graph!r} saved to {env.import_graph.path}.", level="INFO")
+    if shard is not None:
+        manifest = shards.write_manifest(
+            crwlr, shard, shard_folder, copied, env.fragment_cache.files if env.fragment_cache is not None else [],
+            dataset_pages
+        )
+        error_mngr.log_message(
+            f"Shard {shard.index}/{shard.count}: {len(crwlr.files)} pages and {len(dataset_pages)} dataset pages built, "
+            f"{len(copied)} files copied, "
+            f"manifest written to {manifest}.",
+            level="INFO"
+        )
+    return 0
+
+
+def merge_shards(origin, destination):
+    """
+    Checks that the shards built in the destination path cover the whole website exactly once, and merges their import
+    indexes into the one of the website.
+    :param origin: The path of the website built.
+    :param destination: The destination path shared by the shards.
+    :type origin: str
+    :type destination: str
+    :raises error_mngr.ShardError: If a page or a file is missing, or built by several shards.
+    :return: 0 if everything went well.
+    """
+    env = create_environment(origin, destination)
+    shard_folder = env.config["parser_config"]["export"].get("shard_folder", "_shards")
+    report = shards.merge(create_crawler(origin, destination, env), shard_folder)
+    error_mngr.log_message(
+        f"Shards: {report.shards} shards cover {report.pages} pages, {report.datasets} dataset pages, "
+        f"{report.copies} copied files and {report.fragments} fragment files.",
+        level="INFO"
+    )
+    if env.import_graph is not None:
+        for index in range(1, report.shards + 1):
+            path = shards.index_path(destination, shard_folder, shards.Shard(index, report.shards))
+            if os.path.exists(path):
+                env.import_graph.update(importgraph.ImportGraph.load(origin, path))
+        env.import_graph.save()
+        error_mngr.log_message(f"Import index: {env.import_graph!r} saved to {env.import_graph.path}.", level="INFO")
     return 0
 
 
+def render_page(element, destination, env, prof, origin):
+    """
+    Returns the html of a page, from its compiled render function if the pages are compiled.
+    :param element: The preparser of the page.
+    :param destination: The destination path of the page.
+    :param env: The environment object.
+    :param prof: The profiler measuring each stage.
+    :param origin: The path of the website, the pages are named relatively to it.
+    :type element: preparser.PreParser
+    :type destination: str
+    :type env: environment.Environment
+    :type prof: profiler.Profiler
+    :type origin: str
+    :rtype: str
+    """
+    if env.page_compiler is not None and element.alias_table in (None, env.alias_table):  # Not the dataset templates
+        return env.page_compiler.render(element, lambda pp: run_stages(pp, destination, env, prof, origin))
+    return run_stages(element, destination, env, prof, origin)
+
+
+def run_stages(element, destination, env, prof, origin):
+    """
+    Preparses, parses, contextualises and exports a page, each stage measured by the profiler.
+    The containers are loaded from the container cache if it has them, instead of parsing and contextualising.
+    :param element: The preparser of the page.
+    :param destination: The destination path of the page.
+    :param env: The environment object.
+    :param prof: The profiler measuring each stage.
+    :param origin: The path of the website, the pages are named relatively to it.
+    :type element: preparser.PreParser
+    :type destination: str
+    :type env: environment.Environment
+    :type prof: profiler.Profiler
+    :type origin: str
+    :rtype: str
+    """
+    page = os.path.relpath(element.path, origin)
+    with prof.stage(page, "preparse"):
+        io = element.do_replacements()
+    list_of_containers = key = None
+    if env.container_cache is not None:
+        with prof.stage(page, "contextualise"):
+            key = env.container_cache.key(io.getvalue(), element)
+            list_of_containers = env.container_cache.load(key)
+    if list_of_containers is None:
+        with prof.stage(page, "parse"):
+            parsed_list = parser.parse_line(io, env.parse_cache)
+        with prof.stage(page, "contextualise"):
+            list_of_containers = contextualise(parsed_list, element)
+            if key is not None:
+                env.container_cache.store(key, list_of_containers)
+    with prof.stage(page, "export"):
+        return export_html(list_of_containers, destination, env)
+
+
 def create_environment(origin, destination):
     """
     Returns parserEnvironment as an object containing
@@ -36,34 +212,65 @@ def create_environment(origin, destination):
     :rtype: environment.Environment
     """
     env = environment.Environment()
-    env.config = config.ConfigLoader(pathresolver.b_path("configs"))
-    if os.path.exists(os.path.join(origin, "configs")):
-        env.config.add_folder(os.path.join(origin, "configs"))
+    env.config = load_config(origin)
 
     env.template = config.ConfigLoader(pathresolver.b_path("templates"))
     if os.path.exists(os.path.join(origin, "templates")):
         env.template.add_folder(os.path.join(origin, "templates"))
 
     env.export_mngr = export.ExportManager(env.config, env.template)
+    env.parse_cache = parser.ParseCache(env.config["parser_config"]["parsing"].get("cache_size", 0))
+    env.replacement_cache = preparser.ReplacementCache(
+        env.config["parser_config"]["parsing"].get("replacement_cache_size", 0)
+    )
+    export_config = env.config["parser_config"]["export"]
+    include = export_config.get("fragment_includes", "none")
+    if env.config["parser_config"]["parsing"].get("prerender_partials", False) or include != "none":
+        env.fragment_cache = fragments.FragmentCache(
+            env, include, export_config.get("fragment_folder", "_fragments"), export_config.get("fragment_url", "/")
+        )
+    container_cache = env.config["parser_config"]["parsing"].get("container_cache")
+    if container_cache and include == "none":  # Included fragments are written by the contextualisation
+        env.container_cache = treecache.ContainerCache(env, container_cache)
+    compiled_pages = env.config["parser_config"]["parsing"].get("compiled_pages")
+    if compiled_pages and include == "none":  # Included fragments are written by the build of the pages
+        env.page_compiler = compiler.PageCompiler(env, compiled_pages)
+    if export_config.get("import_index"):
+        env.import_graph = importgraph.ImportGraph.load(origin, os.path.join(destination, export_config["import_index"]))
     env.origin = origin
     env.destination = destination
 
     return env
 
 
-def create_crawler(origin, destination, _env):
+def load_config(origin):
+    """
+    Returns the configs of a website: the default ones, overridden by the ones of its configs folder.
+    :param origin: The path of the website, None for the default configs only.
+    :type origin: str | None
+    :rtype: config.ConfigLoader
+    """
+    _config = config.ConfigLoader(pathresolver.b_path("configs"))
+    if origin is not None and os.path.exists(os.path.join(origin, "configs")):
+        _config.add_folder(os.path.join(origin, "configs"))
+    return _config
+
+
+def create_crawler(origin, destination, _env, shard=None):
     """
     Returns crawler as an object for navigation in the user files.
     :param origin: The path of the website to be built.
     :param destination: The destination path of the built website.
     :param _env: The environment object.
+    :param shard: The shard of the website to crawl, the whole website if None.
     :type origin: str
     :type destination: str
     :type _env: environment.Environment
+    :type shard: shards.Shard
     :return: Crawler object.
     :rtype: sitecrawler.SiteCrawler
     """
-    return sitecrawler.SiteCrawler(origin, destination, _env)
+    return sitecrawler.SiteCrawler(origin, destination, _env, shard)
 
 
 def preparse_parse(preparser):
@@ -75,9 +282,24 @@ def preparse_parse(preparser):
     :rtype: list
     """
     io = preparser.do_replacements()
-    parsed_list = parser.parse_line(io)
-    output = context_mngr.ContextManager(parsed_list, name=preparser.name)()
-    return output
+    parsed_list = parser.parse_line(io, preparser._env.parse_cache)
+    return contextualise(parsed_list, preparser)
+
+
+def contextualise(parsed_list, preparser):
+    """
+    Returns the list of containers built from the parsed tokens of a preparser.
+    The self-contained imported files are spliced as pre-rendered html if the fragment cache is enabled.
+    :param parsed_list: The tokens returned by parser.parse_line.
+    :param preparser: The preparser the tokens come from.
+    :type parsed_list: list
+    :type preparser: parser.Preparser
+    :return: List of containers.
+    :rtype: list
+    """
+    if preparser._env.fragment_cache is not None:
+        parsed_list = preparser._env.fragment_cache.splice(parsed_list, preparser)
+    return context_mngr.ContextManager(parsed_list, name=preparser.name, origin=preparser.line_origin)()
 
 
 def save(list_of_containers, destination, env):
@@ -90,8 +312,33 @@ def save(list_of_containers, destination, env):
     :type destination: str
     :type env: environment.Environment
     """
+    write(export_html(list_of_containers, destination, env), destination)
+
+
+def export_html(list_of_containers, destination, env):
+    """
+    Returns the html of a list of containers.
+    :param list_of_containers: The list of containers to be exported.
+    :param destination: The destination path.
+    :param env: The environment object.
+    :type list_of_containers: list
+    :type destination: str
+    :type env: environment.Environment
+    :rtype: str
+    """
+    return export.ContextConverter(list_of_containers, env.export_mngr, destination).process_pile().read()
+
+
+def write(html, destination):
+    """
+    Writes the html of a page in the destination path.
+    :param html: The html to be written.
+    :param destination: The destination path.
+    :type html: str
+    :type destination: str
+    """
     with open(destination, "w") as output_file:
-        output_file.write(export.ContextConverter(list_of_containers, env.export_mngr, destination).process_pile().read())
+        output_file.write(html)
 
 
 if __name__ == "__main__":  # pragma: no cover
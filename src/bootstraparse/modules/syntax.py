@@ -1,17 +1,27 @@
 # Dedicated module for the syntax of all the parsing
 # All tokens inherit a SemanticType among SemanticType, ExplicitSemanticType and EmptySemanticType
 # All tokens have a label, and __eq__ and __ne__ methods.
+# The content of the tokens is a plain list built from the pyparsing results when the token is created (see
+#   SemanticType.from_parse_results), the named results needed downstream become attributes of the token.
 # Note: there is an UnimplementedToken
+# Stateless tokens (linebreaks and explicit markers) are flyweights: the parser shares one instance per class
+#   (see shared_token), and the context manager keeps their positions apart. Labels are interned strings.
 # Usage:
 #   from bootstraparse.modules.syntax import line
 #   line.parse_line('string') # returns a List of tokens
 #   line_to_replace.parse_line('string') # returns a List of tokens parsed for replacements
 #   imports.parse_line('string', True) # returns a List of tokens parsed for imports
+#   scan_preparse_line('string') # returns the imports and whether there are aliases or images, in a single pass
+#   scan_markers('string') # returns the names of the images and aliases of a line, as ('image' | 'alias', name)
+#   shared_token(Linebreak) # returns the shared instance of a flyweight token class
 #   any_token.create_diagram("filename") # Debugging
 
 import os
+import re
+import sys
 from itertools import zip_longest
 from collections import namedtuple
+from typing import Any, Dict, List, Optional
 
 from bootstraparse.modules.error_mngr import MismatchedContainerError
 from bootstraparse.modules import context_mngr as cm
@@ -25,7 +35,16 @@ class SemanticType:
     """
     Allows us to access basic operations and identify each token parsed.
     """
-    label = None
+    label: Optional[str] = None
+    flyweight = False  # True if the parser shares a single instance of the class, see Flyweight
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Interns the label of every token class, so that comparing labels mostly comes down to comparing identities.
+        """
+        super().__init_subclass__(**kwargs)
+        if isinstance(cls.label, str):
+            cls.label = sys.intern(cls.label)
 
     def __init__(self, content):
         """
@@ -38,6 +57,16 @@ class SemanticType:
         self.file_name = "Undefined"
         self.label_container = self.label
 
+    @classmethod
+    def from_parse_results(cls, results):
+        """
+        Creates a token from the results of a match, keeping only plain python objects.
+        :param results: the results of the match
+        :type results: pp.ParseResults | list
+        :rtype: SemanticType
+        """
+        return cls(results.as_list() if isinstance(results, pp.ParseResults) else list(results))
+
     def to_markup(self):
         """
         Function used for testing and readability purposes. Replaces matched markup with html-like tags.
@@ -123,7 +152,7 @@ class AddFirstElementToLabel(SemanticType):
     """
     def __init__(self, content):
         super().__init__(content)
-        self.label += ":" + content[0]
+        self.label = sys.intern(f"{self.label}:{content[0]}")
         self._addendum = content[0]
 
 
@@ -144,6 +173,21 @@ class ExplicitSemanticType(SemanticType):
         return cm.TextContainer([TextToken(self.content[0])])
 
 
+class Flyweight:
+    """
+    Mixin for stateless tokens, whose content is always the same: the parser shares a single instance of the class.
+    The context manager does not write the position of these tokens on them but keeps it apart.
+    """
+    flyweight = True
+    content: List[Any]  # Set by SemanticType, the mixin comes first in the bases
+
+    def __reduce__(self):
+        """
+        Unpickling (and copying) a flyweight gives back the shared instance.
+        """
+        return shared_token, (type(self), self.content)
+
+
 class FinalSemanticType(SemanticType):
     """
     Semantic type used by the context manager to ascertain token is possible to encapsulate.
@@ -193,10 +237,28 @@ class UnimplementedToken(SemanticType):
 
 class AliasToken(SemanticType):
     label = "alias"
+    alias_name = None
+    optional = ""
+
+    @classmethod
+    def from_parse_results(cls, results):
+        token = super().from_parse_results(results)
+        token.alias_name = named_result(results, "alias_name", token.alias_name)
+        token.optional = named_result(results, "optional", token.optional)
+        return token
 
 
 class ImageToken(SemanticType):
     label = "image"
+    image_name = None
+    optional = ""
+
+    @classmethod
+    def from_parse_results(cls, results):
+        token = super().from_parse_results(results)
+        token.image_name = named_result(results, "image_name", token.image_name)
+        token.optional = named_result(results, "optional", token.optional)
+        return token
 
 
 class TextToken(EmptySemanticType):
@@ -207,22 +269,22 @@ class TextToken(EmptySemanticType):
 
 
 # FUTURE: all one-line elements should to inherit FinalSemanticType
-class EtEmToken(ExplicitSemanticType, TokensToMatch):
+class EtEmToken(Flyweight, ExplicitSemanticType, TokensToMatch):
     """*"""
     label = "text:em"
 
 
-class EtStrongToken(ExplicitSemanticType, TokensToMatch):
+class EtStrongToken(Flyweight, ExplicitSemanticType, TokensToMatch):
     """**"""
     label = "text:strong"
 
 
-class EtUnderlineToken(ExplicitSemanticType, TokensToMatch):
+class EtUnderlineToken(Flyweight, ExplicitSemanticType, TokensToMatch):
     """__"""
     label = "text:underline"
 
 
-class EtStrikethroughToken(ExplicitSemanticType, TokensToMatch):
+class EtStrikethroughToken(Flyweight, ExplicitSemanticType, TokensToMatch):
     """~~"""
     label = "text:strikethrough"
 
@@ -231,6 +293,10 @@ class EtCustomSpanToken(AddFirstElementToLabel, ExplicitSemanticType, TokensToMa
     """(#int)"""
     label = "text:custom_span"
 
+    @property
+    def span_id(self):
+        return self.content[0]
+
 
 class EtUlistToken(FinalSemanticType):
     """-"""
@@ -242,7 +308,20 @@ class EtOlistToken(FinalSemanticType):
     label = "list:olist"
 
 
-class HeaderToken(FinalSemanticType):
+class LevelledSemanticType(SemanticType):
+    """
+    Semantic type whose content is a marker, repeated to indicate the level, and a text.
+    """
+    @property
+    def level(self):
+        return len(self.content[0])
+
+    @property
+    def text(self):
+        return self.content[1]
+
+
+class HeaderToken(LevelledSemanticType, FinalSemanticType):
     """
     # string #
     number of # indicates level
@@ -250,7 +329,7 @@ class HeaderToken(FinalSemanticType):
     label = "header"
 
 
-class DisplayToken(FinalSemanticType):
+class DisplayToken(LevelledSemanticType, FinalSemanticType):
     """
     ! string !
     number of ! indicates level
@@ -273,6 +352,15 @@ class StructuralElementEndToken(AddFirstElementToLabel, ClosedSemanticType):
 
 class HyperlinkToken(FinalSemanticType):
     label = "hyperlink"
+    text = None
+    url = None
+
+    @classmethod
+    def from_parse_results(cls, results):
+        token = super().from_parse_results(results)
+        token.text = named_result(results, "text", token.text)
+        token.url = named_result(results, "url", token.url)
+        return token
 
 
 class TableToken(SemanticType):
@@ -323,11 +411,11 @@ class BlockQuoteAuthorToken(SemanticType):
     label = "bq:author"
 
 
-class CodeToken(ExplicitSemanticType, TokensToMatch):
+class CodeToken(Flyweight, ExplicitSemanticType, TokensToMatch):
     label = "code"
 
 
-class Linebreak(ExplicitSemanticType):
+class Linebreak(Flyweight, ExplicitSemanticType):
     label = "linebreak"
 
     def __init__(self, content):
@@ -338,6 +426,33 @@ class Linebreak(ExplicitSemanticType):
         return self
 
 
+class FragmentToken(FinalSemanticType):
+    """
+    Stands for the tokens of a self-contained imported file, whose html is rendered once (see fragments.py).
+    Its content is the html, the html to use when nested in another container, and the number of lines replaced.
+    """
+    label = "fragment"
+
+    def __init__(self, content):
+        super().__init__(content)
+        self.html, self.nested_html, self.lines = content
+
+
+def named_result(results, name, default=None):
+    """
+    Returns a named result of a match, or the default if there is none.
+    :param results: the results of the match
+    :param name: name of the result
+    :param default: value returned if the result is missing
+    :type results: pp.ParseResults | list
+    :type name: str
+    :rtype: object
+    """
+    if isinstance(results, pp.ParseResults) and name in results:
+        return results[name]
+    return default
+
+
 def of_type(token_class):
     """
     Function creating a custom function for generating the given Token type.
@@ -349,11 +464,46 @@ def of_type(token_class):
     def _of_type(_, __, content):
         if len(content) == 0:  # Drop Empty token
             return None
-        return token_class(content)
+        return token_class.from_parse_results(content)
 
     return _of_type
 
 
+"""
+Shared instances of the flyweight token classes.
+"""
+_shared_tokens: Dict[type, SemanticType] = {}
+
+
+def shared_token(token_class, content=()):
+    """
+    Returns the shared instance of a flyweight token class, creating it on first use.
+    :param token_class: Flyweight SemanticType class
+    :param content: content of the token, used only on first use
+    :type token_class: type
+    :type content: list | tuple | pp.ParseResults
+    :rtype: SemanticType
+    """
+    token = _shared_tokens.get(token_class)
+    if token is None:
+        token = _shared_tokens[token_class] = token_class(list(content))
+    return token
+
+
+def of_flyweight(token_class):
+    """
+    Function creating a custom function returning the shared instance of the given flyweight Token type.
+    :param token_class: Flyweight SemanticType class
+    :type token_class: type
+    :return: returns a function returning the shared instance of the given class
+    :rtype: function
+    """
+    def _of_flyweight(_, __, content):
+        return shared_token(token_class, content)
+
+    return _of_flyweight
+
+
 def reparse(parse_element):
     """
     Creates a function which reparses given match with specified parsing element.
@@ -427,6 +577,52 @@ def readable_markup(list_of_tokens):
 # Pre-parser expressions
 rgx_import_file = pps("::") + pp.OneOrMore(pps("<") + pp.SkipTo(">").set_name("file_name")("file_name") + pps(">"))
 
+# Pre-parser scanner, compiled equivalent of rgx_import_file combined with the start of image and alias elements
+rgx_preparse_scan = re.compile(r"::[ \t\r\n]*(?P<imports>(?:<[^>]*>[ \t\r\n]*)+)|@[{\[]")
+rgx_import_names = re.compile(r"<[ \t\r\n]*([^>]*)>")
+rgx_marker_names = re.compile(r"@\{([^}]*)\}|@\[([^\]]*)\]")
+
+
+def scan_preparse_line(line):
+    """
+    Scans a line in a single pass for an import statement and for image or alias markers.
+    Only the first import statement of a line is taken into account, like rgx_import_file.searchString.
+    :param line: line to scan
+    :type line: str
+    :return: the list of files imported on the line, and True if the line contains an image or alias marker
+    :rtype: (list[str], bool)
+    """
+    imports = None
+    has_markers = False
+    if "\t" in line:  # pyparsing expands the tabs before parsing
+        line = line.expandtabs()
+    for match in rgx_preparse_scan.finditer(line):
+        if match.group("imports") is None:
+            has_markers = True
+        elif imports is None:
+            imports = [name.rstrip() for name in rgx_import_names.findall(match.group("imports"))]
+        if has_markers and imports is not None:
+            break
+    return imports or [], has_markers
+
+
+def scan_markers(line):
+    """
+    Returns the names of the images and aliases of a line, as image_element and alias_element would read them.
+    Lines line_to_replace cannot parse, and leaves as they are, may still give names: never fewer than it replaces.
+    :param line: line to scan
+    :type line: str
+    :return: the kind of each marker, 'image' or 'alias', and its name
+    :rtype: list[(str, str)]
+    """
+    if "\t" in line:  # pyparsing expands the tabs before parsing
+        line = line.expandtabs()
+    return [
+        ("image", match.group(1)) if match.group(2) is None else ("alias", match.group(2))
+        for match in rgx_marker_names.finditer(line)
+    ]
+
+
 # Base elements
 quotes = pp.Word(r""""'""")
 value = (pps(quotes) + pp.Word(pp.alphanums + r'\._') + pps(pp.match_previous_literal(quotes)) ^
@@ -476,16 +672,16 @@ il_link = pp.Regex(
 ).add_parse_action(of_type(HyperlinkToken))
 
 # Enhanced text elements
-et_em = pp.Literal('*')('em').add_parse_action(of_type(EtEmToken))
-et_strong = pp.Literal('**')('strong').add_parse_action(of_type(EtStrongToken))
-et_underline = pp.Literal('__')('underline').add_parse_action(of_type(EtUnderlineToken))
-et_strikethrough = pp.Literal('~~')('strikethrough').add_parse_action(of_type(EtStrikethroughToken))
+et_em = pp.Literal('*')('em').add_parse_action(of_flyweight(EtEmToken))
+et_strong = pp.Literal('**')('strong').add_parse_action(of_flyweight(EtStrongToken))
+et_underline = pp.Literal('__')('underline').add_parse_action(of_flyweight(EtUnderlineToken))
+et_strikethrough = pp.Literal('~~')('strikethrough').add_parse_action(of_flyweight(EtStrikethroughToken))
 et_custom_span = (
         pps('(#') + pp.Word(pp.nums)('span_id') + pps(')')
 ).set_name('custom_span').add_parse_action(of_type(EtCustomSpanToken))
 
 # Code Token
-code = pp.Literal('```')('code').add_parse_action(of_type(CodeToken))
+code = pp.Literal('```')('code').add_parse_action(of_flyweight(CodeToken))
 
 # markup sums up all in-line elements
 markup = il_link | et_strong | et_em | et_strikethrough | et_underline | et_custom_span | code  # not quite correct but good enough for now # noqa : E501
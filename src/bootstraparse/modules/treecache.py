@@ -0,0 +1,150 @@
+# On-disk cache of the containers of the pages, as returned by the context manager
+# Like the .pyc files of Python, an entry is keyed by a hash of its input, the expanded and replaced text of the page,
+#   and of the version of bootstraparse. Each entry starts with a header: a magic number and the schema of the
+#   cache, a hash of the source of the modules defining the tokens and the containers (syntax and context_mngr) and
+#   their binary encoding (codec). Any change to these classes changes the schema, so the entries encoded with the
+#   old classes are never loaded again. The containers are stored in the format of codec, compressed.
+# When the imported files are spliced as pre-rendered fragments, their html depends on the configs and templates,
+#   which are then part of the key, along with the lines of the imports.
+# Entries are written to a temporary file in the cache folder, then renamed over the entry: concurrent builds
+#   sharing the folder only ever read complete entries, the last writer of an identical entry wins.
+# Usage:
+#   from bootstraparse.modules.treecache import ContainerCache
+#   cache = ContainerCache(environment, "cache/containers")
+#   key = cache.key(text, preparser)
+#   containers = cache.load(key) # None on a miss
+#   cache.store(key, containers)
+#   cache.hits, cache.misses, cache.invalid, cache.stored # statistics of the build
+
+import hashlib
+import os
+import tempfile
+import zlib
+
+import bootstraparse
+from bootstraparse.modules import syntax, context_mngr, codec
+
+
+MAGIC = b"BPCT"
+CACHE_FORMAT = 2
+
+
+def schema():
+    """
+    Returns the hash of everything the encoded containers depend on: the format of the cache and the source of the
+    modules defining the tokens, the containers and their encoding.
+    :rtype: bytes
+    """
+    digest = hashlib.sha256(f"{CACHE_FORMAT}".encode())
+    for module in (syntax, context_mngr, codec):
+        path = module.__file__
+        if path is None:  # pragma: no cover
+            raise ImportError(f"The source of {module.__name__} is not available, the cache needs its file.")
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.digest()
+
+
+class ContainerCache:
+    """
+    Containers of the pages encoded to a cache folder, keyed by the text of the page.
+    """
+    def __init__(self, _env, folder):
+        """
+        :param _env: the environment of the build
+        :param folder: the cache folder
+        :type _env: bootstraparse.modules.environment.Environment
+        :type folder: str
+        """
+        self._env = _env
+        self.folder = folder
+        self.schema = schema()
+        self._context = None
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self.stored = 0
+
+    def context(self):
+        """
+        Returns the hash of the configs and templates when the imported files are spliced as fragments, computed once.
+        :rtype: str
+        """
+        if self._context is None:
+            self._context = ""
+            if self._env.fragment_cache is not None:
+                self._context = hashlib.sha256(repr((
+                    self._env.config.loaded_conf, self._env.export_mngr.templates.loaded_conf
+                )).encode()).hexdigest()
+        return self._context
+
+    def key(self, text, preparser):
+        """
+        Returns the key of the containers of a page.
+        :param text: the expanded and replaced text of the page
+        :param preparser: the preparser of the page
+        :type text: str
+        :type preparser: bootstraparse.modules.preparser.PreParser
+        :rtype: str
+        """
+        digest = hashlib.sha256(f"{bootstraparse.__version__}\0{self.context()}\0".encode())
+        digest.update(self.schema)
+        if self._env.fragment_cache is not None:
+            digest.update(repr([
+                (first_line, block.output_lines, imported.path) for first_line, block, imported
+                in preparser.replaced_imports
+            ]).encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        return os.path.join(self.folder, key[:2], key[2:] + ".bpc")
+
+    def load(self, key):
+        """
+        Returns the containers of an entry, None if there is none or if it was written with another schema.
+        :type key: str
+        :rtype: list[context_mngr.BaseContainer] | None
+        """
+        try:
+            with open(self.path(key), "rb") as entry:
+                data = entry.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        header = MAGIC + self.schema
+        try:
+            if not data.startswith(header):
+                raise ValueError("outdated header")
+            containers = codec.decode(zlib.decompress(data[len(header):]))
+        except (ValueError, zlib.error):
+            self.invalid += 1
+            return None
+        self.hits += 1
+        return containers
+
+    def store(self, key, containers):
+        """
+        Writes an entry atomically.
+        :type key: str
+        :type containers: list[context_mngr.BaseContainer]
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = MAGIC + self.schema + zlib.compress(codec.encode(containers))
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as entry:
+                entry.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.stored += 1
+
+    def __repr__(self):
+        return f"ContainerCache({self.hits} hits, {self.misses} misses, {self.invalid} invalid, {self.stored} stored)"
@@ -0,0 +1,119 @@
+# Testing the codec module
+import os
+import struct
+from io import StringIO
+
+import pytest
+
+import test_context_mngr
+import test_context_mngr_export
+import test_parser
+from bootstraparse.modules import codec, syntax, context_mngr, parser, sitecreator, export, config, pathresolver
+
+_EXPORT_MANAGER = export.ExportManager(
+    config.ConfigLoader(pathresolver.b_path("configs/")), config.ConfigLoader(pathresolver.b_path("templates/"))
+)
+
+
+def same(a, b):
+    """
+    Checks that a decoded structure b is identical to a: same types, same attributes, flyweights shared.
+    """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, syntax.Flyweight):
+        return b is syntax.shared_token(type(a)) and a.content == b.content
+    if isinstance(a, (syntax.SemanticType, context_mngr.BaseContainer)):
+        return list(vars(a)) == list(vars(b)) and all(same(vars(a)[k], vars(b)[k]) for k in vars(a))
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(same(a[k], b[k]) for k in a)
+    return a == b
+
+
+def round_trip(value):
+    return codec.decode(codec.encode(value))
+
+
+@pytest.mark.parametrize("tokens, containers", [
+    pytest.param(*case[:2], id=str(i)) for i, case in enumerate(test_context_mngr._token_list_with_expected_result)
+    if all(not isinstance(container, type) for container in case[1])  # Not the expected errors
+])
+def test_context_mngr_structures(tokens, containers):
+    assert same(tokens, round_trip(tokens))
+    assert same(containers, round_trip(containers))
+
+
+@pytest.mark.parametrize("container, html", [
+    pytest.param(*case[:2], id=case[1], marks=case[3:]) for case in test_context_mngr_export._list_classes_expected_value
+])
+def test_export_structures(container, html):
+    decoded = round_trip(container)
+    assert same(container, decoded)
+    assert decoded.export(_EXPORT_MANAGER) == html
+
+
+def test_parsed_tokens():
+    tokens = parser.parse_line(StringIO(test_parser.complete_list.getvalue()))
+    decoded = round_trip(tokens)
+    assert same(tokens, decoded)
+    assert [type(token) for token in decoded] == test_parser.expected_list
+    assert decoded[0] is syntax.shared_token(syntax.Linebreak)
+
+
+@pytest.mark.parametrize("site", ["example_userfiles", "website"])
+def test_pages(site):
+    origin = pathresolver.b_path(os.path.join("../..", site))
+    env = sitecreator.create_environment(origin, origin)
+    crawler = sitecreator.create_crawler(origin, origin, env)
+    for path, _ in crawler.page_paths():
+        pp = crawler.open_page(path)
+        tokens = parser.parse_line(pp.do_replacements(), env.parse_cache)
+        assert same(tokens, round_trip(tokens))
+        containers = sitecreator.contextualise(tokens, pp)
+        data = codec.encode(containers)
+        decoded = codec.decode(data)
+        assert same(containers, decoded)
+        assert [c.export(env.export_mngr) for c in decoded] == [c.export(env.export_mngr) for c in containers]
+
+
+def test_values():
+    values = [None, True, False, 0, -1, 2 ** 40, -(2 ** 63), 1.5, "", "é\U0001f600\ud800", (1, "a"), {"k": [1, {}]}]
+    assert same(values, round_trip(values))
+    with pytest.raises(TypeError):
+        codec.encode(2 ** 63)
+    with pytest.raises(TypeError):
+        codec.encode([object()])
+
+
+def test_shared_objects():
+    token = syntax.TextToken(["shared"])
+    container = context_mngr.TextContainer([token])
+    decoded = round_trip([container, token, container])
+    assert decoded[0] is decoded[2] and decoded[0].content[0] is decoded[1]
+    assert same([container, token, container], decoded)
+
+
+def test_item_size():
+    assert codec.encode(["a"])[5:6] == b"B"
+    assert codec.encode([str(i) for i in range(300)])[5:6] == b"H"
+    assert codec.encode(2 ** 40)[5:6] == b"Q"
+
+
+def test_invalid_streams():
+    data = codec.encode([syntax.TextToken(["text"])])
+    with pytest.raises(ValueError, match="magic"):
+        codec.decode(b"XXXX" + data[4:])
+    with pytest.raises(ValueError, match="format"):
+        codec.decode(data[:4] + bytes([codec.FORMAT_VERSION + 1]) + data[5:])
+    for end in (3, 12, -1):
+        with pytest.raises(ValueError, match="Truncated"):
+            codec.decode(data[:end])
+    header = data[:4] + bytes([codec.FORMAT_VERSION]) + b"B" + struct.pack("<I", 3)
+    with pytest.raises(ValueError, match="Truncated"):  # The length of the list is missing
+        codec.decode(header + bytes([0, 0, codec._LIST]))
+    with pytest.raises(ValueError, match="opcode"):
+        codec.decode(header + bytes([0, 0, 99]))
+    with pytest.raises(ValueError, match="unknown class"):
+        codec.decode(data.replace(b"TextToken", b"TextTaken"))
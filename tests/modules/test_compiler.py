@@ -0,0 +1,174 @@
+# Testing the compiler module
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import compiler, sitecreator, profiler
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_DEST = os.path.join(_TEMP_DIRECTORY.name, "dest")
+_CACHE = os.path.join(_TEMP_DIRECTORY.name, "compiled")
+files = {
+    "index.bpr": "::<_footer.bpr>\n# Welcome to @[site_name]\n<<div\nVersion @[version]\ndiv>>\n*Bold* text\n",
+    "about.bpr": "About @[site_name]\n",
+    "_footer.bpr": "Made by @[author]\n",
+    "_entry.bpr": "Term: @[record.value]\n",
+    "configs/glossary.yaml": "a: Alpha\n",
+    "configs/datasets.yaml": 'glossary:\n  template: "_entry.bpr"\n',
+}
+aliases = {"site_name": "Idle Corp", "version": "1.2", "author": "Ada"}
+
+
+def write_files(base, site_files):
+    for path, content in site_files.items():
+        os.makedirs(os.path.dirname(os.path.join(base, path)), exist_ok=True)
+        with open(os.path.join(base, path), "w") as f:
+            f.write(content)
+
+
+def write_config(base, values, compiled_pages):
+    write_files(base, {
+        "configs/aliases.yaml": "shortcuts:\n" + "".join(f"  {name}: '{value}'\n" for name, value in values.items()),
+        "configs/parser_config.yml": f"parsing:\n  compiled_pages: '{compiled_pages}'\n",
+    })
+
+
+def build(values, compiled_pages=_CACHE):
+    """
+    Builds the pages of the site with the given aliases, returns the page compiler and the html of each page.
+    """
+    write_config(_BASE, values, compiled_pages)
+    env = sitecreator.create_environment(_BASE, _DEST)
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    crawler.set_all_preparsers()
+    pages = {}
+    for element, destination in crawler:
+        pages[element.name] = sitecreator.render_page(element, destination, env, profiler.Profiler(), _BASE)
+    return env.page_compiler, pages
+
+
+@pytest.fixture(autouse=True)
+def site():
+    write_files(_BASE, files)
+    yield
+    for name in os.listdir(_CACHE) if os.path.isdir(_CACHE) else []:
+        os.remove(os.path.join(_CACHE, name))
+
+
+def test_same_html():
+    expected = build(aliases, "")[1]
+    page_compiler, pages = build(aliases)
+    assert (page_compiler.compiled, page_compiler.hits) == (2, 0)
+    assert pages == expected
+    page_compiler, pages = build(aliases)
+    assert (page_compiler.compiled, page_compiler.hits) == (0, 2)
+    assert pages == expected
+    assert "Idle Corp" in pages["index.bpr"] and "<em>Bold</em>" in pages["index.bpr"]
+    assert "PageCompiler(2 pages rendered, 0 compiled, 0 not compilable, 0 invalid)" == repr(page_compiler)
+
+
+def test_variables():
+    build(aliases)
+    changed = dict(aliases, site_name="Idle Games", version="2.0")
+    page_compiler, pages = build(changed)
+    assert (page_compiler.compiled, page_compiler.hits) == (0, 2)
+    assert pages == build(changed, "")[1]
+    # The aliases of the imported files are not variables
+    changed["author"] = "Alan"
+    page_compiler, pages = build(changed)
+    assert (page_compiler.compiled, page_compiler.hits) == (1, 1)
+    assert "Alan" in pages["index.bpr"]
+
+
+def test_markup_value():
+    build(aliases)
+    changed = dict(aliases, site_name="**Idle** Corp")
+    page_compiler, pages = build(changed)
+    assert (page_compiler.compiled, page_compiler.hits) == (2, 0)
+    assert pages == build(changed, "")[1]
+    assert "<strong>Idle</strong>" in pages["about.bpr"]
+
+
+def test_source_change():
+    build(aliases)
+    write_files(_BASE, {"about.bpr": "All about @[site_name]\n"})
+    page_compiler, pages = build(aliases)
+    assert (page_compiler.compiled, page_compiler.hits) == (1, 1)
+    assert "All about" in pages["about.bpr"]
+
+
+def test_not_compilable():
+    write_config(_BASE, aliases, _CACHE)
+    env = sitecreator.create_environment(_BASE, _DEST)
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    calls = []
+
+    def build_page(pp):  # Not the same html from one build to the other
+        calls.append(pp)
+        return f"<p>{len(calls)}</p>"
+
+    page_compiler = compiler.PageCompiler(env, _CACHE)
+    pp = crawler.open_page(os.path.join(_BASE, "about.bpr"))
+    assert page_compiler.render(pp, build_page) == "<p>1</p>"
+    assert page_compiler.not_compilable == 1
+    with open(page_compiler.module_path(pp)) as module_file:
+        assert "render = None  # Not compilable" in module_file.read()
+    page_compiler = compiler.PageCompiler(env, _CACHE)
+    assert page_compiler.render(pp, build_page) == "<p>3</p>"  # Built as usual, not compiled again
+    assert (page_compiler.compiled, page_compiler.hits, page_compiler.not_compilable) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("content", ["FINGERPRINT = 'abc'\nFIELDS = ('a',\n", "FINGERPRINT = 'abc'\n", "\xff"])
+def test_invalid_module(content):
+    build(aliases)
+    path = next(os.path.join(_CACHE, name) for name in sorted(os.listdir(_CACHE)))
+    with open(path, "w", encoding="latin-1") as module_file:  # Truncated by an interrupted build
+        module_file.write(content)
+    page_compiler, pages = build(aliases)
+    assert (page_compiler.invalid, page_compiler.compiled, page_compiler.hits) == (1, 1, 1)
+    assert pages == build(aliases, "")[1]
+    with open(path) as module_file:
+        assert module_file.read().startswith("# Compiled by bootstraparse")
+
+
+def test_upgrade(monkeypatch):
+    schema = build(aliases)[0].schema
+    monkeypatch.setattr(compiler.bootstraparse, "__version__", "upgraded")
+    page_compiler = build(aliases)[0]
+    assert page_compiler.schema != schema
+    assert (page_compiler.compiled, page_compiler.hits) == (2, 0)  # Compiled again by the new version
+    assert (build(aliases)[0].compiled, build(aliases)[0].hits) == (0, 2)
+
+
+def test_atomic_write(monkeypatch):
+    build(aliases)
+    assert not [name for name in os.listdir(_CACHE) if name.startswith(".tmp-")]
+
+    def interrupted(source, destination):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(compiler.os, "replace", interrupted)
+    page_compiler = compiler.PageCompiler(sitecreator.create_environment(_BASE, _DEST), _CACHE)
+    with pytest.raises(KeyboardInterrupt):
+        page_compiler.write(os.path.join(_CACHE, "page_x.py"), "render = None\n")
+    assert len(os.listdir(_CACHE)) == 2  # Neither the module nor its temporary file
+
+
+def test_generate_source():
+    source = compiler.generate_source("page.bpr", "abc", ["name", "title"], ["<h1>", 1, "</h1>", 0, ""])
+    namespace = {}
+    exec(source, namespace)
+    assert namespace["FINGERPRINT"] == "abc" and namespace["FIELDS"] == ("name", "title")
+    assert namespace["render"]({"name": "Ada", "title": "Hello"}) == "<h1>Hello</h1>Ada"
+    assert source.startswith("# Compiled by bootstraparse from page.bpr")
+
+
+def test_create_website():
+    write_config(_BASE, aliases, _CACHE)
+    for _ in range(2):
+        assert sitecreator.create_website(_BASE, _DEST) == 0
+    with open(os.path.join(_DEST, "glossary", "a.html")) as f:
+        assert "Alpha" in f.read()  # The template of the dataset is not compiled
+    assert len(os.listdir(_CACHE)) == 2
@@ -80,3 +80,53 @@ def test_contains():
 def test_bad_type():
     with pytest.raises(TypeError):
         config.ConfigLoader(1)
+
+
+def test_lazy_load():
+    usr_c = config.ConfigLoader([user_conf, app_conf])
+    assert usr_c.loaded_conf.loaded() == []
+    assert sorted(usr_c.loaded_conf) == ["aliases", "custom_template", "glossary", "parser_config"]
+    assert len(usr_c.loaded_conf) == 4 and "glossary" in usr_c and "missing" not in usr_c.loaded_conf
+    assert usr_c["glossary"] == {"glossary": {"test_glossary": "test_parser"}}  # The later folders override
+    assert usr_c.loaded_conf.loaded() == ["glossary"]
+    with pytest.raises(TypeError):  # Read-only
+        usr_c.loaded_conf["glossary"] = {}
+    assert repr(usr_c) == repr(dict(usr_c.loaded_conf.items()))
+    usr_c.reload_all()
+    assert usr_c.loaded_conf.loaded() == []
+
+
+def test_folder_added_after_lookup():
+    usr_c = config.ConfigLoader(user_conf)
+    assert usr_c["glossary"]["glossary"]["test_glossary"] == "second_parser"
+    glossary = usr_c["glossary"]
+    usr_c.add_folder(app_conf)  # Parsed right away for the names already looked up
+    assert usr_c["glossary"]["glossary"]["test_glossary"] == "test_parser"
+    assert glossary["glossary"]["test_glossary"] == "second_parser"  # Not modified in place"
+    assert usr_c.loaded_conf.loaded() == ["glossary"]
+
+
+def test_layers(tmp_path):
+    for folder, content in [("first", "a:\n  x: 1\n  y: [1, 2]\n  z: {deep: 1}\nb: 1\nc: {x: 1}\n"),
+                            ("second", "a:\n  x: 2\n  z: {other: 2}\nb: {x: 2}\nc: 3\nd: 4\n")]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "layered.yaml").write_text(content)
+    layered = config.ConfigLoader([str(tmp_path / "first"), str(tmp_path / "second")])["layered"]
+    assert layered == {"a": {"x": 2, "y": (1, 2), "z": {"other": 2}}, "b": {"x": 2}, "c": 3, "d": 4}
+    assert list(layered) == ["a", "b", "c", "d"]
+    with pytest.raises(TypeError):
+        layered["a"]["x"] = 3
+    with pytest.raises(TypeError):
+        layered["a"]["z"]["other"] = 3
+    (tmp_path / "first" / "records.yaml").write_text("- a\n- b\n")
+    (tmp_path / "second" / "records.yaml").write_text("x: 1\n")
+    assert config.ConfigLoader(str(tmp_path / "first"))["records"] == ("a", "b")
+    assert config.ConfigLoader([str(tmp_path / "first"), str(tmp_path / "second")])["records"] == {"x": 1}
+    assert config.ConfigLoader([str(tmp_path / "second"), str(tmp_path / "first")])["records"] == ("a", "b")
+
+
+def test_bad_config_parsed_on_lookup():
+    usr_c = config.ConfigLoader(bad_conf)  # Not parsed yet
+    with pytest.raises(ScannerError):
+        assert usr_c.loaded_conf["bad_config"]
+    assert usr_c.loaded_conf.loaded() == []
@@ -696,3 +696,56 @@ def test_finalize_pile(base_cm):
     base_cm.pile[0] = sy.TextToken(['e'])
     with pytest.raises(TypeError):
         base_cm.finalize_pile()
+
+
+def test_origin():
+    tokens = [
+        sy.TextToken(["1"]),
+        sy.Linebreak(""),
+        sy.Linebreak(""),
+        sy.Linebreak(""),
+        sy.StructuralElementEndToken(["div"]),
+    ]
+    cm = context_mngr.ContextManager(tokens, name="page.bpr", origin=lambda n: ("partial.bpr", n + 10))
+    with pytest.raises(error_mngr.MismatchedContainerError) as error:
+        cm()
+    assert error.value.name == "partial.bpr"
+    assert error.value.line == 14
+    assert tokens[0].file_name == "partial.bpr"
+    assert tokens[0].line_number == 11
+
+
+def test_flyweight_positions():
+    em = sy.shared_token(sy.EtEmToken, ["*"])
+    tokens = [sy.TextToken(["1"]), sy.shared_token(sy.Linebreak), em, sy.TextToken(["2"])]
+    cm = context_mngr.ContextManager(tokens, name="page.bpr", origin=lambda n: ("partial.bpr", n + 10))
+    with pytest.raises(TypeError) as error:
+        cm()
+    assert "at line 12 in file partial.bpr" in str(error.value)
+    assert cm.positions == {1: ("partial.bpr", 11), 2: ("partial.bpr", 12)}
+    assert em.line_number == "Undefined"
+
+
+def test_flyweight_error_positions():
+    em = sy.shared_token(sy.EtEmToken, ["*"])
+    em.file_name, em.line_number = "stale.bpr", 99  # Left by another page on the shared instance
+    tokens = [sy.TextToken(["1"]), sy.shared_token(sy.Linebreak), em, sy.OptionalToken([])]
+    cm = context_mngr.ContextManager(tokens, name="page.bpr", origin=lambda n: ("partial.bpr", n + 10))
+    with pytest.raises(error_mngr.LonelyOptionalError) as error:
+        cm()
+    assert "at line 12 in file partial.bpr" in str(error.value) and "99" not in str(error.value)
+    error = error_mngr.MismatchedContainerError(em, ("partial.bpr", 12))
+    assert (error.name, error.line) == ("partial.bpr", 12)
+    em.file_name, em.line_number = "Undefined", "Undefined"
+
+
+def test_scan_matches():
+    lb = sy.shared_token(sy.Linebreak)
+    em = sy.shared_token(sy.EtEmToken, ["*"])
+    div, end_div = sy.StructuralElementStartToken(["div"]), sy.StructuralElementEndToken(["div"])
+    assert context_mngr.scan_matches([div, lb, em, sy.TextToken(["1"]), lb, em, lb]) == {"se:start:div": 1, "text:em": 0}
+    assert context_mngr.scan_matches([end_div, lb], {"se:start:div": 1}) == {"se:start:div": 0}
+    assert context_mngr.scan_matches([end_div, lb]) is None
+    assert context_mngr.scan_matches([sy.TableSeparatorToken(["-"])]) is None
+    rows = [sy.TableRowToken([]), lb, sy.TableSeparatorToken(["-"]), lb, sy.TableRowToken([]), lb, lb, lb]
+    assert context_mngr.scan_matches(rows) == {}
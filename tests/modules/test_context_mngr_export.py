@@ -15,10 +15,7 @@ _opts = sy.OptionalToken([
 ])
 
 
-class FalseHyperlink(list):
-    url = "http://test.com"
-    content = ["test9"]
-    text = "test9"
+_HYPERLINK = sy.il_link.parse_string("[test9](http://test.com)")[0]
 
 
 _list_classes_expected_value = [
@@ -106,7 +103,7 @@ _list_classes_expected_value = [
     ],
     [
         context_mngr.HyperLinkContainer([
-            sy.HyperlinkToken(FalseHyperlink(['test9'])),
+            _HYPERLINK,
         ]),
         "<a href=\"http://test.com\">test9</a>",
         __GLk(1),
@@ -0,0 +1,149 @@
+# Testing the datasets module
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import datasets, sitecreator
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_DEST = os.path.join(_TEMP_DIRECTORY.name, "dest")
+template = "::<_header.bpr>\nTerm: @[record.key]\n<<div\n@[record.value]\ndiv>>\nSee @[do_not_remove_s]\n"
+files = {
+    "_header.bpr": "*Glossary*\n",
+    "_entry.bpr": template,
+    "_person.bpr": "Name: @[record.name]\n@[record.role]\n",
+    "configs/aliases.yaml": "shortcuts:\n  do_not_remove_s: 'the index'\n",
+    "configs/glossary.yaml": 'Superword: "Super word"\nDefined: "A word that has a definition"\nTwo words: "Two"\n'
+                             'Strong: "first **strong** letter"\nStruck: "x ~~y~~ z"\nHeader: "# not a header #"\n',
+    "configs/people.yaml": "- name: Ada\n  role: Engineer\n- name: Alan\n  role: Mathematician\n",
+    "configs/datasets.yaml": 'glossary:\n  template: "_entry.bpr"\n'
+                             'people:\n  template: "_person.bpr"\n  output: "people/{key}-{name}.html"\n'
+                             '  markup: false\n',
+}
+
+
+def write_files(base, site_files):
+    for path, content in site_files.items():
+        os.makedirs(os.path.dirname(os.path.join(base, path)), exist_ok=True)
+        with open(os.path.join(base, path), "w") as f:
+            f.write(content)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def site():
+    write_files(_BASE, files)
+    sitecreator.create_website(_BASE, _DEST)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_slugify():
+    assert datasets.slugify("Two words") == "Two-words"
+    assert datasets.slugify("a/b?") == "a-b"
+    assert datasets.slugify("??") == "-"
+
+
+def test_make_records():
+    assert datasets.make_records({"a": "x", "b": None}) == [
+        {"value": "x", "key": "a", "slug": "a"}, {"value": "", "key": "b", "slug": "b"}
+    ]
+    assert datasets.make_records({"a b": {"n": 1}}) == [{"n": "1", "key": "a b", "slug": "a-b"}]
+    assert datasets.make_records([{"n": 1}, "y"]) == [
+        {"n": "1", "key": "0", "slug": "0"}, {"value": "y", "key": "1", "slug": "1"}
+    ]
+    with pytest.raises(TypeError):
+        datasets.make_records("text")
+
+
+@pytest.mark.parametrize("key, value", [
+    ("Superword", "Super word"), ("Defined", "A word that has a definition"), ("Two words", "Two"),
+    ("Strong", "first **strong** letter"), ("Struck", "x ~~y~~ z"), ("Header", "# not a header #"),
+])
+def test_same_html_as_aliases(key, value):
+    # Each page is the template built with the values of its record as aliases, markup values included
+    with tempfile.TemporaryDirectory() as folder:
+        write_files(folder, {
+            "page.bpr": template,
+            "_header.bpr": files["_header.bpr"],
+            "configs/aliases.yaml": f"shortcuts:\n  do_not_remove_s: 'the index'\n"
+                                    f"  record.key: '{key}'\n  record.value: '{value}'\n",
+        })
+        sitecreator.create_website(folder, os.path.join(folder, "out"))
+        expected = read(os.path.join(folder, "out", "page.html"))
+    assert read(os.path.join(_DEST, "glossary", f"{datasets.slugify(key)}.html")) == expected
+
+
+def test_fields():
+    assert read(os.path.join(_DEST, "people", "0-Ada.html")) == "Name:Ada\nEngineer\n"
+    assert sorted(os.listdir(os.path.join(_DEST, "people"))) == ["0-Ada.html", "1-Alan.html"]
+    assert "Mathematician" in read(os.path.join(_DEST, "people", "1-Alan.html"))
+    assert not os.path.exists(os.path.join(_DEST, "_entry.html"))
+
+
+def test_markup_values():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    dataset = datasets.Dataset("people", os.path.join(_BASE, "_person.bpr"),
+                               [{"key": "0", "name": "*Ada*", "role": "<b>Engineer</b>"}], "markup.html", True)
+    assert datasets.build(dataset, crawler, lambda pp, _: sitecreator.export_html(
+        sitecreator.preparse_parse(pp), "", env)) == [os.path.join(_DEST, "markup.html")]
+    html = read(os.path.join(_DEST, "markup.html"))
+    assert "<em>Ada</em>" in html and "<b>Engineer</b>" in html
+
+
+@pytest.mark.parametrize("markup", [True, False])
+def test_placeholder_parsed_away(markup):
+    # The placeholder of the field is parsed as part of the optionals of the container, it never reaches the html
+    site = {"_class.bpr": "<<div\ntext\ndiv>>@[record.cls]\n", "page.bpr": "<<div\ntext\ndiv>>@[record.cls]\n",
+            "configs/aliases.yaml": "shortcuts:\n  record.cls: '{{text-bold}}'\n"}
+    with tempfile.TemporaryDirectory() as folder:
+        write_files(folder, site)
+        env = sitecreator.create_environment(folder, folder)
+        crawler = sitecreator.create_crawler(folder, os.path.join(folder, "out"), env)
+        dataset = datasets.Dataset("classes", os.path.join(folder, "_class.bpr"),
+                                   [{"key": "a", "cls": "{{text-bold}}"}], "a.html", markup)
+        datasets.build(dataset, crawler, lambda pp, _: sitecreator.export_html(sitecreator.preparse_parse(pp), "", env))
+        sitecreator.create_website(folder, os.path.join(folder, "out"))
+        assert read(os.path.join(folder, "out", "a.html")) == read(os.path.join(folder, "out", "page.html"))
+        assert "text-bold" in read(os.path.join(folder, "out", "a.html"))
+
+
+def test_substitution_checked():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    dataset = datasets.Dataset("people", os.path.join(_BASE, "_person.bpr"),
+                               [{"key": "0", "name": "Ada", "role": "x"}, {"key": "1", "name": "Alan", "role": "y"}],
+                               "checked/{key}.html", True)
+    renders = []
+
+    def render(pp, _):  # Not the html of the template with the values substituted
+        renders.append(pp)
+        return sitecreator.export_html(sitecreator.preparse_parse(pp), "", env).upper()
+
+    datasets.build(dataset, crawler, render)
+    assert len(renders) == 3  # The template, then each record in full once the check failed
+    assert read(os.path.join(_DEST, "checked", "1.html")) == "NAME:ALAN\nY\n"
+
+
+@pytest.mark.parametrize("records, output, error", [
+    ([{"key": "0", "name": "Ada", "role": "x"}, {"key": "1", "name": "Alan"}], "{key}.html", KeyError),
+    ([{"key": "0", "name": "Ada", "role": ""}, {"key": "1", "name": "Ada", "role": ""}], "{name}.html",
+     FileExistsError),
+])
+def test_errors(records, output, error):
+    env = sitecreator.create_environment(_BASE, _DEST)
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    dataset = datasets.Dataset("people", os.path.join(_BASE, "_person.bpr"), records, output, False)
+    with pytest.raises(error):
+        datasets.build(dataset, crawler, lambda pp, _: sitecreator.export_html(
+            sitecreator.preparse_parse(pp), "", env))
+
+
+def test_no_datasets():
+    with tempfile.TemporaryDirectory() as folder:
+        assert datasets.load_datasets(sitecreator.create_environment(folder, folder)) == []
@@ -0,0 +1,165 @@
+# Testing the fragments module
+import os
+import re
+import tempfile
+from io import StringIO
+
+import pytest
+
+from bootstraparse.modules import fragments, preparser, parser, sitecreator, syntax, error_mngr
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_SITE = os.path.join(_TEMP_DIRECTORY.name, "site")
+files = {
+    "_closed.bpr": "\n<<div\n# Title # {{t}}\n*closed* and **strong**\ndiv>>\n\n",
+    "_opened.bpr": "<<section\nopened\n",
+    "_em.bpr": "*emphasis*\n",
+    "_list.bpr": "- first\n- second\n",
+    "_empty.bpr": "\n\n",
+    "_two.bpr": "# Title #\ntext\n",
+    "top.bpr": "before\n::<_closed.bpr>\n\nafter\n::<_opened.bpr>\nsection>>\n::<_list.bpr>\n::<_empty.bpr>\nend\n",
+    "nested.bpr": "<<div\n::<_closed.bpr>\n::<_em.bpr>\ndiv>>\n",
+    "open_marker.bpr": "*start\n::<_em.bpr>\nend*\n::<_closed.bpr>\n",
+    "broken.bpr": "div>>\n::<_closed.bpr>\n",
+    "nested_two.bpr": "::<_two.bpr>\n<<div\n::<_two.bpr>\ndiv>>\n",
+    "configs/parser_config.yml": "parsing:\n  prerender_partials: true\n",
+}
+
+
+def make_site():
+    for name, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(_SITE, name)), exist_ok=True)
+        with open(os.path.join(_SITE, name), "w") as f:
+            f.write(content)
+
+
+def build(page, prerender=True, env=None):
+    """
+    Builds a page and returns its html and the environment of the build.
+    """
+    if env is None:
+        env = sitecreator.create_environment(_SITE, _SITE)
+        if not prerender:
+            env.fragment_cache = None
+    pp = preparser.PreParser(os.path.join(_SITE, page), env)
+    tokens = parser.parse_line(pp.do_replacements(), env.parse_cache)
+    return sitecreator.export_html(sitecreator.contextualise(tokens, pp), page, env), env
+
+
+@pytest.fixture(scope="module", autouse=True)
+def site():
+    make_site()
+
+
+@pytest.mark.parametrize("page", ["top.bpr", "nested.bpr", "open_marker.bpr"])
+def test_same_html(page):
+    expected, _ = build(page, prerender=False)
+    html, env = build(page)
+    assert html == expected
+    assert env.fragment_cache.spliced >= 1
+
+
+def test_splice():
+    html, env = build("top.bpr")
+    cache = env.fragment_cache
+    assert (cache.rendered, cache.spliced, cache.fallbacks) == (1, 1, 3)
+    assert len(cache) == 4
+    assert repr(cache) == "FragmentCache(1/4 files rendered, 1 spliced, 3 fallbacks)"
+
+    build("nested.bpr", env=env)
+    assert (cache.rendered, cache.spliced, cache.fallbacks) == (2, 3, 3)
+
+
+def test_splice_tokens():
+    env = sitecreator.create_environment(_SITE, _SITE)
+    pp = preparser.PreParser(os.path.join(_SITE, "top.bpr"), env)
+    tokens = parser.parse_line(pp.do_replacements())
+    spliced = env.fragment_cache.splice(tokens, pp)
+    fragment_tokens = [token for token in spliced if isinstance(token, syntax.FragmentToken)]
+    assert len(fragment_tokens) == 1
+    assert fragment_tokens[0].lines == 3
+    # The empty lines around the imported file stay in the page
+    index = spliced.index(fragment_tokens[0])
+    assert isinstance(spliced[index - 1], syntax.Linebreak) and isinstance(spliced[index - 2], syntax.Linebreak)
+    assert isinstance(spliced[index + 1], syntax.Linebreak) and isinstance(spliced[index + 2], syntax.Linebreak)
+
+    no_imports = preparser.PreParser(os.path.join(_SITE, "_closed.bpr"), env)
+    tokens = parser.parse_line(no_imports.do_replacements())
+    assert env.fragment_cache.splice(tokens, no_imports) is tokens
+
+
+def test_analyse():
+    def analyse(text):
+        return fragments.FragmentCache.analyse(parser.parse_line(StringIO(text)))
+
+    fragment = analyse("\n*a*\n<<div\nb\ndiv>>\n\n")
+    assert (fragment.html, fragment.lines, fragment.lead, fragment.trail) == (None, 3, 1, 2)
+    assert fragment.markers == frozenset({"text:em", None})
+    assert analyse("\n\n") is None
+    assert analyse("- item\ntext\n") is None
+    assert analyse("text\n#. item\n") is None
+    assert analyse("<<div\ntext\n") is None
+    assert analyse("text\ndiv>>\n") is None
+    assert analyse("*text\n") is None
+
+
+def test_nested_html():
+    html, _ = build("nested.bpr")
+    expected, _ = build("nested.bpr", prerender=False)
+    assert html == expected
+    assert "</div> <br />\n <em>emphasis</em> \n</div>" in html
+
+
+def test_open_marker_fallback():
+    html, env = build("open_marker.bpr")
+    assert (env.fragment_cache.spliced, env.fragment_cache.fallbacks) == (1, 1)
+    assert "<em>start<em>emphasis</em>end</em>" not in html
+
+
+def test_broken_page():
+    env = sitecreator.create_environment(_SITE, _SITE)
+    with pytest.raises(error_mngr.MismatchedContainerError):
+        build("broken.bpr", env=env)
+    assert (env.fragment_cache.spliced, env.fragment_cache.fallbacks, len(env.fragment_cache)) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("mode, pattern", [
+    ("ssi", r'<!--#include virtual="/site/([^"]+)" -->'),
+    ("esi", r'<esi:include src="/site/([^"]+)"/>'),
+])
+def test_include_mode(mode, pattern):
+    expected = [build(page, prerender=False)[0] for page in ("top.bpr", "nested.bpr", "nested_two.bpr")]
+    env = sitecreator.create_environment(_SITE, os.path.join(_TEMP_DIRECTORY.name, mode))
+    env.fragment_cache = fragments.FragmentCache(env, mode, base_url="/site")
+    pages = [build(page, env=env)[0] for page in ("top.bpr", "nested.bpr", "nested_two.bpr")]
+    assert len(env.fragment_cache.files) == 4  # _closed.bpr, _em.bpr and _two.bpr, nested or not
+    for html, inlined in zip(pages, expected):
+        assert re.search(pattern, html)
+
+        def include(match):
+            with open(os.path.join(env.destination, match.group(1))) as f:
+                return f.read()
+
+        assert re.sub(pattern, include, html) == inlined
+
+
+def test_stale_files():
+    env = sitecreator.create_environment(_SITE, os.path.join(_TEMP_DIRECTORY.name, "stale"))
+    env.fragment_cache = fragments.FragmentCache(env, "ssi")
+    folder = os.path.join(env.destination, "_fragments")
+    assert fragments.stale_files(folder, []) == [] and env.fragment_cache.remove_stale_files() == []
+    os.makedirs(folder)
+    for name in ("_closed-0123456789ab.html", "notes.txt"):
+        with open(os.path.join(folder, name), "w") as f:
+            f.write("old")
+    build("top.bpr", env=env)
+    assert fragments.stale_files(folder, env.fragment_cache.files) == [os.path.join(folder, "_closed-0123456789ab.html")]
+    assert env.fragment_cache.remove_stale_files() == [os.path.join(folder, "_closed-0123456789ab.html")]
+    assert sorted(os.listdir(folder)) == sorted([os.path.basename(path) for path in env.fragment_cache.files] + ["notes.txt"])
+
+
+def test_include_mode_unknown():
+    env = sitecreator.create_environment(_SITE, _SITE)
+    assert fragments.FragmentCache(env, "none").include_tag is None
+    with pytest.raises(ValueError):
+        fragments.FragmentCache(env, "php")
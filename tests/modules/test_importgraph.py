@@ -0,0 +1,146 @@
+# Testing the importgraph module
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import importgraph, sitecreator
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_DEST = os.path.join(_TEMP_DIRECTORY.name, "dest")
+_INDEX = os.path.join(_DEST, "_imports.json")
+files = {
+    "index.bpr": "::<_header.bpr>\n# Index #\n::<_footer.bpr>\n@{logo}\n",
+    "about.bpr": "::<_header.bpr>\n*About*\n",
+    "blog/post.bpr": "::<../_header.bpr>\n::<_sidebar.bpr>\n::<../_header.bpr>\n",
+    "blog/_sidebar.bpr": "::<../_links.bpr>\n",
+    "_header.bpr": "::<_links.bpr>\n# Header #\n",
+    "_footer.bpr": "footer\n",
+    "_links.bpr": "links @[home]\n",
+    "_unused.bpr": "unused\n",
+    "configs/aliases.yaml": "shortcuts:\n  home: '/'\nimages:\n  logo: 'logo.png'\n",
+    "configs/parser_config.yml": 'export:\n  import_index: "_imports.json"\n',
+}
+
+
+def write_site():
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(_BASE, path)), exist_ok=True)
+        with open(os.path.join(_BASE, path), "w") as f:
+            f.write(content)
+
+
+@pytest.fixture(scope="module")
+def graph():
+    write_site()
+    sitecreator.create_website(_BASE, _DEST)
+    return importgraph.ImportGraph.load(None, _INDEX)
+
+
+def test_index(graph):
+    assert graph.root == os.path.abspath(_BASE)
+    assert len(graph) == 7
+    assert graph.imports["blog/post.bpr"] == ("_header.bpr", "blog/_sidebar.bpr")
+    assert graph.imports["_footer.bpr"] == ()
+    assert "_unused.bpr" not in graph.imports
+    assert repr(graph) == "ImportGraph(7 files, 7 imports)"
+    with open(_INDEX) as f:
+        content = f.read()
+    assert " " not in content  # Compact
+    assert '"root":"../base"' in content  # Relative to the index
+
+
+def test_queries(graph):
+    assert graph.pages_including("_links.bpr") == ["about.bpr", "blog/post.bpr", "index.bpr"]
+    assert graph.pages_including("_links.bpr", transitive=False) == []
+    assert graph.dependents("_links.bpr", transitive=False) == ["_header.bpr", "blog/_sidebar.bpr"]
+    assert graph.dependencies("blog/post.bpr") == ["_header.bpr", "_links.bpr", "blog/_sidebar.bpr"]
+    assert graph.dependencies("index.bpr", transitive=False) == ["_footer.bpr", "_header.bpr"]
+    assert graph.dependencies("_links.bpr") == []
+    assert graph.most_shared(2) == [("_header.bpr", 3), ("_links.bpr", 3)]
+    assert graph.resolve("_header.bpr") == ["_header.bpr"]
+    assert graph.resolve("_sidebar.bpr") == ["blog/_sidebar.bpr"]
+    assert graph.resolve("missing.bpr") == []
+    assert graph.stale() == []
+
+
+def test_aliases(graph):
+    assert graph.aliases["_links.bpr"] == ("shortcuts/home",)
+    assert graph.aliases["_header.bpr"] == ()
+    assert graph.aliases_used("index.bpr") == ["images/logo", "shortcuts/home"]
+    assert graph.aliases_used("_footer.bpr") == []
+    assert graph.pages_using("shortcuts/home") == ["about.bpr", "blog/post.bpr", "index.bpr"]
+    assert graph.pages_using("images/logo") == ["index.bpr"]
+    assert graph.pages_using("shortcuts/missing") == []
+    assert graph.context and set(graph.digests) == {"shortcuts/home", "images/logo"}
+
+
+def test_incremental_update(graph):
+    with tempfile.TemporaryDirectory() as folder:
+        base, destination = os.path.join(folder, "base"), os.path.join(folder, "dest")
+        os.makedirs(os.path.join(base, "blog"))
+        os.makedirs(os.path.join(base, "configs"))
+        for path, content in files.items():
+            with open(os.path.join(base, path), "w") as f:
+                f.write(content)
+        sitecreator.create_website(base, destination)
+        os.remove(os.path.join(base, "blog", "post.bpr"))
+        with open(os.path.join(base, "about.bpr"), "w") as f:
+            f.write("::<_footer.bpr>\n")
+        updated = importgraph.ImportGraph.load(None, os.path.join(destination, "_imports.json"))
+        assert updated.stale() == ["about.bpr", "blog/post.bpr"]
+        sitecreator.create_website(base, destination)
+        updated = importgraph.ImportGraph.load(None, os.path.join(destination, "_imports.json"))
+        assert updated.stale() == []
+        assert "blog/post.bpr" not in updated.imports and "blog/_sidebar.bpr" not in updated.imports
+        assert updated.pages_including("_footer.bpr") == ["about.bpr", "index.bpr"]
+        assert updated.pages_including("_links.bpr") == ["index.bpr"]
+
+
+def test_pages_not_scanned_are_kept():
+    graph = importgraph.ImportGraph(_BASE, os.path.join(_TEMP_DIRECTORY.name, "kept.json"))
+    graph.record(os.path.join(_BASE, "about.bpr"), [(os.path.join(_BASE, "_header.bpr"), 0)])
+    graph.save()
+    graph = importgraph.ImportGraph.load(_BASE, graph.path)
+    graph.record(os.path.join(_BASE, "index.bpr"), [])
+    graph.save()
+    assert sorted(importgraph.ImportGraph.load(_BASE, graph.path).imports) == ["_header.bpr", "about.bpr", "index.bpr"]
+
+
+@pytest.mark.parametrize("content", [
+    "{",
+    '{"version": 0}',
+    '{"version": 3, "root": "", "files": ["a"], "stamps": [[0, 0]], "imports": [[3]], "aliases": [[]], '
+    '"keys": [], "digests": [], "context": null}',
+    '{"version": 3, "root": "", "files": ["a"], "stamps": [[0, 0]], "imports": [[]]}',
+])
+def test_invalid_index(content):
+    path = os.path.join(_TEMP_DIRECTORY.name, "invalid.json")
+    with open(path, "w") as f:
+        f.write(content)
+    graph = importgraph.ImportGraph.load(_BASE, path)
+    assert (graph.imports, graph.stamps, graph.aliases, graph.context, graph.digests) == ({}, {}, {}, None, {})
+
+
+def test_disabled_index():
+    with tempfile.TemporaryDirectory() as folder:
+        base = os.path.join(folder, "base")
+        os.makedirs(base)
+        assert sitecreator.create_environment(base, folder).import_graph is None  # Disabled by default
+        sitecreator.create_website(base, os.path.join(folder, "dest"))
+        assert os.listdir(os.path.join(folder, "dest")) == []
+
+
+def test_update(graph):
+    other = importgraph.ImportGraph(_BASE, "")
+    other.record(os.path.join(_BASE, "about.bpr"), [(os.path.join(_BASE, "_footer.bpr"), 0)], ["shortcuts/home"])
+    other.record(os.path.join(_BASE, "about.bpr"), [])  # Once per build
+    other.context, other.digests = "context", {"shortcuts/home": "digest"}
+    merged = importgraph.ImportGraph(_BASE, "")
+    merged.update(graph)
+    merged.update(other)
+    assert merged.imports["about.bpr"] == ("_footer.bpr",) and merged.aliases["about.bpr"] == ("shortcuts/home",)
+    assert merged.imports["index.bpr"] == graph.imports["index.bpr"]
+    assert (merged.context, merged.digests) == ("context", {"shortcuts/home": "digest"})
+    assert merged.pages_including("_footer.bpr") == ["about.bpr", "index.bpr"]
@@ -0,0 +1,139 @@
+# Testing the incremental module
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import incremental, sitecreator, shards, config, pathresolver
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_DEST = os.path.join(_TEMP_DIRECTORY.name, "dest")
+files = {
+    "index.bpr": "::<_header.bpr>\n# Index\n@{logo}\n",
+    "about.bpr": "::<_header.bpr>\nAbout @[team]\n",
+    "blog/post.bpr": "::<../_footer.bpr>\nPost\n",
+    "_header.bpr": "Welcome to @[site_name]\n",
+    "_footer.bpr": "Footer\n",
+    "_entry.bpr": "::<_footer.bpr>\n@[record.value] by @[team]\n",
+    "configs/datasets.yaml": 'words:\n  template: "_entry.bpr"\n',
+    "configs/words.yaml": 'one: "One"\ntwo: "Two"\n',
+    "configs/parser_config.yml": "export:\n  incremental: true\n  import_index: _imports.json\n",
+}
+aliases = {"shortcuts": {"site_name": "Idle Corp", "team": "Ada"}, "images": {"logo": "logo.png"}}
+
+
+def write_files(site_files):
+    for path, content in site_files.items():
+        os.makedirs(os.path.dirname(os.path.join(_BASE, path)), exist_ok=True)
+        with open(os.path.join(_BASE, path), "w") as f:
+            f.write(content)
+
+
+def write_aliases(values):
+    write_files({"configs/aliases.yaml": "".join(
+        f"{section}:\n" + "".join(f"  {name}: '{value}'\n" for name, value in names.items())
+        for section, names in values.items()
+    )})
+
+
+def planned():
+    """
+    Returns the reason each page would be built for, by page.
+    """
+    env = sitecreator.create_environment(_BASE, _DEST)
+    return incremental.plan(sitecreator.create_crawler(_BASE, _DEST, env), env).reasons
+
+
+def read(page):
+    with open(os.path.join(_DEST, page)) as f:
+        return f.read()
+
+
+@pytest.fixture(autouse=True)
+def site():
+    write_files(files)
+    write_aliases(aliases)
+    sitecreator.create_website(_BASE, _DEST)
+
+
+def test_first_build():
+    index = os.path.join(_DEST, "_imports.json")
+    os.remove(index)
+    assert planned() == {"index.bpr": "new index", "about.bpr": "new index", "blog/post.bpr": "new index",
+                         "_entry.bpr": "new index"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert planned() == {}
+    assert "Idle Corp" in read("index.html") and "Post" in read("blog/post.html")
+
+
+def test_nothing_changed():
+    modified = os.stat(os.path.join(_DEST, "index.html")).st_mtime_ns
+    sitecreator.create_website(_BASE, _DEST)
+    assert os.stat(os.path.join(_DEST, "index.html")).st_mtime_ns == modified
+
+
+def test_alias_changed():
+    write_aliases({**aliases, "shortcuts": {**aliases["shortcuts"], "team": "Alan", "unused": "Unused"}})
+    assert planned() == {"about.bpr": "aliases changed", "_entry.bpr": "aliases changed"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert "Alan" in read("about.html") and "Alan" in read("words/two.html")
+    write_aliases({**aliases, "shortcuts": {"team": "Ada"}})  # Removed
+    assert planned() == {"index.bpr": "aliases changed", "about.bpr": "aliases changed", "_entry.bpr": "aliases changed"}
+
+
+def test_image_changed():
+    write_aliases({**aliases, "images": {"logo": "new_logo.png"}})
+    assert planned() == {"index.bpr": "aliases changed"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert "new_logo.png" in read("index.html")
+
+
+def test_files_changed():
+    write_files({"_footer.bpr": "New footer\n", "new.bpr": "New page\n"})
+    os.remove(os.path.join(_DEST, "about.html"))
+    assert planned() == {"blog/post.bpr": "modified", "new.bpr": "new", "about.bpr": "missing output",
+                         "_entry.bpr": "modified"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert "New footer" in read("blog/post.html") and "New page" in read("new.html") and "New footer" in read("words/one.html")
+    assert planned() == {}
+    os.remove(os.path.join(_BASE, "new.bpr"))
+
+
+def test_configs_changed():
+    write_files({"configs/parser_config.yml": "export:\n  incremental: true\n  import_index: _imports.json\n  fragment_url: '/other/'\n"})
+    assert set(planned().values()) == {"configs changed"} and len(planned()) == 4
+
+
+def test_dataset_pages():
+    os.remove(os.path.join(_DEST, "words", "two.html"))
+    assert planned() == {"_entry.bpr": "missing output"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert planned() == {}
+    write_files({"_entry.bpr": "@[record.value]\n"})
+    assert planned() == {"_entry.bpr": "modified"}
+    sitecreator.create_website(_BASE, _DEST)
+    assert "Ada" not in read("words/one.html")
+    write_files({"configs/words.yaml": 'one: "One"\n'})  # The records are configs
+    assert set(planned().values()) == {"configs changed"}
+    write_files(files)
+
+
+def test_shards_build_every_page():
+    write_aliases({**aliases, "images": {"logo": "sharded.png"}})
+    sitecreator.create_website(_BASE, _DEST, shard=shards.Shard(1, 1))
+    assert "sharded.png" in read("index.html")
+    assert planned() == {"index.bpr": "aliases changed"}  # Until the index of the shard is merged
+    sitecreator.merge_shards(_BASE, _DEST)
+    assert planned() == {}
+
+
+def test_config_digests():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    context, digests = incremental.config_digests(env)
+    assert set(digests) == {"shortcuts/site_name", "shortcuts/team", "images/logo"}
+    assert env.config.loaded_conf.loaded() == ["parser_config", "aliases"]  # The other configs are not parsed
+    assert incremental.plan(sitecreator.create_crawler(_BASE, _DEST, env), env).skipped == 4
+    env.config = config.ConfigLoader(pathresolver.b_path("configs"))  # Without aliases
+    assert incremental.config_digests(env) != (context, {})
+    assert incremental.changed_aliases({"a": "1", "b": "2"}, {"a": "1", "b": "3", "c": "4"}) == {"b", "c"}
@@ -58,3 +58,55 @@ def test_parse_line():
     list_parsed = parser.parse_line(complete_list)
     for element, expected in zip_longest(list_parsed, expected_list):
         assert element.__class__ == expected
+
+
+def test_parse_line_cached():
+    complete_list.seek(0)
+    cache = parser.ParseCache(size=100)
+    assert cache.hit_rate() == 0.0
+    list_parsed = parser.parse_line(complete_list, cache)
+    for element, expected in zip_longest(list_parsed, expected_list):
+        assert element.__class__ == expected
+    assert cache.hits == 0
+    assert cache.misses == len(complete_list.getvalue().splitlines())
+
+    complete_list.seek(0)
+    list_cached = parser.parse_line(complete_list, cache)
+    assert cache.hits == cache.misses
+    assert cache.hit_rate() == 0.5
+    for element, cached in zip_longest(list_parsed, list_cached):
+        assert element == cached
+        assert (element is cached) == element.flyweight  # Only the stateless tokens are shared
+
+
+def test_parse_cache_fresh_tokens():
+    cache = parser.ParseCache(size=10)
+    first = cache("div>>{{ class: 'x' }} text\n")
+    first[0].line_number = 12
+    first[0].content.append("mutated")
+    second = cache("div>>{{ class: 'x' }} text\n")
+    assert second[0].line_number == "Undefined"
+    assert "mutated" not in second[0].content
+    assert repr(first[1:]) == repr(second[1:])
+
+
+def test_parse_cache_eviction():
+    cache = parser.ParseCache(size=2)
+    cache("a\n")
+    cache("b\n")
+    cache("a\n")  # b is now the least recently used
+    cache("c\n")
+    assert len(cache) == 2
+    cache("a\n")
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache("b\n")
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert repr(cache) == "ParseCache(2/2 lines, 2 hits, 4 misses)"
+
+
+def test_parse_cache_disabled():
+    cache = parser.ParseCache(size=0)
+    cache("a\n")
+    cache("a\n")
+    assert len(cache) == 0
+    assert cache.hits == 0
@@ -0,0 +1,81 @@
+# Testing the pipeline module
+import os
+import tempfile
+import threading
+
+import pytest
+
+from bootstraparse.modules import pipeline, sitecreator
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_PAGES = ["p{}.bpr".format(i) for i in range(5)]
+
+
+@pytest.fixture(scope="module")
+def crawler():
+    os.makedirs(_BASE, exist_ok=True)
+    for page in _PAGES:
+        with open(os.path.join(_BASE, page), "w") as f:
+            f.write(f"# {page} #\n")
+    env = sitecreator.create_environment(_BASE, os.path.join(_TEMP_DIRECTORY.name, "dest"))
+    return sitecreator.create_crawler(_BASE, env.destination, env)
+
+
+def test_pipeline(crawler):
+    rendered = []
+
+    def render(pp, destination):
+        assert pp.source_buffer is not None  # Read beforehand
+        assert os.path.exists(destination)
+        rendered.append(pp.name)
+        return pp.readlines()[0].upper()
+
+    counters = pipeline.Pipeline(crawler, render, sitecreator.write, depth=2).run()
+    assert sorted(rendered) == sorted(_PAGES)
+    assert rendered == [file for _, file in crawler.files]
+    for page in _PAGES:
+        with open(os.path.join(_TEMP_DIRECTORY.name, "dest", page.replace(".bpr", ".html"))) as f:
+            assert f.read() == f"# {page.upper()} #\n"
+    assert counters.pages == len(_PAGES)
+    assert counters.bytes_read == counters.bytes_written == sum(len(f"# {page} #\n") for page in _PAGES)
+    assert counters.wall_time >= counters.render_time > 0
+    assert counters.pages_per_second() > 0
+    assert repr(counters).startswith(f"PipelineCounters({len(_PAGES)} pages in ")
+
+
+def test_pipeline_overlaps_writes(crawler):
+    first_page = crawler.page_paths()[0][1]
+    second_page_rendered = threading.Event()
+    rendered = []
+    overlapped = []
+
+    def render(pp, _):
+        rendered.append(pp.name)
+        if len(rendered) == 2:
+            second_page_rendered.set()
+        return ""
+
+    def write(_, destination):
+        if destination == first_page:
+            # The write of the first page waits for the rendering of the second page
+            overlapped.append(second_page_rendered.wait(timeout=5))
+
+    pipeline.Pipeline(crawler, render, write, depth=1).run()
+    assert overlapped == [True]
+
+
+def test_pipeline_error(crawler):
+    def render(pp, _):
+        if pp.name == crawler.files[2][1]:
+            raise ValueError(pp.name)
+        return ""
+
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(crawler, render, sitecreator.write, depth=1).run()
+
+
+def test_counters():
+    counters = pipeline.PipelineCounters()
+    assert counters.pages_per_second() == 0.0
+    assert str(counters).startswith("0 pages in 0.000s (0.0 pages/s)")
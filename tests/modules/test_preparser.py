@@ -337,6 +337,51 @@ def test_errors():
         pp.make_import_list()
 
 
+def test_deep_imports():
+    depth = __import__("sys").getrecursionlimit() + 200
+    for i in range(depth):
+        make_new_file(f"deep/_{i}.bpr", f"line {i}\n" + (f"::< _{i + 1}.bpr >\n" if i + 1 < depth else ""))
+    pp = preparser.PreParser(temp_name("deep/_0.bpr"), env)
+    assert len(pp.make_import_list()) == 1
+    assert len(pp.global_dict_of_imports) == depth - 1
+    assert pp.export_with_imports().read() == "".join(f"line {i}\n" for i in range(depth))
+
+
+def test_resolve_imports_order():
+    files = {
+        "order/a.bpr": "::< _b.bpr >\n::< _c.bpr >\n",
+        "order/e.bpr": "::< _c.bpr >\n",
+        "order/_b.bpr": "::< _d.bpr >\n",
+        "order/_c.bpr": "::< _d.bpr >\n",
+        "order/_d.bpr": "d\n",
+    }
+    for name, content in files.items():
+        make_new_file(name, content)
+    imports = {}
+    pages = [preparser.PreParser(temp_name(name), env, dict_of_imports=imports) for name in ("order/a.bpr", "order/e.bpr")]
+    order = [pp.name for pp in preparser.resolve_imports(pages)]
+    assert order == ["_d.bpr", "_b.bpr", "_c.bpr", "a.bpr", "e.bpr"]  # Each file once, after its imports
+    assert preparser.resolve_imports(pages) == []
+    assert pages[0].local_dict_of_imports[temp_name("order/_c.bpr")] is pages[1].local_dict_of_imports[temp_name("order/_c.bpr")]
+    assert [pp.name for pp in pages[1].expansion_order()] == ["_d.bpr", "_c.bpr", "e.bpr"]
+    pages[0].export_with_imports()
+    assert [pp.name for pp in pages[1].expansion_order()] == ["e.bpr"]
+
+
+def test_import_cycles():
+    for name, content in [("cycles/a.bpr", "::< _b.bpr >\n"), ("cycles/_b.bpr", "::< _c.bpr >\n::< a.bpr >\n"),
+                          ("cycles/_c.bpr", "::< _b.bpr >\n"), ("cycles/d.bpr", "::< d.bpr >\n")]:
+        make_new_file(name, content)
+    pages = [preparser.PreParser(temp_name(name), env) for name in ("cycles/a.bpr", "cycles/d.bpr")]
+    with pytest.raises(RecursionError) as error:
+        preparser.resolve_imports(pages)
+    message = str(error.value).replace(temp_name("cycles") + os.sep, "")
+    assert message.startswith("Error: 3 import cycles: ")
+    assert "_b.bpr -> _c.bpr -> _b.bpr" in message
+    assert "a.bpr -> _b.bpr -> a.bpr" in message
+    assert "d.bpr -> d.bpr" in message
+
+
 def test_rich_tree():
     """
     Test the rich_tree function
@@ -403,3 +448,231 @@ def test_make_replacement_errors():
     assert pp.make_replacements("This is a test {}", "images") == "This is a test images"
     assert pp.make_replacements("This is a test {} {} {image} {b}", 1, 2, image="images", b="b") == "This is a test 1 2 images b"  # noqa: E501
     assert pp.make_replacements("This is a test {} {} {image} {b}", karm=3) == "This is a test {} {} {image} {b}"
+
+
+@pytest.mark.parametrize("line, expected_file, expected_line", [
+    (1, "index.bpr", 1),
+    (2, "pages/page1.bpr", 1),
+    (5, "index.bpr", 3),
+    (7, "pages/page1.bpr", 1),
+    (14, "index.bpr", 7),
+    (15, "index.bpr", 15),  # Past the end of the file
+])
+def test_line_origin(line, expected_file, expected_line):
+    testfile = temp_name(os.path.join(_BASE_PATH_GIVEN, "index.bpr"))
+    pp = preparser.PreParser(testfile, env)
+    pp.do_replacements()
+    origin = pp.line_origin(line)
+    assert pathlib.Path(origin.file_name) == pathlib.Path(temp_name(os.path.join(_BASE_PATH_GIVEN, expected_file)))
+    assert origin.line_number == expected_line
+
+
+def test_line_origin_multiline_alias():
+    test_file = temp_name("test_line_origin.bpr")
+    make_new_file(test_file, "before\n@[start]\nafter\n")
+    pp = preparser.PreParser(test_file, env)
+    lines = pp.do_replacements().readlines()
+    after = lines.index("after\n") + 1
+    assert after > 4
+    assert pp.line_origin(1).line_number == 1
+    assert pp.line_origin(2).line_number == 2
+    assert pp.line_origin(after - 1).line_number == 2
+    assert pp.line_origin(after).line_number == 3
+
+
+def test_scan_source():
+    test_file = temp_name("test_scan_source.bpr")
+    make_new_file(test_file, "plain\n::< page1.bpr >\n\ttabbed @ text\n@[do_not_remove_s]\nend")
+    make_new_file(temp_name("page1.bpr"), content_page1)
+    pp = preparser.PreParser(test_file, env)
+    assert pp.scan_source() == [(temp_name("page1.bpr"), 1)]
+    assert pp.get_source_buffer().marked_lines == {3}
+    assert pp.do_replacements().read() == (
+        "plain\nTest page1\nTest page1-2\nTest page1-3\n" + "\ttabbed @ text".expandtabs() + "\nThis is a test\nend\n"
+    )
+
+
+@pytest.mark.parametrize("message, var_list, var_dict", [
+    ("This is a test", [], {}),
+    ("This is a test", [1, 2], {"a": 3}),
+    ("Escaped {{braces}}", [], {}),
+    ("This is a test {} {} {a} {b}", [12, 1222], {"a": 33, "b": "picture"}),
+    ("This is a test {1} {0}", ["a", "b"], {}),
+    ("This is a test {}", [], {}),
+    ("This is a test {a}", [], {}),
+    ("Complex {0!r} {a:>5}", ["x"], {"a": "y"}),
+    ("Mixed {} {0}", ["x"], {}),
+    ("Attribute {a.real}", [], {"a": 1}),
+    ("Not a name {a b}", [], {}),
+])
+def test_prepared_format(message, var_list, var_dict):
+    try:
+        expected = preparser.PreParser.make_replacements(message, *var_list, **var_dict)
+    except ValueError:
+        with pytest.raises(ValueError):
+            preparser.PreparedFormat(message)(var_list, var_dict)
+    else:
+        assert preparser.PreparedFormat(message)(var_list, var_dict) == expected
+
+
+def test_prepared_format_constants():
+    assert preparser.PreparedFormat("This is a test").constant == "This is a test"
+    assert preparser.PreparedFormat("{{a}}").constant == "{a}"
+    assert preparser.PreparedFormat("{a}").constant is None
+    assert preparser.PreparedFormat('article>>\\{\\{my-3\\}\\} \\{id="{}"\\}').pieces is None
+    with pytest.raises(AttributeError):  # Same as str.format on a non-string
+        preparser.PreparedFormat(42)([], {})
+
+
+def test_alias_table():
+    local_env = environment.Environment()
+    local_env.config = env.config
+    local_env.export_mngr = env.export_mngr
+    pp = preparser.PreParser(temp_name("test_alias_table.bpr"), local_env)
+    pp2 = preparser.PreParser(temp_name("test_alias_table_2.bpr"), local_env)
+    table = pp.get_alias_table()
+    assert pp2.get_alias_table() is table
+    assert local_env.alias_table is table
+    assert table.shortcuts["do_not_remove_s"].constant == "This is a test"
+    assert table.bare_images["do_not_remove_p"] == '<img src="This is a test"/>'
+    assert "do_not_remove_f" not in table.bare_images
+    assert preparser.AliasTable.compile_section(config.ConfigLoader(), "shortcuts") == {}
+
+    with pytest.raises(KeyError):
+        pp.get_alias_from_config("not_existing", None)
+    with pytest.raises(KeyError):
+        pp.get_image_from_config("not_existing", None)
+
+    # Elements added to the config after the compilation are still found
+    del table.images["do_not_remove_f"]
+    del table.shortcuts["do_not_remove_s"]
+    assert pp.get_alias_from_config("do_not_remove_s", None) == "This is a test"
+    assert pp.get_image_from_config("do_not_remove_f", None) == '<img src="This is a test {} {} {a} {b}"/>'
+
+
+def test_import_cache():
+    cache = preparser.ImportCache(size=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1  # b is now the least recently used
+    cache["c"] = 3
+    assert list(cache) == ["a", "c"]
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 1)
+    assert repr(cache) == "ImportCache(2/2 files, 1 hits, 1 misses, 1 evictions)"
+    assert repr(preparser.ImportCache()) == "ImportCache(0/unlimited files, 0 hits, 0 misses, 0 evictions)"
+
+
+@pytest.mark.parametrize("size", [0, 1, 3])
+def test_import_cache_reexpansion(size):
+    testfile = temp_name(os.path.join(_BASE_PATH_GIVEN, "superimports.bpr"))
+    cache = preparser.ImportCache(size)
+    pp = preparser.PreParser(testfile, env, dict_of_imports=cache)
+    assert pp.do_imports().read() == final_content_superimports
+    assert len(cache) <= size or size == 0
+    assert (cache.evictions > 0) == (size != 0)
+    assert cache.hits + cache.misses > 0
+
+
+def test_shared_frozen_imports(caplog):
+    testfile = temp_name(os.path.join(_BASE_PATH_GIVEN, "index.bpr"))
+    pp = preparser.PreParser(testfile, env)
+    pp.do_imports()
+    page1 = pp.local_dict_of_imports[temp_name(os.path.join(_BASE_PATH_GIVEN, "pages/page1.bpr"))]
+    shared = page1.export_with_imports()
+    assert shared.frozen
+    assert pp.file_with_all_imports.frozen
+    with caplog.at_level("INFO"):
+        assert page1.export_with_imports() is shared
+    assert caplog.records == []
+    assert isinstance(page1.source_buffer.marked_lines, frozenset)
+
+
+def test_alias_fingerprint():
+    fingerprint = preparser.AliasTable.make_fingerprint(env)
+    assert fingerprint == preparser.AliasTable.make_fingerprint(env)
+    no_template = environment.Environment()
+    no_template.config = env.config
+    no_template.export_mngr = export.ExportManager(__config, config.ConfigLoader())
+    assert preparser.AliasTable.make_fingerprint(no_template) != fingerprint
+    no_alias = environment.Environment()
+    no_alias.config = config.ConfigLoader()
+    no_alias.export_mngr = env.export_mngr
+    assert preparser.AliasTable.make_fingerprint(no_alias) != fingerprint
+
+
+def test_replaced_blocks():
+    local_env = environment.Environment()
+    local_env.config = env.config
+    local_env.export_mngr = env.export_mngr
+    make_new_file(temp_name("_block_head.bpr"), "@[start]['Title']\n::<_block_nested.bpr>\nhead @[website_name]\n")
+    make_new_file(temp_name("_block_nested.bpr"), "nested @[copyright]\n")
+    make_new_file(temp_name("_block_open.bpr"), "open")
+    make_new_file(temp_name("block_page1.bpr"), "::<_block_head.bpr>\npage 1\n::<_block_open.bpr>\nend\n")
+    make_new_file(temp_name("block_page2.bpr"), "page 2\n::<_block_head.bpr>\ntail @[website_name]\n")
+    imports = preparser.ImportCache()
+    pp1 = preparser.PreParser(temp_name("block_page1.bpr"), local_env, dict_of_imports=imports)
+    text1 = pp1.do_replacements().read()
+    blocks = len(local_env.replacement_cache)
+    assert blocks == 2  # _block_head and _block_nested, _block_open joins the next line and is not cached
+    assert "openend\n" in text1
+    pp2 = preparser.PreParser(temp_name("block_page2.bpr"), local_env, dict_of_imports=imports)
+    text2 = pp2.do_replacements().read()
+    assert len(local_env.replacement_cache) == blocks
+    head = imports[temp_name("_block_head.bpr")].replaced_block()
+    assert head.input_lines == 3
+    assert head.output_lines == head.text.count("\n") > 3
+    assert text1.startswith(head.text)
+    assert text2 == "page 2\n" + head.text + text2[len("page 2\n") + len(head.text):]
+
+    lines = text2.split("\n")
+    nested = [i for i, text in enumerate(lines) if text.startswith("nested")][0] + 1
+    assert pp2.line_origin(nested) == (temp_name("_block_nested.bpr"), 1)
+    assert pp2.line_origin(nested + 1) == (temp_name("_block_head.bpr"), 3)
+    assert pp2.line_origin(3) == (temp_name("_block_head.bpr"), 1)
+    assert pp2.line_origin(nested + 2) == (temp_name("block_page2.bpr"), 3)
+    assert pp2.line_origin(len(lines) - 1) == (temp_name("block_page2.bpr"), 3)
+
+
+def test_replacement_cache_bounds():
+    local_env = environment.Environment()
+    local_env.config = env.config
+    local_env.export_mngr = env.export_mngr
+    local_env.replacement_cache = preparser.ReplacementCache(1)
+    make_new_file(temp_name("_bound_head.bpr"), "::<_bound_nested.bpr>\nhead @[website_name]\n")
+    make_new_file(temp_name("_bound_nested.bpr"), "nested @[copyright]\n")
+    make_new_file(temp_name("bound_page.bpr"), "::<_bound_head.bpr>\npage\n")
+    imports = preparser.ImportCache()
+    pp = preparser.PreParser(temp_name("bound_page.bpr"), local_env, dict_of_imports=imports)
+    text = pp.do_replacements().read()
+    cache = local_env.replacement_cache
+    assert len(cache) == 1 and cache.evictions == 1  # The nested block made way for the head
+    head = imports[temp_name("_bound_head.bpr")]
+    assert list(cache) == [head.replacement_key]
+    assert preparser.PreParser(temp_name("bound_page.bpr"), local_env, dict_of_imports=imports).do_replacements()\
+        .read() == text
+    head.release()  # Released along with the preparser of the file
+    assert len(cache) == 0 and head.replacement_key is None
+    assert repr(cache) == "ReplacementCache(0/1 blocks, 1 hits, 2 misses, 1 evictions)"
+    assert preparser.ReplacementCache().size == 256
+
+
+def test_import_cache_eviction_releases_block():
+    local_env = environment.Environment()
+    local_env.config = env.config
+    local_env.export_mngr = env.export_mngr
+    make_new_file(temp_name("_evict_a.bpr"), "a @[website_name]\n")
+    make_new_file(temp_name("_evict_b.bpr"), "b @[copyright]\n")
+    make_new_file(temp_name("evict_page1.bpr"), "::<_evict_a.bpr>\npage 1\n")
+    make_new_file(temp_name("evict_page2.bpr"), "::<_evict_b.bpr>\npage 2\n")
+    imports = preparser.ImportCache(1)
+    preparser.PreParser(temp_name("evict_page1.bpr"), local_env, dict_of_imports=imports).do_replacements()
+    evicted = imports[temp_name("_evict_a.bpr")]
+    key = evicted.replacement_key
+    assert list(local_env.replacement_cache) == [key]
+    pp = preparser.PreParser(temp_name("evict_page2.bpr"), local_env, dict_of_imports=imports)
+    assert pp.do_replacements().read() == "bCopyright (c) 2020 by Idle-Corp, all rights reserved.\npage 2\n"
+    assert imports.evictions == 1 and list(imports) == [temp_name("_evict_b.bpr")]
+    assert evicted.replacement_key is None and key not in local_env.replacement_cache  # Dropped with the preparser
+    assert evicted.source_buffer is not None  # Still usable by the files sharing it
+    assert list(local_env.replacement_cache) == [imports[temp_name("_evict_b.bpr")].replacement_key]
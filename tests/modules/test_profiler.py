@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import profiler
+
+
+def test_disabled():
+    prof = profiler.Profiler()
+    with prof.stage("page", "parse"):
+        pass
+    assert prof.records == {}
+    prof.start()
+    prof.stop()
+
+
+def test_stage():
+    prof = profiler.Profiler(enabled=True)
+    with prof.stage("page1", "parse"):
+        sum(range(10000))
+    with prof.stage("page1", "parse"):
+        pass
+    with prof.stage("page1", "export"):
+        pass
+    with prof.stage("page2", "write"):
+        pass
+    with pytest.raises(ValueError):
+        with prof.stage("page2", "export"):
+            raise ValueError
+    assert set(prof.records) == {"page1", "page2"}
+    assert set(prof.records["page1"]) == {"parse", "export"}
+    assert prof.records["page1"]["parse"].wall > 0
+    assert "export" in prof.records["page2"]
+
+    pages = prof.page_totals()
+    assert [p for p, _ in pages] == sorted(prof.records, key=lambda p: -sum(t.wall for t in prof.records[p].values()))
+    stages = dict(prof.stage_totals())
+    assert stages["export"].wall == prof.records["page1"]["export"].wall + prof.records["page2"]["export"].wall
+
+    summary = prof.summary(top=1)
+    assert summary.startswith("Stages")
+    assert "(mostly" in summary
+    assert len(summary.split("\n")) == 1 + 3 + 1 + 1
+
+
+def test_cprofile():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "run.prof")
+        prof = profiler.Profiler(cprofile_path=path)
+        prof.start()
+        sum(range(100))
+        prof.stop()
+        prof.stop()
+        assert os.path.getsize(path) > 0
+
+
+@pytest.mark.parametrize("reset_peak", [True, False], ids=["reset_peak", "clear_traces"])
+def test_memory(monkeypatch, reset_peak):
+    from bootstraparse.modules import rope
+    if not reset_peak:  # Python 3.7 and 3.8
+        monkeypatch.delattr(profiler.tracemalloc, "reset_peak", raising=False)
+    prof = profiler.Profiler(memory=True)
+    assert prof.enabled
+    prof.start()
+    try:
+        with prof.stage("page", "preparse"):
+            kept = [rope.Rope() for _ in range(1000)]
+        with prof.stage("page", "parse"):
+            pass
+    finally:
+        prof.stop()
+    assert not profiler.tracemalloc.is_tracing()
+    assert prof.records["page"]["preparse"].peak > 1000 * 50
+    assert prof.top_stage == ("page", "preparse")
+    assert any(site.file_name.endswith("rope.py") for site in prof.top_sites)
+    summary = prof.summary()
+    assert "peak, KiB" in summary
+    assert "Top allocation sites at the end of preparse of page" in summary
+    assert "rope.py:" in summary
+    assert len(kept) == 1000
+
+
+def test_memory_not_tracing():
+    prof = profiler.Profiler(memory=True)
+    with prof.stage("page", "parse"):
+        pass
+    assert prof.records["page"]["parse"].peak == 0
+    assert prof.top_stage is None
+    assert prof.highest_peak() == 0
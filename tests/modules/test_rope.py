@@ -0,0 +1,118 @@
+import pytest
+
+from bootstraparse.modules import rope
+
+source_a = rope.SourceBuffer("a.bpr", ["a0\n", "a1\n", "a2\n"])
+source_b = rope.SourceBuffer("b.bpr", ["b0\n", "b1"])  # No newline at the end of the file
+source_c = rope.SourceBuffer("c.bpr", ["c0\n", "c1\n"])
+
+
+def make_rope():
+    """
+    a0, (b0, b1 + c0, c1), a2
+    """
+    inner = rope.Rope()
+    inner.append(source_b, 0, 2)
+    inner.append(source_c, 0, 2)
+    outer = rope.Rope()
+    outer.append(source_a, 0, 1)
+    outer.extend(inner)
+    outer.append(source_a, 2, 3)
+    outer.append(source_a, 3, 3)  # Empty segments are ignored
+    return outer
+
+
+def test_read():
+    r = make_rope()
+    assert len(r.segments) == 4
+    assert r.read() == "a0\nb0\nb1c0\nc1\na2\n"
+    assert r.readlines() == ["a0\n", "b0\n", "b1c0\n", "c1\n", "a2\n"]
+    assert len(r) == 5
+    assert repr(r) == "Rope(4 segments)"
+    assert repr(source_a) == "SourceBuffer(a.bpr, 3 lines)"
+
+
+def test_segments_are_not_copied():
+    r = make_rope()
+    for segment in r.segments:
+        assert segment.source in (source_a, source_b, source_c)
+
+
+def test_unfinished_last_line():
+    r = rope.Rope()
+    r.append(source_b, 0, 2)
+    assert r.readlines() == ["b0\n", "b1"]
+    assert len(r) == 2
+    assert r.origin(1) == ("b.bpr", 1)
+
+
+@pytest.mark.parametrize("line, expected", [
+    (0, ("a.bpr", 0)),
+    (1, ("b.bpr", 0)),
+    (2, ("b.bpr", 1)),  # Joined lines come from the file they start in
+    (3, ("c.bpr", 1)),
+    (4, ("a.bpr", 2)),
+])
+def test_origin(line, expected):
+    assert make_rope().origin(line) == expected
+
+
+@pytest.mark.parametrize("line", [-1, 5, 100])
+def test_origin_errors(line):
+    with pytest.raises(IndexError):
+        make_rope().origin(line)
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "file.bpr"
+    path.write_text("line 1\nline 2")
+    source = rope.SourceBuffer.from_file(str(path))
+    assert source.lines == ("line 1\n", "line 2")
+    assert len(source) == 2
+    assert source.ends_with_newline(1)
+    assert not source.ends_with_newline(2)
+
+
+def test_marked_readlines():
+    marked = rope.SourceBuffer("marked.bpr", ["m0\n", "m1\n", "m2"])
+    marked.marked_lines = {1}
+    unknown = rope.SourceBuffer("unknown.bpr", ["u0\n"])
+    r = rope.Rope()
+    r.append(marked, 0, 3)
+    r.append(unknown, 0, 1)
+    r.append(marked, 0, 1)
+    assert r.marked_readlines() == [
+        ("m0\n", False),
+        ("m1\n", True),
+        ("m2u0\n", True),  # Joined lines are always processed
+        ("m0\n", False),
+    ]
+    r.append(marked, 2, 3)
+    assert r.marked_readlines()[-1] == ("m2", True)
+
+
+def test_freeze():
+    r = make_rope()
+    lines, total, segments = r.readlines(), len(r), r.segments
+    assert r.freeze() is r
+    assert r.freeze() is r
+    assert r.frozen and r.segments is segments  # Not copied
+    with pytest.raises(TypeError):
+        r.append(rope.SourceBuffer("a.bpr", ["a\n"]), 0, 1)
+    with pytest.raises(TypeError):
+        r.extend(rope.Rope())
+    assert r.readlines() == lines
+    assert len(r) == total
+
+    outer = rope.Rope()
+    outer.extend(r)  # A frozen rope can still be referenced by others
+    assert outer.readlines() == lines
+
+
+def test_concurrent_readers():
+    from concurrent.futures import ThreadPoolExecutor
+    r = make_rope().freeze()
+    expected = (r.read(), [r.origin(i) for i in range(len(r))])
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: (r.read(), [r.origin(i) for i in range(len(r))]), range(32)))
+    assert all(result == expected for result in results)
@@ -0,0 +1,209 @@
+# Testing the shards module
+import json
+import os
+import tempfile
+
+import pytest
+
+from bootstraparse.modules import shards, sitecreator, error_mngr, importgraph
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+files = {
+    "index.bpr": "# Index #\n::<_shared.bpr>\n" + "text\n" * 40,
+    "about.bpr": "*About*\n",
+    "news/one.bpr": "# One #\n::<../_shared.bpr>\n",
+    "news/two.bpr": "two\n" * 10,
+    "news/three.bpr": "",
+    "_shared.bpr": "<<div\nshared\ndiv>>\n",
+    "style.css": "body {}\n",
+    "news/logo.svg": "<svg/>\n" * 20,
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def site():
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(_BASE, path)), exist_ok=True)
+        with open(os.path.join(_BASE, path), "w") as f:
+            f.write(content)
+
+
+def build(destination, count, indexes=None):
+    for index in indexes or range(1, count + 1):
+        sitecreator.create_website(_BASE, destination, shard=shards.Shard(index, count))
+
+
+@pytest.mark.parametrize("spec, expected", [("1/1", (1, 1)), ("2/4", (2, 4)), ("4/4", (4, 4))])
+def test_parse_shard(spec, expected):
+    assert shards.parse_shard(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["0/2", "3/2", "1", "a/b", "-1/2", "1/2/3"])
+def test_parse_shard_invalid(spec):
+    with pytest.raises(ValueError):
+        shards.parse_shard(spec)
+
+
+def test_partition():
+    weights = {"a": 10, "b": 7, "c": 5, "d": 3, "e": 3, "f": 1}
+    groups = shards.partition(weights, 3)
+    assert groups == [{"a"}, {"b", "e"}, {"c", "d", "f"}]
+    assert shards.partition(dict(reversed(list(weights.items()))), 3) == groups  # Independent of the order of the files
+    assert set().union(*shards.partition(weights, 4)) == set(weights)
+    assert shards.partition(weights, 1) == [set(weights)]
+    assert shards.partition({}, 2) == [set(), set()]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7])
+def test_sharded_build(count):
+    whole = os.path.join(_TEMP_DIRECTORY.name, "whole")
+    sitecreator.create_website(_BASE, whole)
+    destination = os.path.join(_TEMP_DIRECTORY.name, f"sharded-{count}")
+    build(destination, count)
+    report = shards.merge(sitecreator.create_crawler(_BASE, destination, sitecreator.create_environment(_BASE, "")),
+                          "_shards")
+    assert report == (count, 5, 2, 0, 0)
+    assert sitecreator.merge_shards(_BASE, destination) == 0
+    for root, _, names in os.walk(whole):
+        for name in names:
+            with open(os.path.join(root, name)) as expected, \
+                    open(os.path.join(destination, os.path.relpath(root, whole), name)) as built:
+                assert built.read() == expected.read()
+    assert len(os.listdir(os.path.join(destination, "_shards"))) == count
+
+
+def test_manifest():
+    destination = os.path.join(_TEMP_DIRECTORY.name, "manifest")
+    build(destination, 2)
+    pages, copies = [], []
+    for index in (1, 2):
+        with open(os.path.join(destination, "_shards", f"shard-{index}-of-2.json")) as f:
+            manifest = json.load(f)
+        assert (manifest["shard"], manifest["count"], manifest["fragments"]) == (index, 2, [])
+        pages += manifest["pages"]
+        copies += manifest["copies"]
+    assert sorted(pages) == [["about.bpr", "about.html"], ["index.bpr", "index.html"], ["news/one.bpr", "news/one.html"],
+                             ["news/three.bpr", "news/three.html"], ["news/two.bpr", "news/two.html"]]
+    assert sorted(copies) == ["news/logo.svg", "style.css"]
+
+
+def test_manifest_fragments(caplog):
+    destination = os.path.join(_TEMP_DIRECTORY.name, "fragments")
+    os.makedirs(os.path.join(_BASE, "configs"), exist_ok=True)
+    with open(os.path.join(_BASE, "configs", "parser_config.yml"), "w") as f:
+        f.write('export:\n  fragment_includes: "ssi"\n')
+    try:
+        os.makedirs(os.path.join(destination, "_fragments"))
+        with open(os.path.join(destination, "_fragments", "_old-0123456789ab.html"), "w") as f:
+            f.write("<div>old</div>")
+        build(destination, 2)
+        assert os.path.exists(os.path.join(destination, "_fragments", "_old-0123456789ab.html"))  # Kept by the shards
+        with caplog.at_level("WARNING"):
+            report = shards.merge(
+                sitecreator.create_crawler(_BASE, destination, sitecreator.create_environment(_BASE, "")), "_shards"
+            )
+    finally:
+        os.remove(os.path.join(_BASE, "configs", "parser_config.yml"))
+    assert report.fragments == 1
+    assert "1 fragment files written by no shard, left by a previous build: _fragments/_old-0123456789ab.html." \
+        in caplog.text
+
+
+def test_import_indexes():
+    destination = os.path.join(_TEMP_DIRECTORY.name, "indexes")
+    os.makedirs(os.path.join(_BASE, "configs"), exist_ok=True)
+    with open(os.path.join(_BASE, "configs", "parser_config.yml"), "w") as f:
+        f.write('export:\n  import_index: "_imports.json"\n')
+    try:
+        build(destination, 2)
+        parts = [importgraph.ImportGraph.load(_BASE, shards.index_path(destination, "_shards", shards.Shard(index, 2)))
+                 for index in (1, 2)]
+        assert not os.path.exists(os.path.join(destination, "_imports.json"))  # Each shard writes its own index
+        assert sorted(set(parts[0].imports) | set(parts[1].imports)) == [
+            "_shared.bpr", "about.bpr", "index.bpr", "news/one.bpr", "news/three.bpr", "news/two.bpr"
+        ]
+        assert sitecreator.merge_shards(_BASE, destination) == 0
+        merged = importgraph.ImportGraph.load(None, os.path.join(destination, "_imports.json"))
+        assert merged.imports == {**parts[0].imports, **parts[1].imports} and merged.context == parts[0].context
+        assert merged.pages_including("_shared.bpr") == ["index.bpr", "news/one.bpr"]
+        os.remove(shards.index_path(destination, "_shards", shards.Shard(2, 2)))
+        os.remove(os.path.join(destination, "_imports.json"))
+        assert sitecreator.merge_shards(_BASE, destination) == 0  # Without the index of a shard
+        assert importgraph.ImportGraph.load(None, os.path.join(destination, "_imports.json")).imports == parts[0].imports
+    finally:
+        os.remove(os.path.join(_BASE, "configs", "parser_config.yml"))
+
+
+def test_dataset_pages():
+    destination = os.path.join(_TEMP_DIRECTORY.name, "datasets")
+    site_configs = {
+        "datasets.yaml": 'words:\n  template: "_shared.bpr"\n',
+        "words.yaml": 'one: "One"\ntwo: "Two"\n',
+    }
+    os.makedirs(os.path.join(_BASE, "configs"), exist_ok=True)
+    for name, content in site_configs.items():
+        with open(os.path.join(_BASE, "configs", name), "w") as f:
+            f.write(content)
+    try:
+        build(destination, 2)
+        with open(os.path.join(destination, "_shards", "shard-1-of-2.json")) as f:
+            assert json.load(f)["datasets"] == ["words/one.html", "words/two.html"]
+        assert sitecreator.merge_shards(_BASE, destination) == 0
+        env = sitecreator.create_environment(_BASE, "")
+        assert shards.merge(sitecreator.create_crawler(_BASE, destination, env), "_shards").datasets == 2
+        os.remove(os.path.join(destination, "words", "two.html"))
+        with open(os.path.join(destination, "_shards", "shard-2-of-2.json")) as f:
+            manifest = json.load(f)
+        manifest["datasets"].append("words/one.html")
+        with open(os.path.join(destination, "_shards", "shard-2-of-2.json"), "w") as f:
+            json.dump(manifest, f)
+        with pytest.raises(error_mngr.ShardError) as error:
+            sitecreator.merge_shards(_BASE, destination)
+        assert error.value.problems == ["dataset page words/one.html listed by 2 shards", "output words/two.html missing"]
+    finally:
+        for name in site_configs:
+            os.remove(os.path.join(_BASE, "configs", name))
+
+
+@pytest.mark.parametrize("builds, message", [
+    ([], "no shard manifest"),
+    ([(1, 3), (3, 3)], "missing shards [2]"),
+    ([(1, 2), (2, 3)], "manifests of builds split in [2, 3] shards"),
+    ([(1, 2), (1, 1)], "listed by 2 shards"),
+    ([(1, 3)], "page news/two.bpr not listed by any shard"),
+])
+def test_merge_errors(builds, message):
+    with tempfile.TemporaryDirectory() as destination:
+        for index, count in builds:
+            build(destination, count, [index])
+        with pytest.raises(error_mngr.ShardError) as error:
+            sitecreator.merge_shards(_BASE, destination)
+        assert message in str(error.value)
+
+
+def test_merge_missing_output():
+    with tempfile.TemporaryDirectory() as destination:
+        build(destination, 2)
+        os.remove(os.path.join(destination, "about.html"))
+        with open(os.path.join(destination, "_shards", "shard-1-of-2.json")) as f:
+            manifest = json.load(f)
+        manifest["copies"].append("removed.txt")
+        with open(os.path.join(destination, "_shards", "shard-1-of-2.json"), "w") as f:
+            json.dump(manifest, f)
+        with pytest.raises(error_mngr.ShardError) as error:
+            sitecreator.merge_shards(_BASE, destination)
+        assert error.value.problems == ["copied file removed.txt is not part of the site",
+                                        "output about.html missing", "output removed.txt missing"]
+
+
+def test_merge_without_copies():
+    env = sitecreator.create_environment(_BASE, "")
+    with tempfile.TemporaryDirectory() as destination:
+        with open(os.path.join(destination, "parser_config.yml"), "w") as f:
+            f.write("export:\n  copy_unparsable_files: none\n")
+        env.config.loaded_conf.add_file(os.path.join(destination, "parser_config.yml"))
+        build(destination, 2)
+        with pytest.raises(error_mngr.ShardError) as error:  # The shards copied the files of the site
+            shards.merge(sitecreator.create_crawler(_BASE, destination, env), "_shards")
+        assert "copied file style.css is not part of the site" in error.value.problems
@@ -4,7 +4,7 @@ import tempfile
 import pytest
 
 import bootstraparse.modules.sitecrawler as sitecrawler
-from bootstraparse.modules import environment, config, pathresolver, export, preparser
+from bootstraparse.modules import environment, config, pathresolver, export, preparser, sitecreator
 
 _TEMP_DIRECTORY = tempfile.TemporaryDirectory()
 _BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
@@ -102,3 +102,44 @@ def test_result_crawler(list_files, env):
         assert os.path.exists(dest)
         assert os.path.isfile(dest)
         assert isinstance(pp, preparser.PreParser)
+
+
+def test_lazy_crawler():
+    with tempfile.TemporaryDirectory() as folder:
+        base, dest = os.path.join(folder, "base"), os.path.join(folder, "dest")
+        for path, content in [
+            ("a.bpr", "A\n::<_shared.bpr>\n"),
+            ("b.bpr", "B\n::<_shared.bpr>\n::<_only_b.bpr>\n"),
+            ("c.bpr", "C\n"),
+            ("_shared.bpr", "shared\n::<_nested.bpr>\n"),
+            ("_nested.bpr", "nested\n"),
+            ("_only_b.bpr", "only b\n"),
+        ]:
+            os.makedirs(base, exist_ok=True)
+            with open(os.path.join(base, path), "w") as f:
+                f.write(content)
+        os.makedirs(os.path.join(base, "configs"))
+        with open(os.path.join(base, "configs", "parser_config.yml"), "w") as f:
+            f.write("parsing:\n  lazy_preparse: true\n")
+        lazy_env = sitecreator.create_environment(base, dest)
+        crw = sitecrawler.SiteCrawler(base, dest, lazy_env)
+        assert crw.lazy
+        crw.files.sort()
+        counts = crw.count_imports()
+        names = {os.path.basename(path): count for path, count in counts.items()}
+        assert names == {"_shared.bpr": 2, "_nested.bpr": 2, "_only_b.bpr": 1}
+        assert crw.preparsers == []
+
+        alive = []
+        for pp, output in crw:
+            assert os.path.isfile(output)
+            assert pp.do_replacements().read().startswith(pp.name[0].upper())
+            alive.append(sorted(os.path.basename(path) for path in crw.global_dict_of_imports))
+            previous = pp
+        assert previous.source_buffer is None and previous.file_with_all_imports is None
+        assert alive == [
+            ["_nested.bpr", "_only_b.bpr", "_shared.bpr"],
+            ["_nested.bpr", "_only_b.bpr", "_shared.bpr"],
+            [],
+        ]
+        assert crw.global_dict_of_imports == {}
@@ -3,7 +3,7 @@ import tempfile
 
 import pytest
 
-from bootstraparse.modules import sitecreator, syntax, context_mngr
+from bootstraparse.modules import sitecreator, syntax, context_mngr, profiler
 
 _TEMP_DIRECTORY = tempfile.TemporaryDirectory()
 _BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
@@ -48,6 +48,7 @@ def env():
 
 def test_create_site(env, list_files):
     sitecreator.create_website(_BASE, _DEST)
+    assert env.parse_cache.size > 0
     for file, exp in list_files:
         if exp is not None:
             assert os.path.exists(file)
@@ -55,6 +56,17 @@ def test_create_site(env, list_files):
                 assert f.read() == exp
 
 
+def test_create_site_profiled(env, list_files):
+    prof = profiler.Profiler(enabled=True)
+    sitecreator.create_website(_BASE, _DEST, prof)
+    assert set(prof.records[_BASE]) == {"crawl"}
+    assert set(prof.records[os.path.join("subtests", "test4.bpr")]) == set(profiler.STAGES) - {"crawl"}
+    for file, exp in list_files:
+        if exp is not None:
+            with open(file, "r") as f:
+                assert f.read() == exp
+
+
 def test_save(list_files, env):
     containers = [
         context_mngr.TextContainer([syntax.TextToken(["Test"])]),
@@ -64,3 +76,62 @@ def test_save(list_files, env):
     sitecreator.save(containers, os.path.join(_DEST, "filetest.html"), env)
     with open(fd, "r") as f:
         assert f.read() == "TestTest2"
+
+
+def test_preparse_parse(env, list_files):
+    crwlr = sitecreator.create_crawler(_BASE, _DEST, env)
+    crwlr.set_all_preparsers()
+    for element, destination in crwlr:
+        output = sitecreator.preparse_parse(element)
+        assert isinstance(output, list)
+        assert all(isinstance(container, context_mngr.BaseContainer) for container in output)
+
+
+@pytest.mark.parametrize("options", [
+    "parsing:\n  lazy_preparse: true\n",
+    "parsing:\n  pipeline_depth: 2\n",
+    "parsing:\n  pipeline_depth: 1\n  pipeline_workers: 1\n  lazy_preparse: true\n",
+])
+def test_create_site_lazy(options):
+    with tempfile.TemporaryDirectory() as folder:
+        base = os.path.join(folder, "base")
+        os.makedirs(os.path.join(base, "configs"))
+        for path, content in [
+            ("a.bpr", "*A*\n::<_shared.bpr>\n"),
+            ("b.bpr", "# B #\n::<_shared.bpr>\n"),
+            ("_shared.bpr", "<<div\nshared\ndiv>>\n"),
+        ]:
+            with open(os.path.join(base, path), "w") as f:
+                f.write(content)
+        sitecreator.create_website(base, os.path.join(folder, "eager"))
+        with open(os.path.join(base, "configs", "parser_config.yml"), "w") as f:
+            f.write(options)
+        sitecreator.create_website(base, os.path.join(folder, "lazy"))
+        for page in ["a.html", "b.html"]:
+            with open(os.path.join(folder, "eager", page)) as eager, open(os.path.join(folder, "lazy", page)) as lazy:
+                assert eager.read() == lazy.read()
+
+
+@pytest.mark.parametrize("options, removed", [
+    ('export:\n  fragment_includes: "ssi"\n', True),
+    ('export:\n  fragment_includes: "ssi"\n  import_index: "_imports.json"\n  incremental: true\n', False),
+])
+def test_stale_fragments(options, removed):
+    with tempfile.TemporaryDirectory() as folder:
+        base, destination = os.path.join(folder, "base"), os.path.join(folder, "dest")
+        os.makedirs(os.path.join(base, "configs"))
+        for path, content in [
+            ("a.bpr", "*A*\n::<_shared.bpr>\n"),
+            ("_shared.bpr", "<<div\nshared\ndiv>>\n"),
+            ("configs/parser_config.yml", options),
+        ]:
+            with open(os.path.join(base, path), "w") as f:
+                f.write(content)
+        sitecreator.create_website(base, destination)
+        written = os.listdir(os.path.join(destination, "_fragments"))
+        stale = os.path.join(destination, "_fragments", "_old-0123456789ab.html")
+        with open(stale, "w") as f:
+            f.write("<div>old</div>")
+        sitecreator.create_website(base, destination)
+        assert os.path.exists(stale) != removed  # An incremental build does not know every fragment still included
+        assert set(written) <= set(os.listdir(os.path.join(destination, "_fragments")))
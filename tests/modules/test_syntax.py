@@ -1,3 +1,4 @@
+import sys
 from itertools import zip_longest
 
 import pyparsing
@@ -946,3 +947,121 @@ def test_split_optionals():
     assert spl.class_insert == "cinsertBlue"
     assert spl.var_list == [123]
     assert spl.var_dict == {'class': 'blue'}
+
+
+@pytest.mark.parametrize("line", [
+    "::< pages/page1.bpr >\n",
+    "::< a.bpr > < b.bpr ><c.bpr>\n",
+    "text ::<a.bpr> junk <b.bpr>\n",
+    ":::<a.bpr>",
+    "::\n",
+    "::< unclosed\n",
+    "::<\ttab.bpr\t>\n",
+    "::<a.bpr> ::<b.bpr>\n",
+    "no import here\n",
+])
+def test_scan_preparse_line_imports(line):
+    """Test that the scanner finds the same imports as rgx_import_file."""
+    results = sy.rgx_import_file.searchString(line)
+    expected = [e.rstrip() for e in results[0]] if results else []
+    assert sy.scan_preparse_line(line)[0] == expected
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("@{image}\n", True),
+    ("text @[alias] {{class}}\n", True),
+    ("::<a.bpr> @[alias]\n", True),
+    ("@ {not} @ [markers]\n", False),
+    ("::<@[a.bpr]>\n", False),
+    ("plain text\n", False),
+])
+def test_scan_preparse_line_markers(line, expected):
+    """Test that the scanner finds image and alias markers."""
+    assert sy.scan_preparse_line(line)[1] is expected
+
+
+@pytest.mark.parametrize("line", [
+    "@{image} text @[alias]\n",
+    "@[alias]{{class}} [x=1] @{image}[1]\n",
+    "text @[a@[b]\n",
+    "\t@[tab\tbed]\n",
+    "@{} @[]\n",
+    "no markers\n",
+])
+def test_scan_markers(line):
+    """Test that the scanner finds the same image and alias names as line_to_replace."""
+    expected = [
+        ("image", token.image_name) if isinstance(token, sy.ImageToken) else ("alias", token.alias_name)
+        for token in sy.line_to_replace.parse_string(line) if isinstance(token, (sy.ImageToken, sy.AliasToken))
+    ]
+    assert sy.scan_markers(line) == expected
+
+
+def test_scan_markers_unclosed():
+    """Test that the scanner may find more names than line_to_replace replaces, never fewer."""
+    assert sy.line_to_replace.parse_string("@[alias] @[unclosed\n")[0].content == ["@[alias] @[unclosed"]
+    assert sy.scan_markers("@[alias] @[unclosed\n") == [("alias", "alias")]
+
+
+def test_flyweights():
+    import copy
+    import pickle
+    first = sy.line.parseString("* text * ``` text ~~ __ **\n").asList()
+    second = sy.line.parseString("**~~__```*\n").asList()
+    shared = {type(token): token for token in first if token.flyweight}
+    assert set(shared) == {sy.EtEmToken, sy.EtStrongToken, sy.EtUnderlineToken, sy.EtStrikethroughToken, sy.CodeToken}
+    for token in second:
+        assert token is shared[type(token)]
+        assert token is sy.shared_token(type(token))
+        assert pickle.loads(pickle.dumps(token)) is token
+        assert copy.deepcopy(token) is token
+    assert str(shared[sy.EtEmToken]) == "text:em['*']"
+    assert sy.shared_token(sy.Linebreak).content == []
+    assert not sy.TextToken(["text"]).flyweight
+
+
+def test_interned_labels():
+    assert sy.EtEmToken.label is sys.intern("text:" + "em".strip())
+    assert sy.StructuralElementStartToken(["div"]).label is sys.intern("se:start:" + "div".strip())
+
+
+def contains_parse_results(content):
+    if isinstance(content, pyparsing.ParseResults):
+        return True
+    if isinstance(content, sy.SemanticType):
+        return contains_parse_results(content.content)
+    if isinstance(content, (list, tuple)):
+        return any(contains_parse_results(element) for element in content)
+    return False
+
+
+@pytest.mark.parametrize("line", [
+    "# Header *em* #{{class}}",
+    "|1 cell **strong** | cell |{{class}}[var=1, 2]",
+    "#. item [link](http://test.com)",
+    "> quote *em*",
+    "text (#12) span (#12)",
+])
+def test_plain_content(line):
+    tokens = sy.line.parse_string(line).as_list()
+    assert tokens
+    assert not contains_parse_results(tokens)
+
+
+def test_named_fields():
+    link = sy.il_link.parse_string("[text](http://test.com)")[0]
+    assert (link.text, link.url) == ("text", "http://test.com")
+    assert link.content == ["[text](http://test.com)"]
+
+    header = sy.one_header.parse_string("### Title ###")[0]
+    assert (header.level, header.text) == (3, "Title ")
+    display = sy.one_display.parse_string("!! Title !!")[0]
+    assert (display.level, display.text) == (2, "Title ")
+    assert sy.et_custom_span.parse_string("(#12)")[0].span_id == "12"
+
+    alias, image = sy.line_to_replace.parse_string("@[name]{{class}} @{picture}")
+    assert alias.alias_name == "name"
+    assert isinstance(alias.optional, sy.OptionalToken)
+    assert image.image_name == "picture"
+    assert image.optional == ""
+    assert sy.named_result(["list"], "text", "default") == "default"
@@ -0,0 +1,137 @@
+# Testing the treecache module
+import os
+import tempfile
+import threading
+
+import pytest
+
+import bootstraparse
+from bootstraparse.modules import treecache, sitecreator, syntax
+
+_TEMP_DIRECTORY = tempfile.TemporaryDirectory()
+_BASE = os.path.join(_TEMP_DIRECTORY.name, "base")
+_DEST = os.path.join(_TEMP_DIRECTORY.name, "dest")
+_CACHE = os.path.join(_TEMP_DIRECTORY.name, "containers")
+files = {
+    "index.bpr": "::<_menu.bpr>\n# Title\n<<div\n*Some* **text**\ndiv>>\n- one\n- two\n",
+    "other.bpr": "Other __page__\n",
+    "_menu.bpr": "<<div\nMenu\ndiv>>\n",
+    "configs/parser_config.yml": f"parsing:\n  container_cache: '{_CACHE}'\n  prerender_partials: true\n",
+}
+
+
+def write_files(base, site_files):
+    for path, content in site_files.items():
+        os.makedirs(os.path.dirname(os.path.join(base, path)), exist_ok=True)
+        with open(os.path.join(base, path), "w") as f:
+            f.write(content)
+
+
+def read_pages():
+    pages = {}
+    for name in ("index.html", "other.html"):
+        with open(os.path.join(_DEST, name)) as f:
+            pages[name] = f.read()
+    return pages
+
+
+@pytest.fixture(scope="module", autouse=True)
+def site():
+    write_files(_BASE, files)
+
+
+def page_key(env, name="index.bpr"):
+    crawler = sitecreator.create_crawler(_BASE, _DEST, env)
+    pp = crawler.open_page(os.path.join(_BASE, name))
+    text = pp.do_replacements().getvalue()
+    return env.container_cache.key(text, pp), sitecreator.preparse_parse(pp)
+
+
+def test_same_html(monkeypatch):
+    sitecreator.create_website(_BASE, _DEST)
+    first = read_pages()
+    env = sitecreator.create_environment(_BASE, _DEST)
+    cache = env.container_cache
+    monkeypatch.setattr(sitecreator, "create_environment", lambda origin, destination: env)
+    sitecreator.create_website(_BASE, _DEST)
+    assert (cache.hits, cache.misses, cache.stored) == (2, 0, 0)
+    assert read_pages() == first
+    assert "<strong>text</strong>" in first["index.html"]
+    assert repr(cache) == "ContainerCache(2 hits, 0 misses, 0 invalid, 0 stored)"
+
+
+def test_store_and_load():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    cache = treecache.ContainerCache(env, os.path.join(_TEMP_DIRECTORY.name, "store"))
+    env.container_cache = cache
+    key, containers = page_key(env)
+    assert cache.load(key) is None and cache.misses == 1
+    cache.store(key, containers)
+    loaded = cache.load(key)
+    assert [c.export(env.export_mngr) for c in loaded] == [c.export(env.export_mngr) for c in containers]
+    assert loaded is not containers and cache.hits == 1
+    assert os.path.basename(cache.path(key)) == key[2:] + ".bpc"
+
+
+def test_key():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    key, _ = page_key(env)
+    assert key == page_key(env)[0]
+    assert key != page_key(env, "other.bpr")[0]
+    version = bootstraparse.__version__
+    bootstraparse.__version__ = "0.0.0"
+    try:
+        assert key != page_key(env)[0]
+    finally:
+        bootstraparse.__version__ = version
+    assert env.container_cache.context()  # The fragments depend on the configs and templates
+    env.fragment_cache = None
+    assert treecache.ContainerCache(env, _CACHE).context() == ""
+
+
+def test_schema(monkeypatch):
+    original = treecache.schema()
+    assert treecache.schema() == original
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as changed:
+        with open(syntax.__file__) as source:
+            changed.write(source.read() + "\n# A changed token class\n")
+    monkeypatch.setattr(syntax, "__file__", changed.name)
+    try:
+        assert treecache.schema() != original
+    finally:
+        os.remove(changed.name)
+
+
+def test_invalid_entries():
+    env = sitecreator.create_environment(_BASE, _DEST)
+    cache = treecache.ContainerCache(env, os.path.join(_TEMP_DIRECTORY.name, "invalid"))
+    env.container_cache = cache
+    key, containers = page_key(env)
+    cache.store(key, containers)
+    outdated = treecache.ContainerCache(env, cache.folder)
+    outdated.schema = bytes(32)  # Written by other token or container classes
+    assert outdated.load(key) is None and outdated.invalid == 1
+    with open(cache.path(key), "wb") as entry:
+        entry.write(treecache.MAGIC + cache.schema + b"truncated")
+    assert cache.load(key) is None and cache.invalid == 1
+
+
+def test_concurrent_writers(monkeypatch):
+    env = sitecreator.create_environment(_BASE, _DEST)
+    cache = treecache.ContainerCache(env, os.path.join(_TEMP_DIRECTORY.name, "concurrent"))
+    env.container_cache = cache
+    key, containers = page_key(env)
+    writers = [threading.Thread(target=cache.store, args=(key, containers)) for _ in range(8)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert cache.stored == 8 and cache.load(key) is not None
+    assert os.listdir(os.path.dirname(cache.path(key))) == [os.path.basename(cache.path(key))]
+
+    def fail(source, destination):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        cache.store(key, containers)  # The temporary file is removed
+    assert os.listdir(os.path.dirname(cache.path(key))) == [os.path.basename(cache.path(key))]
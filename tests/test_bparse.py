@@ -1,9 +1,74 @@
 # Test the base parser
 
+import pytest
+
 from bootstraparse import __main__
+from bootstraparse.modules import sitecreator
 
 
 def test_to_test():
     args = __main__.parse(["path1", "path2"])
     assert args.origin == "path1"
     assert args.destination == "path2"
+
+
+def test_profile_options():
+    args = __main__.parse(["path1", "path2"])
+    assert args.profile is False
+    assert args.memprofile is False
+    assert args.cprofile is None
+    args = __main__.parse(["path1", "path2", "--profile", "--memprofile", "--cprofile", "run.prof"])
+    assert args.profile is True
+    assert args.memprofile is True
+    assert args.cprofile == "run.prof"
+
+
+def test_shard_options():
+    args = __main__.parse(["path1", "path2"])
+    assert args.shard is None
+    assert args.merge_shards is False
+    args = __main__.parse(["path1", "path2", "--shard", "2/3", "--merge-shards"])
+    assert args.shard == (2, 3)
+    assert args.merge_shards is True
+
+
+def test_shard_option_invalid():
+    with pytest.raises(SystemExit):
+        __main__.parse(["path1", "path2", "--shard", "4/3"])
+
+
+def test_build_command():
+    assert __main__.parse(["./deps", "path2"]).origin == "./deps"  # A site folder named deps
+    assert __main__.parse(["path1", "path2"]).command == "build"
+
+
+def test_deps(tmp_path):
+    base, destination = tmp_path / "base", tmp_path / "dest"
+    (base / "blog").mkdir(parents=True)
+    for path, content in [("index.bpr", "::<_header.bpr>\n"), ("blog/post.bpr", "::<../_header.bpr>\n"),
+                          ("_header.bpr", "::<blog/_links.bpr>\n"), ("blog/_links.bpr", "links\n")]:
+        (base / path).write_text(content)
+    args = __main__.parse(["deps", str(destination), "--shared", "5"])
+    assert args.command == "deps"
+    assert __main__.deps(args) == ["The import index is disabled, set export.import_index in the parser_config of the site."]
+    (base / "configs").mkdir()
+    (base / "configs" / "parser_config.yml").write_text('export:\n  import_index: "_deps.json"\n')
+    args = __main__.parse(["deps", str(destination), "--shared", "5", "--origin", str(base)])
+    assert __main__.deps(args) == [f"No import index at {destination / '_deps.json'}, build the site first."]
+    sitecreator.create_website(str(base), str(destination))
+
+    def deps(*options):
+        return __main__.deps(__main__.parse(["deps", str(destination), "--origin", str(base), *options]))
+
+    by_name = __main__.parse(["deps", str(destination), "--shared", "1", "--index", "_deps.json"])
+    assert deps("--shared", "1") == __main__.deps(by_name)
+
+    assert deps("--shared", "5") == ["     2 _header.bpr", "     2 blog/_links.bpr"]
+    assert deps("--included-by", "_links.bpr") == ["blog/_links.bpr:", "  blog/post.bpr", "  index.bpr"]
+    assert deps("--included-by", "_links.bpr", "--direct") == ["blog/_links.bpr:"]
+    assert deps("--imports", "index.bpr") == ["index.bpr:", "  _header.bpr", "  blog/_links.bpr"]
+    assert deps("--imports", "missing.bpr") == ["missing.bpr is not in the import index."]
+    (base / "index.bpr").write_text("text\n")
+    assert deps("--imports", "index.bpr")[0] == "Warning: 1 files changed since the last build (index.bpr)."
+    with pytest.raises(SystemExit):
+        __main__.parse(["deps", str(destination)])